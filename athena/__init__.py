@@ -4,6 +4,20 @@ __version__ = "0.0.1"
 from .backtesting import *
 from .trading import *
 from .result import *
+from .records import *
 from .data import *
 from .lib import *
-from .broker import *
\ No newline at end of file
+from .broker import *
+from .ledger import *
+from .journal import *
+from .vectorized import *
+from .sweep import *
+from .panel import *
+from .schedule import *
+from .stream import *
+from .cache import *
+from .fetch import *
+from .memmap import *
+from .resample import *
+from .timeframe import *
+from .metrics import *
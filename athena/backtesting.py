@@ -2,16 +2,22 @@ from abc import ABC, abstractmethod
 from datetime import datetime
 from typing import List, Dict, Any, Type, Hashable, Optional
 from decimal import Decimal
+import itertools
 import pandas as pd
 
 from .trading import Position, Trade, PrecisionConfig
 from .result import Result
 from .broker import Broker
+from .ledger import FixedBroker
+from .records import BarRecord, BarRecords
+from .panel import FactorPanel
+from .schedule import Schedule
+from .journal import EventJournal
+from .stream import filter_chunks, with_following
+from .timeframe import TimeframeBars
 
 import logging
-from .log_config import setup_logging
-
-setup_logging()
+from .log_config import setup_logging, journal_path as default_journal_path
 
 class Strategy(ABC):
     """策略基类"""
@@ -22,7 +28,7 @@ class Strategy(ABC):
         pass
 
     @abstractmethod
-    def next(self, i: int, record: Dict[Hashable, Any]):
+    def next(self, i: int, record: BarRecord):
         """策略逻辑部分"""
         pass
 
@@ -31,9 +37,16 @@ class Strategy(ABC):
         self.data = pd.DataFrame()  
         self.date = None
         self.symbols: List[str] = []
-        self.records: List[Dict[Hashable, Any]] = []  
+        self.records: BarRecords = []  
         self.index: List[datetime] = []
         self.benchmark = pd.DataFrame()  
+        self.factors: FactorPanel = None  # 与bar索引和symbols对齐的因子面板
+        self.schedule: Schedule = None  # 调仓日程, 为None时每根bar都调用next
+        self.mark_to_market_mode = 'bar'  # 'bar' 逐bar结算, 'deferred' 没有下单的bar延迟一次性结算
+        self.source = None  # 分段读取的数据块, 为None时使用内存中的data
+        self.factor_source: FactorPanel = None  # 分段回测时未对齐的因子面板, 每块重新对齐
+        self.offset = 0  # 当前数据块第一根bar的序号, next收到的i = offset + 块内序号
+        self.timeframes: Dict[str, TimeframeBars] = {}  # 回测中增量聚合的高级别K线, 在init中用add_timeframe声明
 
     def open(self, price: float, size: Optional[float] = None, 
              symbol: Optional[str] = None, short=False, is_fractional=False):
@@ -50,55 +63,120 @@ class Strategy(ABC):
         '''按目标百分比调仓接口'''
         return self.broker.order_target_percent(symbol, target_percent, price, short)
 
+    def add_timeframe(self, freq: str, agg_funcs: Optional[Dict[str, str]] = None) -> TimeframeBars:
+        '''
+        声明一个高级别周期, 例如在15分钟策略的init中 self.add_timeframe('1h')
+        回测时随基础bar增量聚合, next中用 self.timeframe_bar('1h') 读取最近一根走完的bar
+        '''
+        if freq not in self.timeframes:
+            self.timeframes[freq] = TimeframeBars(freq, agg_funcs)
+        return self.timeframes[freq]
+
+    def timeframe_bar(self, freq: str) -> Optional[BarRecord]:
+        '''最近一根走完的高级别bar, 还没有走完的周期时为None'''
+        return self.timeframes[freq].record
+
     def __eval(self, *args, **kwargs):
         '''策略评估方法'''
         self.cumulative_return = self.broker.cash
         self.assets_value = PrecisionConfig.round_value(Decimal('0'))
 
+        # 数据块, 内存中的数据视为只有一块
+        streaming = self.source is not None
+        chunks = with_following(self.source) if streaming else iter([(self.data, None)] if len(self.data) else [])
+        first = next(chunks, None)
+        if first is None:
+            raise ValueError("没有可回测的数据")
+        if streaming:
+            self._load_chunk(first[0], 0)
+
         # 初始化策略
         self.init(*args, **kwargs)
 
-        # 遍历历史数据
-        for i, record in enumerate(self.records):
-            self.date = self.index[i]
-            self.broker.date = self.index[i]
-
-            logging.info(f"时间: {self.date}")
-            logging.info(f"可用资金: {self.broker.cash:.2f}")
-            logging.info(f"持仓价值: {self.broker.assets_value:.2f}")
-            logging.info("\n")
-
-            # 执行策略逻辑
-            self.next(i, record)
-
-            # 更新持仓状态
-            for position in self.broker.open_positions:
-                last_price = record.get(
-                    (position.symbol, 'Close'),
-                    record.get('Close', 0)
-                )
-                if last_price > 0:
-                    position.update(last_date=self.date, last_price=last_price)
-
-            # 合并同向持仓
-            self.merge_positions()
-
-            # 更新资产价值
-            self.broker.assets_value = PrecisionConfig.round_value(
-                sum((Decimal(str(position.current_value)) 
-                     for position in self.broker.open_positions), 
-                    Decimal('0'))
-            )
-            self.broker.returns.append(float(self.broker.cash + self.broker.assets_value))
+        log_text = self.broker.log_text
+        journal = self.broker.journal
+        deferred = self.mark_to_market_mode == 'deferred'
+        timeframes = list(self.timeframes.values())
+
+        offset = 0  # 当前块第一根bar在整个回测中的序号
+        previous = None  # 上一块最后一根bar的时间
+        dates = []
+
+        for data, following in itertools.chain([first], chunks):
+            if offset > 0:
+                self._load_chunk(data, offset)
+            if journal is not None:
+                journal.add_dates(data.index)
+            records, index = self.records, self.index
+            for timeframe in timeframes:
+                timeframe.start_chunk(data.index, records.values, records.columns, following)
+
+            # 需要调用next的bar(块内序号), 没有调仓日程时为每一根bar
+            bars = (range(len(records)) if self.schedule is None else
+                    self.schedule.resolve(index, start=offset, previous=previous, following=following))
+            settled = 0  # 已经结算到的bar
+
+            # 遍历历史数据
+            for j in bars:
+                if j > settled:
+                    # 两次调仓之间没有成交, 一次性结算这些bar
+                    self.broker.defer_mark_to_market(index, records, settled, j)
+                    if not deferred:
+                        self.broker.settle()
+
+                i = offset + j
+                record = records[j]
+                for timeframe in timeframes:
+                    timeframe.seek(j + 1)
+                self.date = index[j]
+                self.broker.date = index[j]
+                self.broker.bar = i
+
+                if log_text:
+                    logging.info(f"时间: {self.date}")
+                    logging.info(f"可用资金: {self.broker.cash:.2f}")
+                    logging.info(f"持仓价值: {self.broker.assets_value:.2f}")
+                    logging.info("\n")
+                if journal is not None:
+                    journal.record_bar(i, float(self.broker.cash), float(self.broker.assets_value))
+
+                # 执行策略逻辑
+                self.broker.traded = False
+                self.next(i, record)
+
+                if deferred and not self.broker.traded:
+                    # 这根bar没有下单, 留到下一次下单前和后面的bar一起结算
+                    self.broker.defer_mark_to_market(index, records, j, j + 1)
+                    settled = j + 1
+                    continue
+
+                # 更新持仓状态、资产价值和多空收益
+                self.broker.mark_to_market(self.date, record)
+
+                if log_text:
+                    logging.info("持仓：")
+                    for position in self.broker.open_positions:
+                        logging.info(position)
+                    logging.info("-----------------------\n")
+                if journal is not None:
+                    journal.record_equity(
+                        i, self.broker.returns[-1],
+                        self.broker.long_returns[-1], self.broker.short_returns[-1]
+                    )
+                settled = j + 1
+
+            if settled < len(records):
+                self.broker.defer_mark_to_market(index, records, settled, len(records))
+                self.date = self.broker.date = index[-1]
+            for timeframe in timeframes:
+                timeframe.finish_chunk()
+            # 待结算的bar引用当前块的价格, 换块前必须结算
+            self.broker.settle()
+
+            dates.append(data.index)
+            previous = index[-1]
+            offset += len(records)
 
-            # 更新多空收益
-            self.broker.update_seperate_long_short_returns()
-
-            logging.info("持仓：")
-            for position in self.broker.open_positions:
-                logging.info(position)
-            logging.info("-----------------------\n")
-        
         # 回测结束处理
         self.close_all_positions()
 
@@ -106,21 +184,23 @@ class Strategy(ABC):
             self.broker.cash + Decimal(str(self.broker.assets_value))
         )
         print(f"回测结束，总资金: {final_total_value:.2f}")
-        logging.info(f"回测结束，总资金: {final_total_value:.2f}")
+        if log_text:
+            logging.info(f"回测结束，总资金: {final_total_value:.2f}")
 
         # 计算回测结果
+        index = dates[0].append(dates[1:]).rename(None).tolist() if streaming else self.index
         returns_series = pd.Series(
-            index=self.index, 
+            index=index, 
             data=self.broker.returns, 
             dtype=float
         )
         long_returns_series = pd.Series(
-            index=self.index, 
+            index=index, 
             data=self.broker.long_returns, 
             dtype=float
         )
         short_returns_series = pd.Series(
-            index=self.index, 
+            index=index, 
             data=self.broker.short_returns, 
             dtype=float
         )
@@ -138,9 +218,21 @@ class Strategy(ABC):
             benchmark=self.benchmark
         )
     
+    def _load_chunk(self, data: pd.DataFrame, offset: int):
+        '''切换到新的数据块, data/records/index 只保存当前块'''
+        columns = data.columns
+        self.data = data
+        self.symbols = (columns.get_level_values(0).unique().tolist()
+                        if isinstance(columns, pd.MultiIndex) else [])
+        self.records = BarRecords(data)
+        self.index = data.index.tolist()
+        self.offset = offset
+        if self.factor_source is not None:
+            self.factors = self.factor_source.align(data.index, self.symbols)
+
     def close_all_positions(self):
         """清算所有未平仓持仓"""
-        for position in self.broker.open_positions[:]:
+        for position in self.broker.open_positions:
             last_price = self.records[-1].get(
                 (position.symbol, 'Close'),
                 self.records[-1].get('Close', 0)
@@ -160,66 +252,7 @@ class Strategy(ABC):
     
     def merge_positions(self):
         '''合并同向持仓'''
-        merged_positions = []
-        merged_map = {}
-
-        for position in self.broker.open_positions:
-            key = (position.symbol, position.is_short)
-            if key not in merged_map:
-                merged_map[key] = {
-                    "symbol": position.symbol,
-                    "open_date": position.open_date,
-                    "last_date": position.last_date,
-                    "is_short": position.is_short,
-                    "last_price": position.last_price,
-                    "position_size": Decimal('0'),
-                    "current_value": Decimal('0'),
-                    "weighted_open_price": Decimal('0'),
-                    "open_commission": Decimal('0'),
-                }
-
-            merged_entry = merged_map[key]
-            total_size = PrecisionConfig.round_size(
-                merged_entry["position_size"] + Decimal(str(position.position_size))
-            )
-
-            if total_size > 0:
-                merged_entry["weighted_open_price"] = PrecisionConfig.round_price(
-                    (merged_entry["position_size"] * merged_entry["weighted_open_price"] +
-                     Decimal(str(position.position_size)) * Decimal(str(position.open_price)))
-                    / total_size
-                )
-            else:
-                merged_entry["weighted_open_price"] = position.open_price
-
-            merged_entry["position_size"] = total_size
-            merged_entry["current_value"] = PrecisionConfig.round_value(
-                merged_entry["current_value"] + Decimal(str(position.current_value))
-            )
-            merged_entry["open_commission"] = PrecisionConfig.round_commission(
-                merged_entry["open_commission"] + Decimal(str(position.open_commission))
-            )
-
-            merged_entry["last_date"] = max(merged_entry["last_date"], position.last_date)
-            merged_entry["last_price"] = position.last_price
-
-        # 创建合并后的Position对象
-        for key, merged_entry in merged_map.items():
-            new_position = Position(
-                symbol=merged_entry["symbol"],
-                open_date=merged_entry["open_date"],
-                open_price=float(merged_entry["weighted_open_price"]),
-                position_size=float(merged_entry["position_size"]),
-                is_short=merged_entry["is_short"]
-            )
-            new_position.open_commission = float(merged_entry["open_commission"])
-            new_position.update(
-                last_date=merged_entry["last_date"],
-                last_price=float(merged_entry["last_price"])
-            )
-            merged_positions.append(new_position)
-
-        self.broker.open_positions = merged_positions
+        self.broker.merge_positions()
 
 
 class Backtest:
@@ -227,15 +260,55 @@ class Backtest:
     def __init__(
         self,
         strategy: Type[Strategy],
-        data: pd.DataFrame,
+        data: pd.DataFrame, # 价格数据, 也可以是按时间顺序的DataFrame块的迭代器(分段读取, 内存只保留当前块)
         cash: float = 10_000,
         commission: float = .0,
         benchmark: pd.DataFrame = None, # 这里传入的benchmark得是net value
         start_date: str = None,
-        end_date: str = None
+        end_date: str = None,
+        ledger: str = 'decimal', # 记账方式: 'decimal' 或 'fixed'(定点整数记账,速度更快)
+        verbosity: str = 'text', # 日志方式: 'text' 文本日志, 'journal' 结构化事件日志, 'off' 不记录
+        journal_path: str = None, # 事件日志路径, 默认读取环境变量 journal_path, 未配置时放在文本日志旁边(athena/log)
+        factors = None, # 因子数据(FactorPanel或(symbol, factor)列的DataFrame), 会对齐到bar索引和symbols
+        schedule: Schedule = None, # 调仓日程(month_end(), week_start(), every_n_bars(n), on_dates(...)), 只在这些bar上调用next
+        mark_to_market: str = 'bar' # 结算方式: 'bar' 逐bar结算, 'deferred' 没有下单的bar延迟到下一次下单前按价格矩阵一次性结算
     ):
         self.strategy = strategy
 
+        if ledger not in ('decimal', 'fixed'):
+            raise ValueError("ledger 只支持 'decimal' 或 'fixed'")
+        self.ledger = ledger
+
+        if verbosity not in ('text', 'journal', 'off'):
+            raise ValueError("verbosity 只支持 'text', 'journal' 或 'off'")
+        self.verbosity = verbosity
+
+        if mark_to_market not in ('bar', 'deferred'):
+            raise ValueError("mark_to_market 只支持 'bar' 或 'deferred'")
+        self.mark_to_market = mark_to_market
+        self.journal_path = journal_path or default_journal_path
+
+        self.cash = PrecisionConfig.round_value(Decimal(str(cash)))
+        self.commission = PrecisionConfig.round_commission(Decimal(str(commission)))
+        self.schedule = schedule
+
+        if not isinstance(data, pd.DataFrame):
+            # 分段读取: data 为按时间顺序的DataFrame块(列表或迭代器), 回测时逐块读取
+            # 生成器等迭代器只能读取一次, 只能运行一次回测
+            self.source = data
+            self.source_range = (start_date, end_date)
+            self._source_consumed = False
+            self.data = None
+            self.symbols = []
+            self.records = None
+            self.index = []
+            if benchmark is not None and (start_date or end_date):
+                benchmark = benchmark.loc[pd.to_datetime(start_date) if start_date else None:
+                                          pd.to_datetime(end_date) if end_date else None]
+            self.benchmark = benchmark
+            self.factors = FactorPanel.from_frame(factors) if isinstance(factors, pd.DataFrame) else factors
+            return
+
         # 日期筛选
         if start_date or end_date:
             start_date = pd.to_datetime(start_date) if start_date else data.index[0]
@@ -244,17 +317,31 @@ class Backtest:
             if benchmark is not None:
                 benchmark = benchmark.loc[start_date:end_date]
 
+        self.source = None
         self.data = data
-        self.cash = PrecisionConfig.round_value(Decimal(str(cash)))
-        self.commission = PrecisionConfig.round_commission(Decimal(str(commission)))
         self.benchmark = benchmark
 
         columns = data.columns
         self.symbols = (columns.get_level_values(0).unique().tolist() 
                        if isinstance(columns, pd.MultiIndex) else [])
-        self.records = data.to_dict('records')
+        self.records = BarRecords(data)
         self.index = data.index.tolist()
 
+        if isinstance(factors, pd.DataFrame):
+            factors = FactorPanel.from_frame(factors, index=data.index, symbols=self.symbols)
+        elif factors is not None:
+            factors = factors.align(data.index, self.symbols)
+        self.factors = factors
+
+    def _stream(self):
+        '''本次回测读取的数据块, 迭代器(如生成器)第二次运行时报错, 不会静默地得到空的回测'''
+        if iter(self.source) is self.source:
+            if self._source_consumed:
+                raise ValueError("分段数据是只能读取一次的迭代器(如生成器), 需要多次运行回测时请传入数据块的列表或重新创建迭代器")
+            self._source_consumed = True
+        start_date, end_date = self.source_range
+        return filter_chunks(self.source, start_date, end_date) if (start_date or end_date) else self.source
+
     def run(self, *args, **kwargs):
         '''运行回测'''
         strategy = self.strategy()
@@ -264,6 +351,26 @@ class Backtest:
         strategy.records = self.records
         strategy.index = self.index
         strategy.benchmark = self.benchmark
-        strategy.broker = Broker(cash=float(self.cash), commission=float(self.commission))
-
-        return strategy._Strategy__eval(*args, **kwargs)
\ No newline at end of file
+        if self.source is None:
+            strategy.factors = self.factors
+        else:
+            strategy.source = self._stream()
+            strategy.factor_source = self.factors
+        strategy.schedule = self.schedule
+        strategy.mark_to_market_mode = self.mark_to_market
+        broker_cls = FixedBroker if self.ledger == 'fixed' else Broker
+        strategy.broker = broker_cls(cash=float(self.cash), commission=float(self.commission))
+        strategy.broker.log_text = self.verbosity == 'text'
+        if strategy.broker.log_text:
+            # 文本日志在第一次需要时才配置, 导入athena时不再修改全局logging
+            setup_logging()
+
+        if self.verbosity != 'journal':
+            return strategy._Strategy__eval(*args, **kwargs)
+
+        journal = EventJournal(self.journal_path)
+        strategy.broker.journal = journal
+        try:
+            return strategy._Strategy__eval(*args, **kwargs)
+        finally:
+            journal.close()
\ No newline at end of file
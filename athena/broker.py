@@ -1,14 +1,96 @@
 from datetime import datetime
-from typing import List, Dict, Any, Type, Hashable, Optional
+from typing import List, Dict, Any, Type, Hashable, Optional, Tuple
 from math import nan, isnan
 from decimal import Decimal, getcontext, ROUND_DOWN
+from bisect import bisect_right, insort
 
 getcontext().rounding = ROUND_DOWN
 
+import numpy as np
 import pandas as pd
 import logging
 from .log_config import setup_logging
 from .trading import Position, Trade, PrecisionConfig
+from .journal import EventJournal
+
+class RealizedPnL:
+    '''
+    单边(多头或空头)已平仓收益的累加器, 数值为按金额精度缩放后的整数
+    原来的统计方式是每个bar从未平仓收益出发, 按交易顺序逐笔执行
+    profit = round_value(profit + profit_loss - trade_commission)
+    手续费精度高于金额精度, 每一步向零截断的方向取决于当时累计值的正负,
+    所以结果依赖于起始的未平仓收益, 不能只保存一个总数
+    这里把每一笔手续费尾数带来的1分钱差异记录成一个阈值: 起始值低于阈值时该笔多保留1分钱
+    这样每个bar只需要一次二分查找就能得到与逐笔累加完全一致的结果
+    '''
+    def __init__(self, value_precision: int, commission_precision: int):
+        if commission_precision >= value_precision:
+            self._commission_unit = 10 ** (commission_precision - value_precision)
+            self._commission_scale = 1
+        else:
+            self._commission_unit = 1
+            self._commission_scale = 10 ** (value_precision - commission_precision)
+        self.total = 0
+        self.thresholds: List[int] = []
+
+    def add(self, profit_loss: int, trade_commission: int):
+        '''记录一笔平仓收益(扣除手续费)'''
+        q, r = divmod(trade_commission * self._commission_scale, self._commission_unit)
+        if r == 0:
+            self.total += profit_loss - q
+            return
+
+        # 累计值 v 满足 v + profit_loss >= q + 1 时向下截断, 否则多保留1分钱
+        # 找到最小的起始值使得这一步之前的累计值达到 q + 1 - profit_loss
+        target = q + 1 - profit_loss - self.total
+        thresholds = self.thresholds
+        n = len(thresholds)
+        lo, hi = target - n, target
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if mid + n - bisect_right(thresholds, mid) >= target:
+                hi = mid
+            else:
+                lo = mid + 1
+        insort(thresholds, lo)
+        self.total += profit_loss - q - 1
+
+    def value(self, unrealized: int) -> int:
+        '''以未平仓收益为起点, 加上所有已平仓收益'''
+        thresholds = self.thresholds
+        return unrealized + self.total + len(thresholds) - bisect_right(thresholds, unrealized)
+
+    def values(self, unrealized: np.ndarray) -> np.ndarray:
+        '''value 的向量版本, 对一组未平仓收益同时计算'''
+        thresholds = np.asarray(self.thresholds, dtype=np.int64)
+        return (unrealized + (self.total + len(thresholds))
+                - np.searchsorted(thresholds, unrealized, side='right'))
+
+
+# 超过这个范围后 float 无法精确区分精度内的相邻刻度,退回到 Decimal 转换
+_EXACT_LIMIT = 2 ** 52
+
+def _prices_to_fixed(prices: np.ndarray, precision: int) -> np.ndarray:
+    '''
+    把价格矩阵转换成按 10**precision 缩放的整数矩阵
+    与 PrecisionConfig.round_price(Decimal(str(price))) 的结果一致, 非正数和NaN记为0
+    '''
+    scale = 10 ** precision
+    valid = prices > 0
+    scaled = np.where(valid, prices, 0.0) * scale
+    fixed = np.rint(scaled)
+    # fixed / scale 能还原出价格, 说明价格的十进制表示没有超出精度
+    exact = (fixed < _EXACT_LIMIT) & (fixed / scale == np.where(valid, prices, 0.0))
+    result = fixed.astype(np.int64)
+    for i, j in zip(*np.nonzero(valid & ~exact)):
+        result[i, j] = int(PrecisionConfig.round_price(Decimal(str(prices[i, j]))).scaleb(precision))
+    return result
+
+def _tdiv_array(values: np.ndarray, divisor: int) -> np.ndarray:
+    '''向零截断的整数除法(对应ROUND_DOWN), 用于Python整数的object数组'''
+    quotient = np.abs(values) // divisor
+    return np.where(values < 0, -quotient, quotient)
+
 
 class Broker:
     '''
@@ -21,7 +103,23 @@ class Broker:
         self.commission = PrecisionConfig.round_commission(Decimal(str(commission)))
         self.date = None
 
-        self.open_positions = []
+        # 日志: log_text 控制是否逐条写文本日志, journal 为结构化事件日志(可选)
+        self.log_text = True
+        self.journal: Optional[EventJournal] = None
+        self.bar: Optional[int] = None
+
+        # 持仓按开仓顺序保存在 槽位 -> Position 的有序字典中, 平仓时按槽位O(1)删除
+        self._positions: Dict[int, Position] = {}
+        self._slots: Dict[int, int] = {}  # id(Position) -> 槽位
+        self._next_slot = 0
+        # 净持仓簿: (symbol, is_short) -> Position, 开平仓成交时更新
+        # 同一根bar内同标的同方向的多次开仓先各自记账, bar结束时再合并成一个仓位
+        self.position_book: Dict[Tuple[str, bool], Position] = {}
+        self._unmerged: Dict[Tuple[str, bool], None] = {}  # 本bar内有多个仓位、待合并的 (symbol, is_short)
+        # 按标的索引的持仓(按开仓顺序), 以及多/空头各自的 symbol -> Position
+        self.symbol_index: Dict[str, List[Position]] = {}
+        self.long_positions: Dict[str, Position] = {}
+        self.short_positions: Dict[str, Position] = {}
         self.trades = []
         self.assets_value = PrecisionConfig.round_value(Decimal('0'))
         self.cumulative_return = self.cash
@@ -31,14 +129,45 @@ class Broker:
         self.long_returns = []
         self.short_returns = []
 
+        # 延迟结算: 没有成交的bar先记下, 在下一次下单前或回测结束时一次性结算
+        self.traded = False
+        self._pending: Optional[list] = None  # [index, records, start, stop]
+
+        # 多/空头已平仓收益的累加器(按金额精度缩放的整数)
+        self._value_scale = 10 ** PrecisionConfig.VALUE_PRECISION
+        self.realized_pnl = {
+            False: RealizedPnL(PrecisionConfig.VALUE_PRECISION, PrecisionConfig.COMMISSION_PRECISION),
+            True: RealizedPnL(PrecisionConfig.VALUE_PRECISION, PrecisionConfig.COMMISSION_PRECISION),
+        }
+
+    @property
+    def open_positions(self) -> List[Position]:
+        '''按开仓顺序排列的全部持仓(快照, 增减持仓请用open/close)'''
+        return list(self._positions.values())
+
+    @open_positions.setter
+    def open_positions(self, positions: List[Position]):
+        '''替换全部持仓, 并按新的持仓重建持仓簿和索引'''
+        self._positions = {}
+        self._slots = {}
+        self.position_book = {}
+        self.symbol_index = {}
+        self.long_positions = {}
+        self.short_positions = {}
+        self._unmerged = {}
+        for position in positions:
+            self._add_position(position)
+
     def open(self, price: float, size: Optional[float] = None, symbol: Optional[str] = None, 
             short=False, is_fractional=False):
         '''开仓方法'''
+        self._begin_trade()
         price = PrecisionConfig.round_price(Decimal(str(price)))
         
         if isnan(float(price)) or price <= 0 or (size is not None and (isnan(size) or size <= .0)):
             print("参数错误，请检查价格和仓位大小是否正确")
-            logging.info("参数错误，请检查价格和仓位大小是否正确")
+            if self.log_text:
+                logging.info("参数错误，请检查价格和仓位大小是否正确")
             return False
 
         # 计算开仓数量
@@ -62,8 +191,9 @@ class Broker:
         if isnan(float(size)) or size <= 0 or (self.cash + TOLERANCE) < open_cost:
             print(f"开仓失败，可用资金不足或仓位大小无效")
             print(f"可用资金: {self.cash:.2f}, 开仓成本: {open_cost:.2f}")
-            logging.info("开仓失败，可用资金不足或仓位大小无效")
-            logging.info(f"可用资金: {self.cash:.2f}, 开仓成本: {open_cost:.2f}")
+            if self.log_text:
+                logging.info("开仓失败，可用资金不足或仓位大小无效")
+                logging.info(f"可用资金: {self.cash:.2f}, 开仓成本: {open_cost:.2f}")
             return False
 
         # 建立仓位
@@ -82,14 +212,18 @@ class Broker:
         self.assets_value = PrecisionConfig.round_value(
             self.assets_value + Decimal(str(position.current_value))
         )
-        self.open_positions.extend([position])
+        self._add_position(position)
 
-        logging.info(f"开仓: {position}")
+        if self.log_text:
+            logging.info(f"开仓: {position}")
+        if self.journal is not None:
+            self._journal_open(position)
         return True
 
     def close(self, price: float, symbol: Optional[str] = None, 
              position: Optional[Position] = None, size: Optional[float] = None):
         '''关仓方法'''
+        self._begin_trade()
         price = PrecisionConfig.round_price(Decimal(str(price)))
         if size is not None:
             size = PrecisionConfig.round_size(Decimal(str(size)))
@@ -98,12 +232,14 @@ class Broker:
             return False
 
         if position is None:
-            for pos in self.open_positions[:]:
-                if pos.symbol == symbol:
-                    if size is not None:
-                        self.close(price=price, position=pos, size=size)
-                    else:
-                        self.close(price=price, position=pos)
+            # 全部平仓会把仓位从列表中原地删除, 按下标遍历, 不复制列表
+            positions = self.symbol_index.get(symbol, [])
+            k = 0
+            while k < len(positions):
+                pos = positions[k]
+                self.close(price=price, position=pos, size=size)
+                if k < len(positions) and positions[k] is pos:
+                    k += 1
         else:
             if size is None or size >= position.position_size:
                 # 全部平仓
@@ -124,6 +260,7 @@ class Broker:
                     position.change_pct, float(trade_commission), float(self.cumulative_return)
                 )
                 self.trades.extend([trade])
+                self._record_realized(trade)
 
                 # 更新账户状态
                 self.assets_value = PrecisionConfig.round_value(
@@ -132,9 +269,12 @@ class Broker:
                 self.cash = PrecisionConfig.round_value(
                     self.cash + position.current_value - trade_commission
                 )
-                self.open_positions.remove(position)
+                self._remove_position(position)
 
-                logging.info(f"清仓: {trade}")
+                if self.log_text:
+                    logging.info(f"清仓: {trade}")
+                if self.journal is not None:
+                    self._journal_trade(trade)
             else:
                 # 部分平仓
                 position.update(last_date=self.date, last_price=float(price))
@@ -171,6 +311,7 @@ class Broker:
                     float(trade_commission), float(self.cumulative_return)
                 )
                 self.trades.extend([trade])
+                self._record_realized(trade)
 
                 # 更新账户状态
                 self.assets_value = PrecisionConfig.round_value(
@@ -180,12 +321,16 @@ class Broker:
                     self.cash + closed_value - trade_commission
                 )
 
-                logging.info(f"部分清仓: {trade}")
+                if self.log_text:
+                    logging.info(f"部分清仓: {trade}")
+                if self.journal is not None:
+                    self._journal_trade(trade, partial=True)
 
         return True
 
     def order_target_percent(self, symbol: str, target_percent: float, price: float, short=False):
         '''按目标百分比调整仓位'''
+        self._begin_trade()
         price = PrecisionConfig.round_price(Decimal(str(price)))
         
         if isnan(float(price)) or price <= 0 or isnan(target_percent) or target_percent < 0 or target_percent > 1:
@@ -202,22 +347,21 @@ class Broker:
         )
 
         # 查找现有仓位
-        existing_position = None
-        for position in self.open_positions:
-            if position.symbol == symbol:
-                existing_position = position
-                break
+        existing_positions = self.symbol_index.get(symbol)
+        existing_position = existing_positions[0] if existing_positions else None
 
         # 处理目标仓位为0的情况
         if target_percent == 0:
             if existing_position:
-                logging.info("调仓比例为0, 直接关闭仓位")
+                if self.log_text:
+                    logging.info("调仓比例为0, 直接关闭仓位")
                 return self.close(price=float(price), position=existing_position)
             return True
 
         # 处理新开仓的情况
         if existing_position is None:
-            logging.info("没有持仓,直接开仓")
+            if self.log_text:
+                logging.info("没有持仓,直接开仓")
             size = PrecisionConfig.round_size(
                 target_value / (price * (Decimal(1) + self.commission))
             )
@@ -234,72 +378,310 @@ class Broker:
             size = PrecisionConfig.round_size(
                 additional_value / (price * (Decimal(1) + self.commission))
             )
-            logging.info("增加仓位")
+            if self.log_text:
+                logging.info("增加仓位")
             return self.open(price=float(price), size=float(size), symbol=symbol, short=short)
         else:
             # 减少仓位
             reduce_value = current_value - target_value
             size_to_reduce = PrecisionConfig.round_size(reduce_value / price)
             if existing_position.position_size > size_to_reduce:
-                logging.info("减少仓位")
+                if self.log_text:
+                    logging.info("减少仓位")
                 return self.close(
                     price=float(price),
                     position=existing_position,
                     size=float(size_to_reduce)
                 )
             else:
-                logging.info("要减少的仓位大于现有仓位,直接关闭仓位")
+                if self.log_text:
+                    logging.info("要减少的仓位大于现有仓位,直接关闭仓位")
                 return self.close(price=float(price), position=existing_position)
 
-    def update_seperate_long_short_returns(self):
-        '''更新多空头收益'''
-        long_profit = Decimal('0')
-        short_profit = Decimal('0')
+    def _journal_open(self, position: Position):
+        '''把开仓成交写入事件日志'''
+        self.journal.record_open(
+            self.bar, position.symbol, position.is_short,
+            float(position.open_price), float(position.position_size),
+            float(position.current_value), float(position.open_commission), float(self.cash)
+        )
 
-        # 计算未平仓收益
-        for position in self.open_positions:
-            if position.is_short:
-                short_profit = PrecisionConfig.round_value(
-                    short_profit + position.profit_loss
+    def _journal_trade(self, trade: Trade, partial: bool = False):
+        '''把平仓成交写入事件日志'''
+        self.journal.record_close(
+            self.bar, trade.symbol, trade.short,
+            float(trade.close_price), float(trade.position_size),
+            float(trade.profit_loss), float(trade.trade_commission), float(self.cash),
+            partial=partial
+        )
+
+    def update_positions(self, date: datetime, record):
+        '''按当前bar的收盘价更新所有持仓'''
+        for position in self._positions.values():
+            last_price = record.get(
+                (position.symbol, 'Close'),
+                record.get('Close', 0)
+            )
+            if last_price > 0:
+                position.update(last_date=date, last_price=last_price)
+
+    def mark_to_market(self, date: datetime, record):
+        '''bar结束时按收盘价更新持仓, 合并同向持仓, 记录总资产和多空收益'''
+        self.update_positions(date, record)
+        self.merge_positions()
+        self.update_assets_value()
+        self.returns.append(self.total_value())
+        self.update_seperate_long_short_returns()
+
+    def mark_to_market_bars(self, index: List[datetime], records, start: int, stop: int):
+        '''
+        [start, stop) 区间内的bar没有成交时, 按价格矩阵一次性结算这些bar的持仓价值, 总资产和多空收益
+        按定点整数计算并截断, 结果与逐bar调用mark_to_market一致
+        结束时持仓更新到区间内最后一个有效价格
+        '''
+        n = stop - start
+        if n <= 0:
+            return
+
+        positions = self.open_positions
+        if positions:
+            last_bar, last_price, profit_loss, current_value = self._segment_valuation(records, start, stop)
+            assets = current_value.sum(axis=1)
+            is_short = np.array([position.is_short for position in positions])
+            in_book = np.array([
+                self.position_book.get((position.symbol, position.is_short)) is position
+                for position in positions
+            ])
+            long_unrealized = profit_loss[:, in_book & ~is_short].sum(axis=1)
+            short_unrealized = profit_loss[:, in_book & is_short].sum(axis=1)
+
+            # 持仓更新到区间内最后一个有效价格
+            for k, position in enumerate(positions):
+                if last_bar[k] >= 0:
+                    self._update_position(position, index[start + last_bar[k]], last_price[k])
+            self.update_assets_value()
+        else:
+            assets = long_unrealized = short_unrealized = np.zeros(n, dtype=np.int64)
+
+        cash = int(self.cash.scaleb(PrecisionConfig.VALUE_PRECISION))
+        scale = self._value_scale
+        self.returns.extend(((cash + assets) / scale).tolist())
+        self.long_returns.extend((self.realized_pnl[False].values(long_unrealized) / scale).tolist())
+        self.short_returns.extend((self.realized_pnl[True].values(short_unrealized) / scale).tolist())
+
+    def defer_mark_to_market(self, index: List[datetime], records, start: int, stop: int):
+        '''记下 [start, stop) 区间的bar待结算, 与之前待结算的bar连成一个区间'''
+        if self._pending is None:
+            self._pending = [index, records, start, stop]
+        else:
+            self._pending[3] = stop
+
+    def settle(self):
+        '''一次性结算所有待结算的bar'''
+        if self._pending is not None:
+            index, records, start, stop = self._pending
+            self._pending = None
+            self.mark_to_market_bars(index, records, start, stop)
+
+    def _begin_trade(self):
+        '''下单前先结算之前延迟的bar, 保证按最新的持仓价值计算'''
+        self.traded = True
+        if self._pending is not None:
+            self.settle()
+
+    def _segment_valuation(self, records, start: int, stop: int):
+        '''
+        计算区间内每根bar每个持仓的未平仓收益和持仓价值(按金额精度缩放的整数矩阵)
+        同update_positions: 优先取 (symbol, 'Close'), 其次 'Close', 价格无效时沿用上一个价格
+        '''
+        pp, sp, vp = (PrecisionConfig.PRICE_PRECISION, PrecisionConfig.SIZE_PRECISION,
+                      PrecisionConfig.VALUE_PRECISION)
+        positions = self.open_positions
+        n, m = stop - start, len(positions)
+        columns = records.columns
+
+        prices = np.zeros((n, m))
+        for k, position in enumerate(positions):
+            j = columns.get((position.symbol, 'Close'), columns.get('Close'))
+            if j is not None:
+                prices[:, k] = records.values[start:stop, j]
+        with np.errstate(invalid='ignore'):
+            valid = prices > 0
+        prices_fp = _prices_to_fixed(prices, pp)
+
+        # 价格无效的bar沿用之前的价格(区间开始前为持仓当前的价格)
+        rows = np.where(valid, np.arange(n)[:, None], -1)
+        rows = np.maximum.accumulate(rows, axis=0)
+        carried = np.array([int(position.last_price.scaleb(pp)) for position in positions], dtype=np.int64)
+        last_fp = np.where(rows >= 0, prices_fp[np.maximum(rows, 0), np.arange(m)], carried)
+
+        open_fp = np.array([int(position.open_price.scaleb(pp)) for position in positions], dtype=np.int64)
+        size_fp = np.array([int(position.position_size.scaleb(sp)) for position in positions], dtype=object)
+        sign = np.array([-1 if position.is_short else 1 for position in positions], dtype=np.int64)
+
+        # 乘积会超出int64, 用Python整数精确计算后截断
+        divisor = 10 ** (pp + sp - vp)
+        diff = ((last_fp - open_fp) * sign).astype(object)
+        profit_loss = _tdiv_array(diff * size_fp, divisor)
+        current_value = _tdiv_array(open_fp.astype(object) * size_fp + profit_loss * divisor, divisor)
+
+        last_bar = rows[-1]
+        last_price = prices[np.maximum(last_bar, 0), np.arange(m)]
+        return last_bar, last_price, profit_loss.astype(np.int64), current_value.astype(np.int64)
+
+    def _update_position(self, position: Position, date: datetime, last_price: float):
+        '''按最新价格更新单个持仓'''
+        position.update(last_date=date, last_price=last_price)
+
+    def _add_position(self, position: Position):
+        '''把新成交的仓位记入持仓簿, 同标的同方向已有仓位时记下待合并, 在bar结束时合并'''
+        key = (position.symbol, position.is_short)
+        self._slots[id(position)] = self._next_slot
+        self._positions[self._next_slot] = position
+        self._next_slot += 1
+        self.symbol_index.setdefault(position.symbol, []).append(position)
+        if key in self.position_book:
+            self._unmerged[key] = None
+        else:
+            self.position_book[key] = position
+            side = self.short_positions if position.is_short else self.long_positions
+            side[position.symbol] = position
+
+    def _remove_position(self, position: Position):
+        '''从持仓簿中移除已经全部平仓的仓位, 同方向还有未合并的仓位时由它接替'''
+        del self._positions[self._slots.pop(id(position))]
+        positions = self.symbol_index[position.symbol]
+        for k, other in enumerate(positions):
+            if other is position:
+                del positions[k]
+                break
+        if not positions:
+            del self.symbol_index[position.symbol]
+
+        key = (position.symbol, position.is_short)
+        if self.position_book.get(key) is not position:
+            return
+        side = self.short_positions if position.is_short else self.long_positions
+        for other in positions:
+            if other.is_short == position.is_short:
+                self.position_book[key] = side[position.symbol] = other
+                return
+        del self.position_book[key]
+        del side[position.symbol]
+
+    def _merge_group(self, positions: List[Position]) -> Position:
+        '''按开仓顺序合并同向仓位: 按数量加权开仓价, 累加开仓手续费, 价格取最后一个仓位的'''
+        total_size = Decimal('0')
+        weighted_open_price = Decimal('0')
+        open_commission = Decimal('0')
+        for position in positions:
+            position_size = Decimal(str(position.position_size))
+            size = PrecisionConfig.round_size(total_size + position_size)
+            if size > 0:
+                weighted_open_price = PrecisionConfig.round_price(
+                    (total_size * weighted_open_price + position_size * Decimal(str(position.open_price)))
+                    / size
                 )
             else:
-                long_profit = PrecisionConfig.round_value(
-                    long_profit + position.profit_loss
-                )
+                weighted_open_price = position.open_price
+            total_size = size
+            open_commission = PrecisionConfig.round_commission(
+                open_commission + Decimal(str(position.open_commission))
+            )
 
-        # 计算已平仓收益
-        for trade in self.trades:
-            if trade.short:
-                short_profit = PrecisionConfig.round_value(
-                    short_profit + trade.profit_loss - trade.trade_commission
-                )
+        first = positions[0]
+        merged = Position(
+            symbol=first.symbol,
+            open_date=first.open_date,
+            open_price=float(weighted_open_price),
+            position_size=float(total_size),
+            is_short=first.is_short
+        )
+        merged.open_commission = float(open_commission)
+        merged.update(
+            last_date=max(position.last_date for position in positions),
+            last_price=float(positions[-1].last_price)
+        )
+        return merged
+
+    def merge_positions(self):
+        '''
+        合并同向持仓: 本bar内同标的同方向多次开仓的仓位合并成一个, 放在最早的仓位的位置
+        只处理有多个仓位的 (symbol, is_short), 在bar结束、结算资产之前调用
+        '''
+        if not self._unmerged:
+            return
+        keys, self._unmerged = self._unmerged, {}
+        for symbol, is_short in keys:
+            positions = self.symbol_index.get(symbol, [])
+            group = [p for p in positions if p.is_short == is_short]
+            if len(group) < 2:  # 本bar内已经平仓
+                continue
+            merged = self._merge_group(group)
+
+            # 合并后的仓位接替最早的仓位的槽位, 其余仓位删除
+            first = group[0]
+            slot = self._slots.pop(id(first))
+            self._positions[slot] = merged
+            self._slots[id(merged)] = slot
+            dropped = set()
+            for position in group[1:]:
+                del self._positions[self._slots.pop(id(position))]
+                dropped.add(id(position))
+            positions[:] = [merged if p is first else p for p in positions if id(p) not in dropped]
+
+            self.position_book[(symbol, is_short)] = merged
+            side = self.short_positions if is_short else self.long_positions
+            side[symbol] = merged
+
+    def update_assets_value(self):
+        '''按持仓最新价值汇总资产价值'''
+        self.assets_value = PrecisionConfig.round_value(
+            sum((Decimal(str(position.current_value)) 
+                 for position in self._positions.values()), 
+                Decimal('0'))
+        )
+
+    def total_value(self) -> float:
+        '''当前总资产(现金+持仓价值)'''
+        return float(self.cash + self.assets_value)
+
+    def _record_realized(self, trade: Trade):
+        '''平仓后把收益和手续费计入对应方向的累加器'''
+        self.realized_pnl[trade.short].add(
+            int(trade.profit_loss.scaleb(PrecisionConfig.VALUE_PRECISION)),
+            int(trade.trade_commission.scaleb(PrecisionConfig.COMMISSION_PRECISION))
+        )
+
+    def _unrealized_pnl(self) -> Tuple[int, int]:
+        '''多/空头未平仓收益(按金额精度缩放的整数)'''
+        long_profit = Decimal('0')
+        short_profit = Decimal('0')
+        for position in self.position_book.values():
+            if position.is_short:
+                short_profit += position.profit_loss
             else:
-                long_profit = PrecisionConfig.round_value(
-                    long_profit + trade.profit_loss - trade.trade_commission
-                )
+                long_profit += position.profit_loss
+        return (int(long_profit.scaleb(PrecisionConfig.VALUE_PRECISION)),
+                int(short_profit.scaleb(PrecisionConfig.VALUE_PRECISION)))
+
+    def update_seperate_long_short_returns(self):
+        '''更新多空头收益'''
+        long_unrealized, short_unrealized = self._unrealized_pnl()
 
-        # 记录收益
-        self.long_returns.append(float(long_profit))
-        self.short_returns.append(float(short_profit))
+        # 未平仓收益 + 已平仓收益
+        self.long_returns.append(self.realized_pnl[False].value(long_unrealized) / self._value_scale)
+        self.short_returns.append(self.realized_pnl[True].value(short_unrealized) / self._value_scale)
 
     def current_position_status(self):
-        '''获取当前持仓状态'''
+        '''获取当前持仓状态: 按开仓顺序列出每个仓位的标的, bar内未合并的仓位各占一项'''
         long_positions = []
         short_positions = []
-        for position in self.open_positions:
-            if position.is_short:
-                short_positions.append(position.symbol)
-            else:
-                long_positions.append(position.symbol)
+        for position in self._positions.values():
+            (short_positions if position.is_short else long_positions).append(position.symbol)
         return long_positions, short_positions
 
     def current_position_count(self):
-        '''获取当前持仓数量'''
-        long_c = 0
-        short_c = 0
-        for position in self.open_positions:
-            if position.is_short:
-                short_c += 1
-            else:
-                long_c += 1
-        return long_c, short_c
\ No newline at end of file
+        '''获取当前持仓数量, 与current_position_status一致'''
+        short_c = sum(position.is_short for position in self._positions.values())
+        return len(self._positions) - short_c, short_c
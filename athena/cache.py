@@ -0,0 +1,147 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import os
+import pickle
+import shutil
+import pandas as pd
+
+_DAY = pd.Timedelta(days=1)
+
+def _merge_ranges(ranges: Iterable[Tuple[pd.Timestamp, pd.Timestamp]]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    '''合并重叠或相邻(按天)的日期区间'''
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + _DAY:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def _subtract_ranges(start: pd.Timestamp, end: pd.Timestamp,
+                     covered: Sequence[Tuple[pd.Timestamp, pd.Timestamp]]) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+    '''[start, end] 中没有被covered覆盖的区间'''
+    gaps = []
+    for covered_start, covered_end in covered:
+        if covered_end < start or covered_start > end:
+            continue
+        if covered_start > start:
+            gaps.append((start, covered_start - _DAY))
+        start = covered_end + _DAY
+        if start > end:
+            return gaps
+    gaps.append((start, end))
+    return gaps
+
+
+class DataCache:
+    '''
+    本地数据缓存, 按 (数据源, 频率, 标的) 分文件保存, 每个字段记录已经下载过的日期区间
+    请求的区间已经缓存时直接读取, 区间扩大时只下载缺失的部分
+
+    cache = DataCache('~/.athena_cache')
+    TushareDataHandler(start_date, end_date, token=..., cache=cache)
+    '''
+    def __init__(self, root: str):
+        self.root = os.path.expanduser(root)
+
+    def _path(self, source: str, frequency: str, symbol: str) -> str:
+        return os.path.join(self.root, source, str(frequency), f"{symbol}.pkl")
+
+    def _load(self, source: str, frequency: str, symbol: str) -> Dict:
+        path = self._path(source, frequency, symbol)
+        if not os.path.exists(path):
+            return {'data': pd.DataFrame(), 'ranges': {}}
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+    def _dump(self, source: str, frequency: str, symbol: str, entry: Dict):
+        path = self._path(source, frequency, symbol)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换, 中断时不会留下损坏的缓存
+        with open(path + '.tmp', 'wb') as f:
+            pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(path + '.tmp', path)
+
+    def missing(self, source: str, frequency: str, symbol: str, fields: Sequence[str],
+                start_date, end_date) -> List[Tuple[pd.Timestamp, pd.Timestamp]]:
+        '''[start_date, end_date] 中任一字段没有缓存的日期区间'''
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        ranges = self._load(source, frequency, symbol)['ranges']
+        gaps = []
+        for field in fields:
+            gaps.extend(_subtract_ranges(start, end, ranges.get(field, [])))
+        return _merge_ranges(gaps)
+
+    def read(self, source: str, frequency: str, symbol: str, fields: Sequence[str],
+             start_date, end_date) -> pd.DataFrame:
+        '''读取缓存, 索引为日期, 列为fields'''
+        data = self._load(source, frequency, symbol)['data']
+        if len(data) == 0:
+            return pd.DataFrame(columns=list(fields), index=pd.DatetimeIndex([]), dtype=float)
+        data = data.reindex(columns=list(fields))
+        return data.loc[pd.Timestamp(start_date):pd.Timestamp(end_date)]
+
+    def write(self, source: str, frequency: str, symbol: str, data: pd.DataFrame,
+              start_date, end_date, fields: Optional[Sequence[str]] = None):
+        '''
+        写入 [start_date, end_date] 区间下载到的数据(索引为日期), 并把这些字段标记为已缓存
+        这个区间内没有返回的日期(停牌、非交易日)同样视为已缓存
+        '''
+        start, end = pd.Timestamp(start_date), pd.Timestamp(end_date)
+        fields = list(data.columns if fields is None else fields)
+        entry = self._load(source, frequency, symbol)
+
+        old = entry['data']
+        new = data.sort_index().loc[start:end, [field for field in fields if field in data.columns]]
+        if len(old):
+            # 同一天同一字段以新下载的数据为准
+            combined = new.combine_first(old)
+            entry['data'] = combined[list(old.columns) + [c for c in combined.columns if c not in old.columns]]
+        else:
+            entry['data'] = new.sort_index()
+
+        for field in fields:
+            entry['ranges'][field] = _merge_ranges(entry['ranges'].get(field, []) + [(start, end)])
+        self._dump(source, frequency, symbol, entry)
+
+    def fetch(self, source: str, frequency: str, symbols: Sequence[str], fields: Sequence[str],
+              start_date, end_date, fetcher: Callable, date_column: str, symbol_column: str) -> pd.DataFrame:
+        '''
+        通过缓存获取多个标的的数据, 只对缺失的区间调用 fetcher
+        :param fetcher: fetcher(symbols, start, end) -> 长表, 包含 date_column, symbol_column 和字段列
+                        缺失区间相同的标的合并成一次调用
+        :return: 与fetcher相同格式的长表, 覆盖 [start_date, end_date]
+        '''
+        fields = list(fields)
+        groups: Dict[Tuple, List[str]] = {}
+        for symbol in symbols:
+            gaps = tuple(self.missing(source, frequency, symbol, fields, start_date, end_date))
+            if gaps:
+                groups.setdefault(gaps, []).append(symbol)
+
+        for gaps, group in groups.items():
+            for gap_start, gap_end in gaps:
+                downloaded = fetcher(group, gap_start, gap_end)
+                if downloaded is None or len(downloaded) == 0:
+                    downloaded = pd.DataFrame(columns=[date_column, symbol_column] + fields)
+                downloaded = downloaded.assign(**{date_column: pd.to_datetime(downloaded[date_column])})
+                by_symbol = dict(tuple(downloaded.groupby(symbol_column)))
+                for symbol in group:
+                    data = by_symbol.get(symbol, downloaded.iloc[:0]).set_index(date_column)
+                    data = data.reindex(columns=fields).apply(pd.to_numeric, errors='coerce')
+                    self.write(source, frequency, symbol, data, gap_start, gap_end, fields)
+
+        frames = []
+        for symbol in symbols:
+            data = self.read(source, frequency, symbol, fields, start_date, end_date)
+            data = data.rename_axis(date_column).reset_index()
+            data.insert(1, symbol_column, symbol)
+            frames.append(data)
+        if not frames:
+            return pd.DataFrame(columns=[date_column, symbol_column] + fields)
+        return pd.concat(frames, ignore_index=True)
+
+    def clear(self, source: Optional[str] = None):
+        '''删除缓存, 默认删除全部数据源'''
+        path = self.root if source is None else os.path.join(self.root, source)
+        if os.path.exists(path):
+            shutil.rmtree(path)
@@ -1,8 +1,21 @@
+import numpy as np
 import pandas as pd
-import rqdatac as rq
-import tushare as ts
-import time
 import os
+import re
+from multiprocessing import Pool
+
+from .cache import DataCache
+from .fetch import TokenBucket, batched, fetch_concurrent
+from .resample import resample_to_higher_freq, resample_multi_index_dataframe, append_resampled
+
+# 数据商的SDK在第一次使用时才导入, 只做回测时不需要安装, 也不影响 import athena 的速度
+def _rqdatac():
+    import rqdatac
+    return rqdatac
+
+def _tushare():
+    import tushare
+    return tushare
 
 SINGLE_ASSET_TEST_DATA = pd.DataFrame(
     index=['2023-10-18', '2023-10-19', '2023-10-20'],
@@ -32,100 +45,132 @@ MULTIPLE_ASSETS_TEST_DATA = pd.DataFrame(
 )
 
 
+def _ricequant_date(date):
+    '''缓存传入的Timestamp转换为米筐接口的日期格式'''
+    return pd.Timestamp(date).strftime('%Y-%m-%d')
+
+def _tushare_date(date):
+    '''缓存传入的Timestamp转换为tushare接口的日期格式 YYYYMMDD'''
+    return pd.Timestamp(date).strftime('%Y%m%d')
+
+def long_to_wide(long_df, date_column, symbol_column, fields, rename=None, symbols=None, dtype=float, sort=True):
+    """
+    把长表 (日期, 标的, 字段...) 一次性转换成 (symbol, field) 多重索引列的大表
+    :param long_df: 长表, date_column 和 symbol_column 为普通列
+    :param fields: 需要的字段, 按这个顺序排列
+    :param rename: 字段改名, 例如 {'close': 'Close'}
+    :param symbols: 标的顺序, 默认按在长表中第一次出现的顺序
+    :param dtype: 输出的数据类型
+    :param sort: 是否按日期升序排列, 否则按日期第一次出现的顺序
+    :return: 索引为日期(名称为date_column), 列为 (symbol, field) 的 DataFrame
+    """
+    fields = list(fields)
+    date_codes, dates = pd.factorize(long_df[date_column], sort=sort)
+    if symbols is None:
+        symbol_codes, symbols = pd.factorize(long_df[symbol_column], sort=False)
+    else:
+        symbols = pd.Index(symbols)
+        symbol_codes = symbols.get_indexer(long_df[symbol_column])
+        keep = symbol_codes >= 0
+        date_codes, symbol_codes = date_codes[keep], symbol_codes[keep]
+        long_df = long_df[keep]
+
+    values = np.full((len(dates), len(symbols), len(fields)), np.nan, dtype=dtype)
+    values[date_codes, symbol_codes] = long_df[fields].to_numpy(dtype=dtype)
+
+    fields = [rename.get(field, field) for field in fields] if rename else fields
+    return pd.DataFrame(
+        values.reshape(len(dates), -1),
+        index=pd.Index(dates, name=date_column),
+        columns=pd.MultiIndex.from_product([list(symbols), fields]),
+    )
+
+
 class RiceQuantDataHandler:
-    def __init__(self, start_date, end_date, frequency='1d'):
+    def __init__(self, start_date, end_date, frequency='1d', cache: DataCache = None):
+        """
+        :param cache: 本地缓存 DataCache, 设置后只下载缓存中缺失的日期区间
+        """
         self.start_date = start_date
         self.end_date = end_date
         self.frequency = frequency
+        self.cache = cache
     
     def auth(self, user, pwd):
-        rq.init(user, pwd) 
+        _rqdatac().init(user, pwd) 
         #pass
     
     def get_index_list(self, index):
-        return rq.index_components(index, self.end_date)
+        return _rqdatac().index_components(index, self.end_date)
+
+    def _fetch(self, source, symbols, fields, fetcher):
+        '''获取长表(order_book_id, date, 字段...), 配置了缓存时只对缺失的区间调用fetcher'''
+        if self.cache is None:
+            return fetcher(symbols, self.start_date, self.end_date)
+        return self.cache.fetch(f'ricequant.{source}', self.frequency, symbols, fields,
+                                self.start_date, self.end_date, fetcher, 'date', 'order_book_id')
         
     def get_prices_from_ricequant(self, list, fields=['close']):
         # 需要先验证rqdatac: rq.init('','')
+        def fetcher(symbols, start_date, end_date):
+            prices = _rqdatac().get_price(symbols, start_date=_ricequant_date(start_date), end_date=_ricequant_date(end_date),
+                                  frequency=self.frequency, fields=fields)
+            return None if prices is None else prices.reset_index()
+
         print("开始获取数据")
-        asset_prices = rq.get_price(list, start_date=self.start_date, end_date=self.end_date, frequency=self.frequency, fields=fields)
+        asset_prices = self._fetch('price', list, fields, fetcher)
         print("数据获取完成")
 
-        asset_prices.reset_index(inplace=True)
         asset_prices['date'] = pd.to_datetime(asset_prices['date'])
 
         # 保留原始字段名称映射
         field_mapping = {field: field.capitalize() for field in fields}
-        # 更新DataFrame的列名
-        asset_prices.rename(columns=field_mapping, inplace=True)
-        
-        asset_prices.set_index('date', inplace=True)
 
-        # 根据order_book_id和field循环创建新结构的数据字典
-        new_structure_data = {}
         print("开始转换数据结构")
-
-        for order_book_id in asset_prices['order_book_id'].unique():
-            for _, new_field in field_mapping.items():
-            #for field in fields:
-                key = (order_book_id, new_field)
-
-                series = asset_prices.loc[asset_prices['order_book_id'] == order_book_id, new_field]
-                # 使用reindex来确保时间序列与主索引长度相同，并用合适的方法填充缺失数据
-                series = series.reindex(asset_prices.index.unique())  #保持长度一致，填充空值
-                new_structure_data[key] = series.values
-
-                #new_structure_data[key] = asset_prices.loc[asset_prices['order_book_id'] == order_book_id, new_field].values
-                    
-        new_structure_df = pd.DataFrame(new_structure_data, index=asset_prices.index.unique())
-    
-        return new_structure_df
+        return long_to_wide(asset_prices, 'date', 'order_book_id', fields, rename=field_mapping)
 
     def get_factors_from_ricequant(self, list, factors=['market_cap']):
 
+        def fetcher(symbols, start_date, end_date):
+            factor_data = _rqdatac().get_factor(symbols, factors, _ricequant_date(start_date), _ricequant_date(end_date))
+            return None if factor_data is None else factor_data.reset_index()
+
         print("开始获取数据")
-        factor_data = rq.get_factor(list, factors, self.start_date, self.end_date)
+        factor_data = self._fetch('factor', list, factors, fetcher)
 
         print("数据获取完成")
 
-        factor_data.reset_index(inplace=True)
         factor_data['date'] = pd.to_datetime(factor_data['date'])
         
-        factor_data.set_index('date', inplace=True)
-
-        # 根据order_book_id和field循环创建新结构的数据字典
-        new_structure_data = {}
         print("开始转换数据结构")
-
-        for order_book_id in factor_data['order_book_id'].unique():
-            for field in factors:
-            #for field in fields:
-                key = (order_book_id, field)
-
-                series = factor_data.loc[factor_data['order_book_id'] == order_book_id, field]
-                # 使用reindex来确保时间序列与主索引长度相同，并用合适的方法填充缺失数据
-                series = series.reindex(factor_data.index.unique())  #保持长度一致，填充空值
-                new_structure_data[key] = series.values
-
-                #new_structure_data[key] = factor_data.loc[factor_data['order_book_id'] == order_book_id, field].values
-                    
-        new_structure_df = pd.DataFrame(new_structure_data, index=factor_data.index.unique())
-    
-        return new_structure_df
+        return long_to_wide(factor_data, 'date', 'order_book_id', factors)
 
 
 class TushareDataHandler:
-    def __init__(self, start_date, end_date, frequency='D', token=None):
+    def __init__(self, start_date, end_date, frequency='D', token=None, cache: DataCache = None,
+                 workers=4, calls_per_minute=500, max_rows=6000, retries=3, backoff=1.0):
         """
         :param start_date: 开始日期，格式 YYYYMMDD
         :param end_date: 结束日期，格式 YYYYMMDD
         :param frequency: 数据频率，默认为日线 'D'
         :param token: Tushare 的个人认证 Token
+        :param cache: 本地缓存 DataCache, 设置后只下载缓存中缺失的日期区间
+        :param workers: 并发请求的线程数
+        :param calls_per_minute: 每分钟最多调用次数(接口配额), None 表示不限速
+        :param max_rows: 单次请求最多返回的行数, 批量请求时按此把股票列表分批
+        :param retries / backoff: 失败重试次数, 第n次重试前等待 backoff * 2^n 秒
         """
         self.start_date = start_date
         self.end_date = end_date
         self.frequency = frequency
+        self.cache = cache
+        self.workers = workers
+        self.limiter = TokenBucket.per_minute(calls_per_minute) if calls_per_minute else None
+        self.max_rows = max_rows
+        self.retries = retries
+        self.backoff = backoff
         
+        ts = _tushare()
         if token:
             ts.set_token(token)
         self.pro = ts.pro_api()
@@ -141,6 +186,35 @@ class TushareDataHandler:
         unique_stock_list = list(set(index_weights['con_code'].tolist()))  # 使用 set 去重
         
         return unique_stock_list
+
+    def _request(self, api, tasks, sleep_time=0):
+        '''并发调用接口, 按配额限速并在失败时重试; sleep_time > 0 时每次调用至少间隔 sleep_time 秒'''
+        limiter = TokenBucket(1 / sleep_time, 1) if sleep_time > 0 else self.limiter
+        return fetch_concurrent(api, tasks, workers=self.workers, limiter=limiter,
+                                retries=self.retries, backoff=self.backoff)
+
+    def _request_stocks(self, api, stocks, start_date, end_date, sleep_time=0, **kwargs):
+        '''逐只股票请求, 返回合并后的长表'''
+        tasks = [dict(ts_code=stock, start_date=_tushare_date(start_date), end_date=_tushare_date(end_date), **kwargs)
+                 for stock in stocks]
+        all_data = self._request(api, tasks, sleep_time)
+        for stock, df in zip(stocks, all_data):
+            df['ts_code'] = stock
+        return pd.concat(all_data)
+
+    def _request_batches(self, api, stocks, start_date, end_date, **kwargs):
+        '''多只股票合并成一次请求, 按单次返回行数上限分批, 避免结果被截断'''
+        days = max(1, len(pd.bdate_range(pd.Timestamp(start_date), pd.Timestamp(end_date))))
+        tasks = [dict(ts_code=','.join(batch), start_date=_tushare_date(start_date), end_date=_tushare_date(end_date), **kwargs)
+                 for batch in batched(stocks, self.max_rows // days)]
+        return pd.concat(self._request(api, tasks))
+
+    def _fetch(self, source, stock_list, fields, fetcher):
+        '''获取长表(trade_date, ts_code, 字段...), 配置了缓存时只对缺失的区间调用fetcher'''
+        if self.cache is None:
+            return fetcher(stock_list, self.start_date, self.end_date)
+        return self.cache.fetch(f'tushare.{source}', self.frequency, stock_list, fields,
+                                self.start_date, self.end_date, fetcher, 'trade_date', 'ts_code')
     
     def get_index_prices_from_tushare(self, index_code):
         """
@@ -180,47 +254,21 @@ class TushareDataHandler:
             'close': 'Close',
             'vol': 'Volume',
         }
-        mapped_fields = [field_mapping[field] for field in fields]  # 将字段名称映射为规范的大写形式
         
-        all_data = []
-        print("开始获取行情数据...")
-        # 遍历股票列表
-        for stock in stock_list:
-            # 获取单只股票的日线数据
-            df = self.pro.daily(ts_code=stock, start_date=self.start_date, end_date=self.end_date)
-            df['ts_code'] = stock
-            all_data.append(df)
+        def fetcher(stocks, start_date, end_date):
+            # 并发获取每只股票的日线数据并合并
+            return self._request_stocks(self.pro.daily, stocks, start_date, end_date, sleep_time)
 
-            if sleep_time > 0:
-                time.sleep(sleep_time)
+        print("开始获取行情数据...")
+        combined_data = self._fetch('daily', stock_list, fields, fetcher)
         print("数据获取完成！")
 
-        # 合并所有股票的数据
-        combined_data = pd.concat(all_data)
         combined_data['trade_date'] = pd.to_datetime(combined_data['trade_date'])
-        combined_data.set_index(['trade_date', 'ts_code'], inplace=True)
 
-        # 选择需要的字段
-        combined_data = combined_data[fields]
-        combined_data.rename(columns=field_mapping, inplace=True)
-
-        # 转换为多重索引结构，列为 (Symbol, 属性)
-        new_structure_data = {}
-        for stock in combined_data.index.get_level_values('ts_code').unique():
-            for field in mapped_fields:
-                key = (stock, field)
-                series = combined_data.loc[combined_data.index.get_level_values('ts_code') == stock, field]
-                series = series.droplevel('ts_code')  # 移除 ts_code，只有日期作为索引
-                new_structure_data[key] = series
-
-        # 转换为 DataFrame
-        new_structure_df = pd.DataFrame(new_structure_data)
-
-        new_structure_df = new_structure_df.sort_index(ascending=True)  # 按日期升序排列
-
-        return new_structure_df
+        # 转换为多重索引结构，列为 (Symbol, 属性), 按日期升序排列
+        return long_to_wide(combined_data, 'trade_date', 'ts_code', fields, rename=field_mapping)
     
-    # 直接调取数据会有个问题，就是可能会不让一次性拉太多数据，尤其是在跑全市场的话
+    # 直接调取数据会有个问题，就是可能会不让一次性拉太多数据，尤其是在跑全市场的话, 所以按 max_rows 把股票列表分批并发请求
     def get_prices_from_tushare_parallel(self, stock_list, fields=['close']):
         """
         获取多只股票的日线行情数据，重新整理为多重索引的 DataFrame。
@@ -236,11 +284,13 @@ class TushareDataHandler:
             'close': 'Close',
             'vol': 'Volume',
         }
-        mapped_fields = [field_mapping[field] for field in fields]  # 将字段名称映射为规范的大写形式
         
+        def fetcher(stocks, start_date, end_date):
+            return self._request_batches(self.pro.daily, stocks, start_date, end_date)
+
         print("开始获取行情数据...")
         # 一次性读取所有股票数据
-        df_all = self.pro.daily(ts_code=','.join(stock_list), start_date=self.start_date, end_date=self.end_date)
+        df_all = self._fetch('daily', stock_list, fields, fetcher)
 
         if df_all.empty:
             print("API 未返回任何数据，请检查输入参数！")
@@ -250,24 +300,9 @@ class TushareDataHandler:
         
         # 处理数据
         df_all['trade_date'] = pd.to_datetime(df_all['trade_date'])
-        df_all.set_index(['trade_date', 'ts_code'], inplace=True)
-        # 选择需要的字段
-        df_all = df_all[fields]
-        df_all.rename(columns=field_mapping, inplace=True)
-
-        # 转换为多重索引结构，列为 (Symbol, 属性)
-        new_structure_data = {}
-        for stock in df_all.index.get_level_values('ts_code').unique():
-            for field in mapped_fields:
-                key = (stock, field)
-                series = df_all.loc[df_all.index.get_level_values('ts_code') == stock, field]
-                series = series.droplevel('ts_code')  # 移除 ts_code，只有日期作为索引
-                new_structure_data[key] = series
-        # 转换为 DataFrame
-        new_structure_df = pd.DataFrame(new_structure_data)
-        new_structure_df = new_structure_df.sort_index(ascending=True)  # 按日期升序排列
-
-        return new_structure_df
+
+        # 转换为多重索引结构，列为 (Symbol, 属性), 按日期升序排列
+        return long_to_wide(df_all, 'trade_date', 'ts_code', fields, rename=field_mapping)
 
     def get_factors_from_tushare(self, stock_list, factors=['total_mv'], sleep_time=0):
         """
@@ -277,44 +312,22 @@ class TushareDataHandler:
         :return: 多重索引结构的因子数据 DataFrame
         """
 
-        all_data = []
         factors_with_date = factors + ['trade_date'] # 得加上时间
-        print("开始获取因子数据...")
 
-        for stock in stock_list:
+        def fetcher(stocks, start_date, end_date):
             # tushare提供的财务接口: income, balancesheet, cashflow, forecast, express
             # 每日数据（非离散）: daily_basic
-            df = self.pro.daily_basic(ts_code=stock, start_date=self.start_date, end_date=self.end_date, fields=factors_with_date)
-            df['ts_code'] = stock
-            all_data.append(df)
+            return self._request_stocks(self.pro.daily_basic, stocks, start_date, end_date, sleep_time, fields=factors_with_date)
 
-            if sleep_time > 0:
-                time.sleep(sleep_time)
-                
+        print("开始获取因子数据...")
+        combined_data = self._fetch('daily_basic', stock_list, factors, fetcher)
         print("数据获取完成！")
 
-        combined_data = pd.concat(all_data)
 
         combined_data['trade_date'] = pd.to_datetime(combined_data['trade_date'])
 
-        combined_data.set_index(['trade_date', 'ts_code'], inplace=True)
-
-        # 选择需要的因子字段
-        combined_data = combined_data[factors]
-
-        new_structure_data = {}
-        for stock in combined_data.index.get_level_values('ts_code').unique():
-            for field in factors:
-                key = (stock, field)
-                series = combined_data.loc[combined_data.index.get_level_values('ts_code') == stock, field]
-                series = series.droplevel('ts_code')
-                new_structure_data[key] = series
-
-        # 转换为 DataFrame
-        new_structure_df = pd.DataFrame(new_structure_data)
-        new_structure_df = new_structure_df.sort_index(ascending=True)  # 按日期升序排列
-
-        return new_structure_df
+        # 转换为多重索引结构，列为 (Symbol, 因子), 按日期升序排列
+        return long_to_wide(combined_data, 'trade_date', 'ts_code', factors)
     
     def get_factors_from_tushare_parallel(self, stock_list, factors=['total_mv']):
         """
@@ -327,8 +340,11 @@ class TushareDataHandler:
         factors_with_date = factors + ['trade_date', 'ts_code']  # 确保返回因子的同时包含交易日期
         print("开始获取因子数据...")
         
+        def fetcher(stocks, start_date, end_date):
+            return self._request_batches(self.pro.daily_basic, stocks, start_date, end_date, fields=factors_with_date)
+
         # 一次性读取所有股票的因子数据
-        df_all = self.pro.daily_basic(ts_code=','.join(stock_list), start_date=self.start_date, end_date=self.end_date, fields=factors_with_date)
+        df_all = self._fetch('daily_basic', stock_list, factors, fetcher)
 
         if df_all.empty:
             print("API 未返回任何数据，请检查输入参数！")
@@ -338,24 +354,33 @@ class TushareDataHandler:
         
         # 数据处理
         df_all['trade_date'] = pd.to_datetime(df_all['trade_date'])
-        df_all.set_index(['trade_date', 'ts_code'], inplace=True)
-        # 选择需要的因子字段
-        df_all = df_all[factors]
-        
-        # 转换为多重索引结构，列为 (Symbol, 因子)
-        new_structure_data = {}
-        for stock in df_all.index.get_level_values('ts_code').unique():
-            for factor in factors:
-                key = (stock, factor)  # 多重索引的列格式 (Symbol, 因子)
-                series = df_all.loc[df_all.index.get_level_values('ts_code') == stock, factor]
-                series = series.droplevel('ts_code')  # 移除 ts_code，只保留日期索引
-                new_structure_data[key] = series
 
-        # 转换为 DataFrame
-        new_structure_df = pd.DataFrame(new_structure_data)
-        new_structure_df = new_structure_df.sort_index(ascending=True)  # 按日期升序排列
+        # 转换为多重索引结构，列为 (Symbol, 因子), 按日期升序排列
+        return long_to_wide(df_all, 'trade_date', 'ts_code', factors)
 
-        return new_structure_df
+
+def _ingest_crypto_file(task):
+    """
+    读取单个币安pkl文件(在子进程中执行): 解析 Open time 作为索引, 并在合并前把字段转换为数值类型
+    :param task: (文件路径, 需要的字段), 字段为None时保留全部字段(用于写入合并存储)
+    :return: (DataFrame或None, 错误信息或None)
+    """
+    file_path, fields = task
+    file_name = os.path.basename(file_path)
+    try:
+        df = pd.read_pickle(file_path)
+    except Exception as e:
+        return None, f"[错误] 无法读取文件 {file_path}: {e}"
+
+    # 保留索引为时间列，并重命名为 trade_date
+    if "Open time" not in df.columns:
+        return None, f"[警告] 文件 {file_name} 缺失 'Open time' 列，跳过处理！"
+
+    columns = [column for column in df.columns if column != "Open time"] if fields is None else \
+              [field for field in fields if field in df.columns]
+    data = df[columns].apply(pd.to_numeric, errors="coerce")  # 非数值型数据替换为 NaN
+    data.index = pd.DatetimeIndex(pd.to_datetime(df["Open time"]), name="trade_date")
+    return data, None
 
 
 class CryptoDataHandler:
@@ -369,59 +394,107 @@ class CryptoDataHandler:
         self.start_date = start_date
         self.end_date = end_date
 
-    def create_prices_dataframe(self, data_dir, fields=['Open', 'Close']):
+    def _load_store(self, store_path, files):
+        """
+        从合并存储中读取修改时间和大小都没有变化的文件
+        :return: (读取到的 {文件名: DataFrame}, 存储中是否有目录里已经不存在的文件)
+        """
+        cached = {}
+        if not store_path or not os.path.exists(store_path):
+            return cached, False
+        with pd.HDFStore(store_path, mode='r') as store:
+            if '/manifest' not in store.keys():
+                return cached, False
+            manifest = store.get('manifest')
+            stale = len(manifest.index.difference(list(files))) > 0
+            for file_name, file_path in files.items():
+                if file_name not in manifest.index:
+                    continue
+                entry = manifest.loc[file_name]
+                stat = os.stat(file_path)
+                if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                    cached[file_name] = store.get(entry['node'])
+        return cached, stale
+
+    def _update_store(self, store_path, files, ingested):
+        """把重新读取的文件写入合并存储, 并删除已经不存在的文件"""
+        with pd.HDFStore(store_path, mode='a') as store:
+            manifest = store.get('manifest') if '/manifest' in store.keys() else \
+                pd.DataFrame(columns=['node', 'mtime', 'size'])
+            for file_name in manifest.index.difference(list(files)):
+                store.remove(manifest.loc[file_name, 'node'])
+            manifest = manifest.loc[manifest.index.intersection(list(files))]
+
+            for file_name, df in ingested.items():
+                stat = os.stat(files[file_name])
+                node = 'files/f_' + re.sub(r'\W', '_', os.path.splitext(file_name)[0])
+                store.put(node, df, format='fixed')
+                manifest.loc[file_name] = [node, stat.st_mtime_ns, stat.st_size]
+
+            store.put('manifest', manifest.astype({'mtime': 'int64', 'size': 'int64'}), format='fixed')
+
+    def create_prices_dataframe(self, data_dir, fields=['Open', 'Close'], processes=None, store_path=None):
         """
         从指定的目录中提取所有 pkl 文件并生成多索引大表。
         
         :param data_dir: 本地文件夹路径，包含以 pkl 格式存储的各标的数据。
-        :param start_date: 数据的开始日期，格式为 "yyyy-mm-dd" (字符串类型或 None)。
-        :param end_date: 数据的结束日期，格式为 "yyyy-mm-dd" (字符串类型或 None)。
         :param fields: 要提取的字段列表，默认 ['Open', 'Close']。
+        :param processes: 并行读取pkl文件的进程数, 默认为CPU数, 1表示在当前进程顺序读取
+        :param store_path: 合并存储(.h5)的路径, 设置后读取过的文件(全部字段)会保存在这里,
+                           之后只重新读取修改时间或大小发生变化的pkl文件
         :return: 格式化后的 Pandas DataFrame。
         """
-        # 初始化一个空的字典，用于拼接数据
-        data_dict = {}
-
-        # 遍历目录中的所有 pkl 文件
-        for file_name in os.listdir(data_dir):
-            # 检查仅处理以 .pkl 结尾的文件
-            if file_name.endswith(".pkl"):
-                # 提取 symbol 名称
-                symbol = file_name.split("_")[0]
-
-                # 读取 pkl 文件
-                file_path = os.path.join(data_dir, file_name)
-                try:
-                    df = pd.read_pickle(file_path)
-                except Exception as e:
-                    print(f"[错误] 无法读取文件 {file_path}: {e}")
-                    continue
-
-                # 检查所需字段是否在文件中存在
-                missing_fields = [field for field in fields if field not in df.columns]
-                if missing_fields:
-                    print(f"[警告] 文件 {file_name} 缺失必要字段 {missing_fields}，跳过处理！")
-                    continue
-
-                # 保留索引为时间列，并重命名为 trade_date
-                if "Open time" not in df.columns:
-                    print(f"[警告] 文件 {file_name} 缺失 'Open time' 列，跳过处理！")
-                    continue
+        # 目录中所有以 .pkl 结尾的文件
+        files = {
+            file_name: os.path.join(data_dir, file_name)
+            for file_name in os.listdir(data_dir) if file_name.endswith(".pkl")
+        }
 
-                df.rename(columns={"Open time": "trade_date"}, inplace=True)
-                df["trade_date"] = pd.to_datetime(df["trade_date"])
-                df.set_index("trade_date", inplace=True)
+        frames, stale = self._load_store(store_path, files)
+        tasks = [(file_path, None if store_path else fields)
+                 for file_name, file_path in files.items() if file_name not in frames]
 
-                # 按时间范围过滤数据
-                if self.start_date:
-                    start_date_ts = pd.to_datetime(self.start_date)
-                    df = df[df.index >= start_date_ts]
-                if self.end_date:
-                    end_date_ts = pd.to_datetime(self.end_date)
-                    df = df[df.index <= end_date_ts]
+        # 多进程读取需要重新解析的文件
+        processes = processes or os.cpu_count() or 1
+        if processes == 1 or len(tasks) <= 1:
+            results = [_ingest_crypto_file(task) for task in tasks]
+        else:
+            with Pool(min(processes, len(tasks))) as pool:
+                results = pool.map(_ingest_crypto_file, tasks)
+
+        ingested = {}
+        for (file_path, _), (df, message) in zip(tasks, results):
+            if message:
+                print(message)
+            else:
+                ingested[os.path.basename(file_path)] = df
+        if store_path and (ingested or stale or len(frames) != len(files)):
+            self._update_store(store_path, files, ingested)
+        frames.update(ingested)
 
-                # 提取指定字段并加入字典
-                data_dict[symbol] = df[fields]
+        # 初始化一个空的字典，用于拼接数据
+        data_dict = {}
+        start_date_ts = pd.to_datetime(self.start_date) if self.start_date else None
+        end_date_ts = pd.to_datetime(self.end_date) if self.end_date else None
+        for file_name in files:
+            if file_name not in frames:
+                continue
+            df = frames[file_name]
+
+            # 检查所需字段是否在文件中存在
+            missing_fields = [field for field in fields if field not in df.columns]
+            if missing_fields:
+                print(f"[警告] 文件 {file_name} 缺失必要字段 {missing_fields}，跳过处理！")
+                continue
+
+            # 按时间范围过滤数据
+            if start_date_ts is not None:
+                df = df[df.index >= start_date_ts]
+            if end_date_ts is not None:
+                df = df[df.index <= end_date_ts]
+
+            # 提取 symbol 名称和指定字段
+            data_dict[file_name.split("_")[0]] = df[fields]
 
         # 合并所有标的数据
         if data_dict:
@@ -431,118 +504,103 @@ class CryptoDataHandler:
         else:
             print("[警告] 未发现有效数据文件！")
             return pd.DataFrame()  # 返回空 DataFrame
-        
-        # 遍历并清洗 `prices_df` 的数据框
-        for symbol in prices_df.columns.levels[0]:  # 遍历第一级列索引（交易标的）
-            for field in prices_df[symbol].columns:  # 遍历第二级列索引（Open, Close 等字段）
-                # 提取每一列
-                column_data = prices_df[(symbol, field)]
-                
-                # 清洗数据：将非数值型数据替换为 NaN
-                prices_df[(symbol, field)] = pd.to_numeric(column_data, errors="coerce")
 
         return prices_df
 
-# 这是针对单表的聚合方法
-def resample_to_higher_freq(df, target_freq='1D'):
-    """
-    将低级别 K线数据合并成高级别数据
-    :param df: 低级别的K线数据，包含列 ["Open time", "Close time", "Open", "High", "Low", "Close", "Volume", ...]
-    :param target_freq: 目标频率，例如 "1D" 表示合并成日级别数据
-    :return: 合并后的 DataFrame
+# HDF5表格格式的面板存储: 每个字段一张按日期索引的表, 读取时日期范围/标的/字段下推到磁盘
+def save_hdf_panel(panel_df, path, key='prices', complevel=None):
     """
+    把 (symbol, field) 多重索引列的大表写成表格格式的.h5文件
+    每个字段单独一张表 /{key}/{field} (列为标的, 日期索引建立索引), 另存一份原始列顺序 /{key}/_columns
 
-    # 确保 Open time 为 datetime 类型
-    df['Open time'] = pd.to_datetime(df['Open time'])
-
-    # 设置 Open time 为索引，以便 resample 操作
-    df = df.set_index('Open time')
-
-    # 定义合并逻辑
-    resampled = df.resample(target_freq).agg({
-        'Open': 'first',              # 第一个 Open 值
-        'High': 'max',                # 最高价
-        'Low': 'min',                 # 最低价
-        'Close': 'last',              # 最后一个 Close 值
-        'Volume': 'sum',              # 成交量总和
-        'Quote asset volume': 'sum',  # Quote asset volume 总和
-        'Number of trades': 'sum',    # 成交笔数总和
-        'Taker buy base asset volume': 'sum',  # 主动买入成交量总和
-        'Taker buy quote asset volume': 'sum'  # 主动买入成交额总和
-    })
-
-    # 重新创建 Close time 列，表示每个周期的结束时间
-    resampled['Close time'] = resampled.index + pd.to_timedelta(target_freq) - pd.Timedelta(milliseconds=1)
-
-    # 将索引重置为普通列
-    resampled = resampled.reset_index().rename(columns={"Open time": "Open time"})
-
-    # 调整列顺序
-    resampled = resampled[[
-        'Open time', 'Close time', 'Open', 'High', 'Low', 'Close',
-        'Volume', 'Quote asset volume', 'Number of trades',
-        'Taker buy base asset volume', 'Taker buy quote asset volume'
-    ]]
-
-    return resampled
-
-# 这是针对多表的聚合方法
-def resample_multi_index_dataframe(prices_df, target_freq='1D'):
+    :param panel_df: 索引为日期, 列为 (symbol, field) 的 DataFrame
+    :param path: .h5文件路径
+    :param key: 存储的key, 例如 'prices' / 'factors'
+    :param complevel: 压缩等级(blosc), 默认不压缩
     """
-    将多标的大表按指定的频率进行重采样，例如将15min数据合并成1D。
-    
-    :param prices_df: 包含多索引的K线数据大表，索引为日期，columns为多级索引 (symbol, fields)
-    :param target_freq: 目标频率，例如 '1D' 表示日级别
-    :return: 重采样后的 DataFrame
+    if not isinstance(panel_df.columns, pd.MultiIndex):
+        raise ValueError("输入的 DataFrame 的列必须是 (symbol, field) 的多重索引")
+
+    key = key.strip('/')
+    columns = panel_df.columns
+    with pd.HDFStore(path, mode='a', complevel=complevel, complib='blosc' if complevel else None) as store:
+        for node in [k for k in store.keys() if k.startswith(f'/{key}/')]:
+            store.remove(node)
+
+        for field in columns.get_level_values(1).unique():
+            field_df = panel_df.xs(field, axis=1, level=1)
+            field_df.columns = field_df.columns.astype(str)
+            store.put(f'{key}/{field}', field_df, format='table', index=True)
+
+        store.put(f'{key}/_columns', pd.DataFrame(columns.tolist(), columns=['symbol', 'field']), format='fixed')
+
+def _hdf_panel_rows(store, key, fields, start_date, end_date):
+    '''日期范围对应的行号区间 [start, stop), 通过日期索引查询, 不读取数据'''
+    node = f'{key}/{fields[0]}'
+    if start_date is None and end_date is None:
+        return 0, store.get_storer(node).nrows
+
+    conditions = []
+    if start_date is not None:
+        start_date = pd.to_datetime(start_date)
+        conditions.append('index >= start_date')
+    if end_date is not None:
+        end_date = pd.to_datetime(end_date)
+        conditions.append('index <= end_date')
+    coordinates = store.select_as_coordinates(node, where=' & '.join(conditions))
+    if len(coordinates) == 0:
+        return 0, 0
+    return int(coordinates[0]), int(coordinates[-1]) + 1
+
+def _hdf_panel_columns(store, key, symbols, fields):
+    '''按原始列顺序筛选出需要的 (symbol, field)'''
+    pairs = store.get(f'{key}/_columns')
+    if symbols is not None:
+        pairs = pairs[pairs['symbol'].isin(symbols)]
+    if fields is not None:
+        pairs = pairs[pairs['field'].isin(fields)]
+    return pd.MultiIndex.from_frame(pairs, names=[None, None])
+
+def _read_hdf_panel_rows(store, key, columns, start, stop):
+    '''读取行号区间内需要的字段和标的, 拼回 (symbol, field) 大表'''
+    frames = {}
+    for field in columns.get_level_values(1).unique():
+        symbols = columns[columns.get_level_values(1) == field].get_level_values(0)
+        frames[field] = store.select(f'{key}/{field}', start=start, stop=stop, columns=list(symbols))
+
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    panel_df = pd.concat(frames, axis=1).swaplevel(axis=1)
+    return panel_df.reindex(columns=columns)
+
+def read_hdf_panel(path, key='prices', start_date=None, end_date=None, symbols=None, fields=None):
     """
-    # 检查索引是否是 DatetimeIndex
-    if not isinstance(prices_df.index, pd.DatetimeIndex):
-        raise ValueError("输入的 DataFrame 必须以时间作为索引 (DatetimeIndex)")
-
-    # 定义基础聚合逻辑（包含常见字段）
-    default_agg_funcs = {
-        'Open': 'first',                             # 第一个 Open 值
-        'High': 'max',                               # 最高价
-        'Low': 'min',                                # 最低价
-        'Close': 'last',                             # 最后一个 Close 值
-        'Volume': 'sum',                             # 成交量总和
-        'Quote asset volume': 'sum',                 # Quote asset volume 总和
-        'Number of trades': 'sum',                   # 成交笔数总和
-        'Taker buy base asset volume': 'sum',        # 主动买入成交量总和
-        'Taker buy quote asset volume': 'sum',       # 主动买入成交额总和
-    }
-
-    # 初始化一个空的列表，用于存储重采样后的数据
-    resampled_data = []
-
-    # 遍历每个标的 (symbol) 并进行重采样
-    for symbol in prices_df.columns.levels[0]:  # 遍历第一级多索引（symbol）
-        symbol_data = prices_df[symbol]  # 提取该 symbol 的数据
+    读取 save_hdf_panel 写入的面板, 只从磁盘读取需要的日期、标的和字段
 
-        # 筛选出当前 symbol 中存在的字段
-        available_fields = [field for field in default_agg_funcs.keys() if field in symbol_data.columns]
-        symbol_agg_funcs = {field: default_agg_funcs[field] for field in available_fields}
-
-        # 如果没有可用字段，跳过
-        if not symbol_agg_funcs:
-            print(f"[警告] {symbol} 缺少可重采样的字段，已跳过！")
-            continue
-
-        # 重采样数据，应用聚合逻辑
-        resampled_symbol_data = symbol_data.resample(target_freq).agg(symbol_agg_funcs)
-
-        # 为当前 symbol 数据加上多索引
-        resampled_symbol_data.columns = pd.MultiIndex.from_product([[symbol], resampled_symbol_data.columns])
-
-        # 将重采样后的数据保存到列表中
-        resampled_data.append(resampled_symbol_data)
-
-    # 合并所有标的重采样后的数据
-    if resampled_data:
-        resampled_df = pd.concat(resampled_data, axis=1)
-        resampled_df.sort_index(inplace=True)  # 按时间索引排序
-    else:
-        print("[警告] 未找到可重采样的数据！")
-        resampled_df = pd.DataFrame()  # 返回空 DataFrame
-
-    return resampled_df
+    :param start_date / end_date: 日期范围(包含两端), 通过日期索引定位行号, 只读取范围内的行
+    :param symbols: 需要的标的, 默认全部
+    :param fields: 需要的字段, 默认全部, 没有用到的字段表不会被打开
+    :return: 索引为日期, 列为 (symbol, field) 的 DataFrame
+    """
+    key = key.strip('/')
+    with pd.HDFStore(path, mode='r') as store:
+        columns = _hdf_panel_columns(store, key, symbols, fields)
+        if len(columns) == 0:
+            return pd.DataFrame(columns=columns)
+        start, stop = _hdf_panel_rows(store, key, columns.get_level_values(1).unique(), start_date, end_date)
+        return _read_hdf_panel_rows(store, key, columns, start, stop)
+
+def iter_hdf_panel(path, key='prices', chunksize=10_000, start_date=None, end_date=None, symbols=None, fields=None):
+    """
+    分块读取 save_hdf_panel 写入的面板, 每次返回 chunksize 行的 (symbol, field) 大表
+    可以直接作为 Backtest 的分段数据源: Backtest(strategy, iter_hdf_panel(path, chunksize=5000), ...)
+    参数同 read_hdf_panel
+    """
+    key = key.strip('/')
+    with pd.HDFStore(path, mode='r') as store:
+        columns = _hdf_panel_columns(store, key, symbols, fields)
+        if len(columns) == 0:
+            return
+        start, stop = _hdf_panel_rows(store, key, columns.get_level_values(1).unique(), start_date, end_date)
+        for chunk_start in range(start, stop, chunksize):
+            yield _read_hdf_panel_rows(store, key, columns, chunk_start, min(chunk_start + chunksize, stop))
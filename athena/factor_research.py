@@ -1,8 +1,12 @@
+from datetime import timedelta
 import pandas as pd
 import numpy as np
 
 from .backtesting import Strategy, Backtest
-from .lib import run_monthly, sort_the_factor
+from .broker import Broker
+from .records import BarRecords
+from .lib import (run_monthly, sort_the_factor, classify_factors_into_buckets,
+                  _factor_bucket_edges, _repeated_edges, _bucket_labels, _descending_order)
 
 # 分层跑因子的第n个bucket收益
 def run_strategy_with_buckets(
@@ -21,27 +25,19 @@ def run_strategy_with_buckets(
     :param num_long_short: 多头和空头分别持有的标的数量
     :param target_percent: 每个标的的仓位百分比
     """
+    # 将因子值分为 num_buckets 组, 默认行为是从低到高对数据进行分桶(因子值为NaN和0的标的不参与)
+    bucket_targets = _bucket_lookup(factors_df, factor_name, num_buckets)
+
     class FactorInvestStrategy(Strategy):
         def init(self):
             pass
 
         @run_monthly  # 调仓频率默认为月度
         def next(self, i, record):
-            date = self.data.index[i]
-
-            # 获取当天因子数据并排序
-            day_factors = factors_df.loc[date]
-            sorted_factor_series = sort_the_factor(day_factors, factor_name)  # 排序
-            sorted_factor_series = sorted_factor_series.iloc[:, 0]
-            # 移除因子值为NaN和0的标的(这里是以防0太多干扰我们分桶的结果)
-            sorted_factor_series = sorted_factor_series[sorted_factor_series != 0].dropna()
-
-            #print(sorted_factor_series)
+            date = self.date
 
-            # 将因子值分为 num_buckets 组，每组分配到对应 bucket
-            # 默认行为是从低到高对数据进行分桶（bucket）操作
-            buckets = pd.qcut(sorted_factor_series, num_buckets, labels=False) + 1  # [1, num_buckets]
-            target_stocks = sorted_factor_series[buckets == target_buckets].index.tolist()
+            # 分桶矩阵预先算好, 这里直接取出当天目标区间的标的(按因子值从高到低)
+            target_stocks = bucket_targets(date)[target_buckets]
 
             # 获取当前持仓
             current_long_positions, _ = self.broker.current_position_status()
@@ -71,29 +67,106 @@ def run_strategy_with_buckets(
 
     return res
 
+# 预先计算整个因子面板的分桶矩阵, 回测中按日期直接取出各分桶的标的
+def _bucket_lookup(factors_df, factor_name, num_buckets):
+    values, panel, edges = _factor_bucket_edges(factors_df, factor_name, num_buckets)
+    repeated = _repeated_edges(edges)
+    labels = _bucket_labels(panel, edges, repeated)
+    repeated = repeated.any(axis=1)
+    rows = {date: i for i, date in enumerate(values.index)}
+    columns = values.columns.to_numpy()
+
+    def targets(date):
+        """{bucket: [symbol, ...]}, 每个分桶内按因子值从高到低排列(与sort_the_factor一致)"""
+        i = rows[date]
+        if repeated[i]:
+            # 分桶边界重复时按原来的方式分桶, 与 pd.qcut 一样报错
+            buckets = classify_factors_into_buckets(sort_the_factor(factors_df.loc[date], factor_name), num_buckets)
+            return {k: buckets.index[buckets == k].tolist() for k in range(1, num_buckets + 1)}
+        valid = np.flatnonzero(~np.isnan(panel[i]))
+        order = valid[_descending_order(panel[i, valid])]
+        bucket_labels = labels[i, order]
+        symbols = columns[order]
+        return {k: symbols[bucket_labels == k].tolist() for k in range(1, num_buckets + 1)}
+
+    return targets
+
+def _rebalance_to(broker, record, long_stocks, short_stocks=(), weight=1.0):
+    """把broker的持仓调整为等权持有long_stocks(以及做空short_stocks), 与FactorInvestStrategy的逻辑一致"""
+    current_long_positions, current_short_positions = broker.current_position_status()
+
+    # 平仓逻辑
+    for stock in current_long_positions:
+        if stock not in long_stocks:
+            broker.close(symbol=stock, price=record[(stock, 'Open')])
+    for stock in current_short_positions:
+        if stock not in short_stocks:
+            broker.close(symbol=stock, price=record[(stock, 'Open')])
+
+    # 调仓逻辑, 平分资金到目标股票
+    for stocks, short in ((long_stocks, False), (short_stocks, True)):
+        if len(stocks) > 0:
+            stock_target_percent = weight / len(stocks)
+            for stock in stocks:
+                broker.order_target_percent(
+                    symbol=stock,
+                    target_percent=stock_target_percent,
+                    price=record[(stock, "Close")],
+                    short=short
+                )
+
 # 因子分层收益
-def run_factor_multiple_returns(data, factors_df, factor_name, num_buckets=5):
+def run_factor_multiple_returns(data, factors_df, factor_name, num_buckets=5, long_short=False,
+                                cash=100_0000, commission=0.001):
     """
     针对指定因子进行分层收益测试。
+    只遍历一次行情数据, 分桶矩阵预先一次性算好, 同时驱动所有分层组合
     :param factor_name: 因子名称
     :param num_buckets: 分层数量 (默认为5组)
+    :param long_short: 是否同时计算多最高层、空最低层的多空组合, 结果记为 "Long Short"
     """
+    print(f"因子分层测回测 {factor_name}, {num_buckets} Buckets...")
+
+    records = BarRecords(data)
+    index = data.index
+
+    names = [f"Bucket {bucket_idx}" for bucket_idx in range(1, num_buckets + 1)]
+    if long_short:
+        names.append("Long Short")
+    brokers = {name: Broker(cash=cash, commission=commission) for name in names}
+    for broker in brokers.values():
+        broker.log_text = False
+
+    bucket_targets = _bucket_lookup(factors_df, factor_name, num_buckets)
+
+    next_run_date = None
+    for i, record in enumerate(records):
+        date = index[i]
+        for broker in brokers.values():
+            broker.date = date
+
+        # 调仓频率为月度, 与run_monthly一致
+        if next_run_date is None or date >= next_run_date:
+            targets = bucket_targets(date)
+            for bucket_idx in range(1, num_buckets + 1):
+                _rebalance_to(brokers[f"Bucket {bucket_idx}"], record, targets[bucket_idx])
+            if long_short:
+                _rebalance_to(brokers["Long Short"], record, targets[num_buckets], targets[1], weight=0.5)
+            next_run_date = date + timedelta(days=30)
+
+        for broker in brokers.values():
+            broker.mark_to_market(date, record)
+
+    # 回测结束, 按最后一根bar的收盘价清算
+    last_record = records[-1]
     all_results = {}
-    
-    # 遍历分层
-    for bucket_idx in range(1, num_buckets + 1):
-
-        print(f"因子分层测回测 {factor_name}, Bucket {bucket_idx}/{num_buckets}...")
-                
-        # 运行策略
-        result = run_strategy_with_buckets(
-            data=data,
-            factors_df=factors_df,
-            factor_name=factor_name,
-            num_buckets=num_buckets,
-            target_buckets=bucket_idx
-        )
-        
-        all_results[f"Bucket {bucket_idx}"] = result.net_value
-    
-    return all_results
\ No newline at end of file
+    for name, broker in brokers.items():
+        for position in broker.open_positions:
+            last_price = last_record.get((position.symbol, 'Close'), last_record.get('Close', 0))
+            if last_price > 0:
+                broker.close(price=last_price, position=position)
+
+        returns = pd.Series(index=index, data=broker.returns, dtype=float)
+        all_results[name] = returns / float(broker.returns[0])
+
+    return all_results
@@ -0,0 +1,65 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence
+import threading
+import time
+
+class TokenBucket:
+    '''
+    令牌桶限速, 线程安全
+    平均每秒最多 rate 次调用, 允许最多 capacity 次的突发
+    '''
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        if rate <= 0:
+            raise ValueError("rate 必须大于0")
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    @classmethod
+    def per_minute(cls, calls: float, capacity: Optional[float] = None) -> 'TokenBucket':
+        '''按每分钟调用次数构造, 对应tushare的接口配额'''
+        return cls(calls / 60, capacity)
+
+    def acquire(self):
+        '''取一个令牌, 没有令牌时等待'''
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+def call_with_retry(func: Callable, kwargs: Dict[str, Any], limiter: Optional[TokenBucket] = None,
+                    retries: int = 3, backoff: float = 1.0):
+    '''调用接口, 失败后按 backoff * 2^n 秒退避重试, 每次调用前先从限速器取令牌'''
+    for attempt in range(retries + 1):
+        if limiter is not None:
+            limiter.acquire()
+        try:
+            return func(**kwargs)
+        except Exception:
+            if attempt == retries:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def batched(items: Sequence, size: int) -> List[List]:
+    '''把列表切成每批最多size个'''
+    size = max(1, int(size))
+    return [list(items[i:i + size]) for i in range(0, len(items), size)]
+
+def fetch_concurrent(func: Callable, tasks: Sequence[Dict[str, Any]], workers: int = 4,
+                     limiter: Optional[TokenBucket] = None, retries: int = 3, backoff: float = 1.0) -> List:
+    '''
+    用线程池并发调用接口, tasks 为每次调用的关键字参数
+    :return: 与tasks顺序一致的结果列表
+    '''
+    if workers <= 1 or len(tasks) <= 1:
+        return [call_with_retry(func, task, limiter, retries, backoff) for task in tasks]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(lambda task: call_with_retry(func, task, limiter, retries, backoff), tasks))
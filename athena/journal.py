@@ -0,0 +1,253 @@
+from typing import Iterator, List, Optional, Union
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+EVENT_BAR = 0            # 每根bar开始: 可用资金, 持仓价值
+EVENT_OPEN = 1           # 开仓成交
+EVENT_CLOSE = 2          # 全部平仓
+EVENT_PARTIAL_CLOSE = 3  # 部分平仓
+EVENT_EQUITY = 4         # 每根bar结束: 总资产, 多/空头收益
+
+EVENT_NAMES = ('bar', 'open', 'close', 'partial_close', 'equity')
+
+JOURNAL_DTYPE = np.dtype([
+    ('event', 'i1'),
+    ('bar', 'i4'),
+    ('symbol', 'i4'),
+    ('short', '?'),
+    ('price', 'f8'),
+    ('size', 'f8'),
+    ('pnl', 'f8'),
+    ('commission', 'f8'),
+    ('cash', 'f8'),
+    ('value', 'f8'),
+    ('long_pnl', 'f8'),
+    ('short_pnl', 'f8'),
+])
+
+class EventJournal:
+    '''
+    结构化的回测事件日志, 用来替代逐bar格式化字符串的logging
+    事件按列写入预先分配好的numpy缓冲区, 写满后交给后台线程追加到二进制文件(连续的.npy块)
+    回测过程中不做任何字符串格式化, 需要时再通过 read_journal / format_journal 还原成表格或文本
+
+    文件结构: [事件块]... [日期索引] [标的列表]
+    文件在创建时打开, 路径无效时立即报错; 后台线程写入失败时, 异常在下一次交出缓冲区、flush 或 close 时抛出
+    '''
+    def __init__(self, path: str, index: Optional[List] = None, capacity: int = 65536):
+        self.path = path
+        self.capacity = capacity
+        self._symbol_ids = {}
+        self._dates: List[pd.Index] = []
+        self._queue: queue.Queue = queue.Queue()
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._file = open(path, 'wb')
+        self._allocate()
+        if index is not None:
+            self.add_dates(index)
+
+        self._writer = threading.Thread(target=self._write_loop, daemon=True)
+        self._writer.start()
+
+    def add_dates(self, index):
+        '''追加bar的日期索引, 事件中的bar序号按追加的顺序对应'''
+        self._dates.append(pd.Index(index))
+
+    def _allocate(self):
+        '''分配一组新的列缓冲区'''
+        n = self.capacity
+        self._size = 0
+        self._event = np.zeros(n, dtype='i1')
+        self._bar = np.zeros(n, dtype='i4')
+        self._symbol = np.full(n, -1, dtype='i4')
+        self._short = np.zeros(n, dtype='?')
+        self._price = np.full(n, np.nan)
+        self._size_col = np.full(n, np.nan)
+        self._pnl = np.full(n, np.nan)
+        self._commission = np.full(n, np.nan)
+        self._cash = np.full(n, np.nan)
+        self._value = np.full(n, np.nan)
+        self._long_pnl = np.full(n, np.nan)
+        self._short_pnl = np.full(n, np.nan)
+
+    def _row(self, event: int, bar: int) -> int:
+        '''取得下一行的位置, 缓冲区写满时先交给后台线程'''
+        k = self._size
+        if k == self.capacity:
+            self._flush()
+            k = 0
+        self._size = k + 1
+        self._event[k] = event
+        self._bar[k] = bar
+        return k
+
+    def _symbol_id(self, symbol) -> int:
+        symbol_id = self._symbol_ids.get(symbol)
+        if symbol_id is None:
+            symbol_id = self._symbol_ids[symbol] = len(self._symbol_ids)
+        return symbol_id
+
+    def record_bar(self, bar: int, cash: float, assets_value: float):
+        k = self._row(EVENT_BAR, bar)
+        self._cash[k] = cash
+        self._value[k] = assets_value
+
+    def record_open(self, bar: int, symbol, short: bool, price: float, size: float,
+                    value: float, commission: float, cash: float):
+        k = self._row(EVENT_OPEN, bar)
+        self._symbol[k] = self._symbol_id(symbol)
+        self._short[k] = short
+        self._price[k] = price
+        self._size_col[k] = size
+        self._value[k] = value
+        self._commission[k] = commission
+        self._cash[k] = cash
+
+    def record_close(self, bar: int, symbol, short: bool, price: float, size: float,
+                     pnl: float, commission: float, cash: float, partial: bool = False):
+        k = self._row(EVENT_PARTIAL_CLOSE if partial else EVENT_CLOSE, bar)
+        self._symbol[k] = self._symbol_id(symbol)
+        self._short[k] = short
+        self._price[k] = price
+        self._size_col[k] = size
+        self._pnl[k] = pnl
+        self._commission[k] = commission
+        self._cash[k] = cash
+
+    def record_equity(self, bar: int, value: float, long_pnl: float, short_pnl: float):
+        k = self._row(EVENT_EQUITY, bar)
+        self._value[k] = value
+        self._long_pnl[k] = long_pnl
+        self._short_pnl[k] = short_pnl
+
+    def _flush(self):
+        '''把已写入的部分交给后台线程, 主线程换一组新的缓冲区'''
+        self._raise_error()
+        k = self._size
+        if k:
+            self._queue.put((
+                self._event[:k], self._bar[:k], self._symbol[:k], self._short[:k],
+                self._price[:k], self._size_col[:k], self._pnl[:k], self._commission[:k],
+                self._cash[:k], self._value[:k], self._long_pnl[:k], self._short_pnl[:k],
+            ))
+            self._allocate()
+
+    def _write_loop(self):
+        '''后台线程: 逐块写入文件, 出错时记下异常并丢弃之后的数据, 直到收到结束标记'''
+        f = self._file
+        try:
+            while True:
+                item = self._queue.get()
+                try:
+                    if item is None:
+                        return
+                    if self._error is None:
+                        self._write(f, item)
+                except BaseException as error:
+                    self._error = error
+                finally:
+                    self._queue.task_done()
+        finally:
+            f.close()
+
+    def _write(self, f, item):
+        if isinstance(item, np.ndarray):
+            np.save(f, item)
+            return
+        chunk = np.empty(len(item[0]), dtype=JOURNAL_DTYPE)
+        for name, column in zip(JOURNAL_DTYPE.names, item):
+            chunk[name] = column
+        np.save(f, chunk)
+        f.flush()
+
+    def _raise_error(self):
+        '''重新抛出后台线程写入时的异常'''
+        if self._error is not None:
+            raise self._error
+
+    def flush(self):
+        '''把已记录的事件写入文件并等待写完'''
+        if self._closed:
+            self._raise_error()
+            return
+        self._flush()
+        self._queue.join()
+        self._raise_error()
+
+    def close(self):
+        '''写入剩余事件, 日期索引和标的列表, 等待后台线程结束'''
+        if not self._closed:
+            self._closed = True
+            try:
+                if self._error is None:
+                    self._flush()
+                    dates = self._dates[0].append(self._dates[1:]) if self._dates else pd.Index([])
+                    self._queue.put(np.asarray(dates.astype(str), dtype=str))
+                    symbols = ['' if symbol is None else str(symbol) for symbol in self._symbol_ids]
+                    self._queue.put(np.asarray(symbols, dtype=str))
+            finally:
+                self._queue.put(None)
+                self._writer.join()
+        self._raise_error()
+
+
+def read_journal(path: str) -> pd.DataFrame:
+    '''读取事件日志, 还原日期和标的名称'''
+    chunks = []
+    tables = []
+    with open(path, 'rb') as f:
+        while True:
+            try:
+                array = np.load(f)
+            except (EOFError, ValueError):
+                break
+            if array.dtype.names:
+                chunks.append(array)
+            else:
+                tables.append(array)
+    dates, symbols = tables if len(tables) == 2 else (np.asarray([], dtype=str),) * 2
+
+    events = np.concatenate(chunks) if chunks else np.empty(0, dtype=JOURNAL_DTYPE)
+    df = pd.DataFrame(events)
+
+    try:
+        dates = pd.to_datetime(dates)
+    except (ValueError, TypeError):
+        dates = pd.Index(dates)
+
+    df['event'] = np.asarray(EVENT_NAMES, dtype=object)[df['event'].to_numpy()]
+    df.insert(2, 'date', dates[df['bar'].to_numpy()] if len(dates) else None)
+    symbol_names = np.append(np.asarray(symbols, dtype=object), None)
+    symbol_names[symbol_names == ''] = None
+    df['symbol'] = symbol_names[df['symbol'].to_numpy()]  # -1 对应最后的None
+    return df
+
+def format_journal(journal: Union[str, pd.DataFrame]) -> Iterator[str]:
+    '''按需把事件日志格式化成与原来logging相同风格的文本'''
+    df = read_journal(journal) if isinstance(journal, str) else journal
+    for row in df.itertuples(index=False):
+        if row.event == 'bar':
+            yield f"时间: {row.date}"
+            yield f"可用资金: {row.cash:.2f}"
+            yield f"持仓价值: {row.value:.2f}"
+            yield "\n"
+        elif row.event == 'open':
+            yield (
+                f"开仓: Symbol: {row.symbol}, Short: {row.short}, "
+                f"Price: {row.price:.8f}, Size: {row.size:.8f}, "
+                f"Value: {row.value:.2f}, Open Commission: {row.commission:.8f}"
+            )
+        elif row.event in ('close', 'partial_close'):
+            prefix = "清仓" if row.event == 'close' else "部分清仓"
+            yield (
+                f"{prefix}: Symbol: {row.symbol}, Short: {row.short}, "
+                f"Close Price: {row.price:.8f}, Size: {row.size:.8f}, "
+                f"P/L: {row.pnl:.2f}, Trade Commission: {row.commission:.8f}"
+            )
+        elif row.event == 'equity':
+            yield f"总资产: {row.value:.2f}, 多头收益: {row.long_pnl:.2f}, 空头收益: {row.short_pnl:.2f}"
+            yield "-----------------------\n"
@@ -0,0 +1,489 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+from math import isnan
+from decimal import Decimal, ROUND_DOWN
+
+import logging
+from .trading import Trade, PrecisionConfig
+from .broker import Broker
+
+# 超过这个范围后 float 无法精确区分精度内的相邻刻度,退回到 Decimal 转换
+_EXACT_LIMIT = 2 ** 52
+
+def to_fixed(value, precision: int) -> int:
+    '''
+    把 float/Decimal 转换成按 10**precision 缩放的整数
+    结果与 PrecisionConfig.round_* 对 Decimal(str(value)) 的 ROUND_DOWN 量化完全一致
+    '''
+    scale = 10 ** precision
+    if isinstance(value, Decimal):
+        return int((value * scale).to_integral_value(rounding=ROUND_DOWN))
+
+    value = float(value)
+    n = round(value * scale)
+    # n / scale 能还原出 value, 说明 value 的十进制表示没有超出精度, 不需要截断
+    if -_EXACT_LIMIT < n < _EXACT_LIMIT and n / scale == value:
+        return n
+    return int((Decimal(str(value)) * scale).to_integral_value(rounding=ROUND_DOWN))
+
+def from_fixed(value: int, precision: int) -> Decimal:
+    '''把定点整数还原成对应精度的Decimal'''
+    return Decimal(value).scaleb(-precision)
+
+def _tdiv(a: int, b: int) -> int:
+    '''向零截断的整数除法(对应ROUND_DOWN), b必须为正数'''
+    return a // b if a >= 0 else -(-a // b)
+
+def _rescale(value: int, from_precision: int, to_precision: int) -> int:
+    '''在不同精度之间转换定点整数,降低精度时向零截断'''
+    if to_precision >= from_precision:
+        return value * 10 ** (to_precision - from_precision)
+    return _tdiv(value, 10 ** (from_precision - to_precision))
+
+def _div_fixed(num: int, num_precision: int, den: int, den_precision: int, precision: int) -> int:
+    '''定点整数相除,结果按 precision 向零截断'''
+    shift = den_precision + precision - num_precision
+    if shift >= 0:
+        return _tdiv(num * 10 ** shift, den)
+    return _tdiv(num, den * 10 ** -shift)
+
+
+class FixedPosition:
+    '''
+    定点整数记账模式下的仓位
+    价格,数量,金额等都以按PrecisionConfig精度缩放后的整数保存(*_fp字段)
+    对外的open_price,current_value等属性依旧返回Decimal,与Position保持一致
+    '''
+    __slots__ = (
+        'symbol', 'open_date', 'last_date', 'is_short',
+        'open_price_fp', 'last_price_fp', 'position_size_fp', 'profit_loss_fp',
+        'change_pct_fp', 'current_value_fp', 'open_commission_fp',
+    )
+
+    def __init__(self, symbol: Optional[str], open_date: Optional[datetime], open_price_fp: int,
+                 position_size_fp: int, is_short: bool = False, open_commission_fp: int = 0):
+        self.symbol = symbol
+        self.open_date = open_date
+        self.last_date = open_date
+        self.is_short = is_short
+        self.open_price_fp = open_price_fp
+        self.last_price_fp = open_price_fp
+        self.position_size_fp = position_size_fp
+        self.profit_loss_fp = 0
+        self.change_pct_fp = 0
+        self.current_value_fp = 0
+        self.open_commission_fp = open_commission_fp
+
+    @property
+    def open_price(self) -> Decimal:
+        return from_fixed(self.open_price_fp, PrecisionConfig.PRICE_PRECISION)
+
+    @property
+    def last_price(self) -> Decimal:
+        return from_fixed(self.last_price_fp, PrecisionConfig.PRICE_PRECISION)
+
+    @property
+    def position_size(self) -> Decimal:
+        return from_fixed(self.position_size_fp, PrecisionConfig.SIZE_PRECISION)
+
+    @property
+    def profit_loss(self) -> Decimal:
+        return from_fixed(self.profit_loss_fp, PrecisionConfig.VALUE_PRECISION)
+
+    @property
+    def change_pct(self) -> Decimal:
+        return from_fixed(self.change_pct_fp, PrecisionConfig.PCT_PRECISION)
+
+    @property
+    def current_value(self) -> Decimal:
+        return from_fixed(self.current_value_fp, PrecisionConfig.VALUE_PRECISION)
+
+    @property
+    def open_commission(self) -> Decimal:
+        return from_fixed(self.open_commission_fp, PrecisionConfig.COMMISSION_PRECISION)
+
+    def __repr__(self):
+        return (
+            f"FixedPosition(symbol={self.symbol!r}, open_date={self.open_date!r}, "
+            f"last_date={self.last_date!r}, open_price={self.open_price!r}, "
+            f"last_price={self.last_price!r}, position_size={self.position_size!r}, "
+            f"profit_loss={self.profit_loss!r}, is_short={self.is_short!r})"
+        )
+
+    def __str__(self):
+        """美化输出格式"""
+        return (
+            f"Symbol: {self.symbol}, "
+            f"Price: {self.last_price:.8f}, "
+            f"Size: {self.position_size:.8f}, "
+            f"P/L: {self.profit_loss:.2f}, "
+            f"Change: {self.change_pct:.4f}%, "
+            f"Value: {self.current_value:.2f}, "
+            f"Open Commission: {self.open_commission:.8f}"
+        )
+
+
+class FixedBroker(Broker):
+    '''
+    定点整数记账的Broker
+    现金,数量,价格,手续费都以缩放后的整数保存,只在成交时做一次显式的向零截断
+    精度与舍入方式沿用PrecisionConfig,结果与Decimal版本的Broker保持一致
+    cash/assets_value/cumulative_return 等属性对外依旧返回Decimal
+    '''
+    def __init__(self, cash: float, commission: float):
+        self._price_precision = PrecisionConfig.PRICE_PRECISION
+        self._size_precision = PrecisionConfig.SIZE_PRECISION
+        self._value_precision = PrecisionConfig.VALUE_PRECISION
+        self._commission_precision = PrecisionConfig.COMMISSION_PRECISION
+        self._pct_precision = PrecisionConfig.PCT_PRECISION
+        super().__init__(cash, commission)
+
+    # 对外保持Decimal接口
+    @property
+    def cash(self) -> Decimal:
+        return from_fixed(self._cash, self._value_precision)
+
+    @cash.setter
+    def cash(self, value):
+        self._cash = to_fixed(value, self._value_precision)
+
+    @property
+    def assets_value(self) -> Decimal:
+        return from_fixed(self._assets_value, self._value_precision)
+
+    @assets_value.setter
+    def assets_value(self, value):
+        self._assets_value = to_fixed(value, self._value_precision)
+
+    @property
+    def cumulative_return(self) -> Decimal:
+        return from_fixed(self._cumulative_return, self._value_precision)
+
+    @cumulative_return.setter
+    def cumulative_return(self, value):
+        self._cumulative_return = to_fixed(value, self._value_precision)
+
+    @property
+    def commission(self) -> Decimal:
+        return from_fixed(self._commission, self._commission_precision)
+
+    @commission.setter
+    def commission(self, value):
+        self._commission = to_fixed(value, self._commission_precision)
+        self._one_plus_commission = 10 ** self._commission_precision + self._commission
+
+    def _sub_commission(self, value: int, commission: int) -> int:
+        '''金额减去手续费,结果按金额精度截断'''
+        vp, cp = self._value_precision, self._commission_precision
+        p = max(vp, cp)
+        return _rescale(_rescale(value, vp, p) - _rescale(commission, cp, p), p, vp)
+
+    def _size_for_value(self, value: int, price: int) -> int:
+        '''计算给定金额(含手续费)在给定价格下能开的数量'''
+        return _div_fixed(
+            value, self._value_precision,
+            price * self._one_plus_commission, self._price_precision + self._commission_precision,
+            self._size_precision
+        )
+
+    def _update(self, position: FixedPosition, date: datetime, last_price: int):
+        '''更新仓位信息, 与Position.update的计算方式一致'''
+        pp, sp, vp = self._price_precision, self._size_precision, self._value_precision
+        position.last_date = date
+        position.last_price_fp = last_price
+
+        open_price = position.open_price_fp
+        size = position.position_size_fp
+        diff = open_price - last_price if position.is_short else last_price - open_price
+
+        profit_loss = _rescale(diff * size, pp + sp, vp)
+        position.profit_loss_fp = profit_loss
+        position.change_pct_fp = _div_fixed(diff * 100, pp, open_price, pp, self._pct_precision)
+        position.current_value_fp = _rescale(
+            open_price * size + _rescale(profit_loss, vp, pp + sp), pp + sp, vp
+        )
+
+    def open(self, price: float, size: Optional[float] = None, symbol: Optional[str] = None,
+            short=False, is_fractional=False):
+        '''开仓方法'''
+        self._begin_trade()
+        price_fp = 0 if isnan(price) else to_fixed(price, self._price_precision)
+
+        if price_fp <= 0 or (size is not None and (isnan(size) or size <= .0)):
+            print("参数错误，请检查价格和仓位大小是否正确")
+            if self.log_text:
+                logging.info("参数错误，请检查价格和仓位大小是否正确")
+            return False
+
+        # 计算开仓数量
+        if is_fractional and size > 0 and size <= 1:  # 分数仓
+            # Decimal(size)保留了float的全部二进制精度, 这里沿用Decimal计算以保证结果一致
+            price_dec = from_fixed(price_fp, self._price_precision)
+            size_fp = to_fixed(
+                (Decimal(size) * self.cash) / (price_dec * (Decimal(1) + self.commission)),
+                self._size_precision
+            )
+        elif size is not None:  # 固定仓位
+            size_fp = to_fixed(size, self._size_precision)
+        else:  # 全仓
+            size_fp = self._size_for_value(self._cash, price_fp)
+
+        return self._open(price_fp, size_fp, symbol, short)
+
+    def _open(self, price: int, size: int, symbol: Optional[str], short: bool):
+        '''按定点价格和数量建立仓位'''
+        pp, sp, cp = self._price_precision, self._size_precision, self._commission_precision
+
+        # 计算开仓成本和手续费
+        open_commission = _rescale(size * price * self._commission, sp + pp + cp, cp)
+        open_cost = _rescale(size * price * self._one_plus_commission, sp + pp + cp, self._value_precision)
+
+        # 判断资金是否充足
+        tolerance = 100 * self._value_scale
+        if size <= 0 or (self._cash + tolerance) < open_cost:
+            cost = from_fixed(open_cost, self._value_precision)
+            print(f"开仓失败，可用资金不足或仓位大小无效")
+            print(f"可用资金: {self.cash:.2f}, 开仓成本: {cost:.2f}")
+            if self.log_text:
+                logging.info("开仓失败，可用资金不足或仓位大小无效")
+                logging.info(f"可用资金: {self.cash:.2f}, 开仓成本: {cost:.2f}")
+            return False
+
+        # 建立仓位
+        position = FixedPosition(symbol, self.date, price, size, short, open_commission)
+        self._update(position, self.date, price)
+
+        # 更新账户状态
+        self._cash -= open_cost
+        self._assets_value += position.current_value_fp
+        self._add_position(position)
+
+        if self.log_text:
+            logging.info(f"开仓: {position}")
+        if self.journal is not None:
+            self._journal_open(position)
+        return True
+
+    def close(self, price: float, symbol: Optional[str] = None,
+             position: Optional[FixedPosition] = None, size: Optional[float] = None):
+        '''关仓方法'''
+        self._begin_trade()
+        if isnan(price):
+            return False
+        price_fp = to_fixed(price, self._price_precision)
+        size_fp = None if size is None else to_fixed(size, self._size_precision)
+
+        if price_fp <= 0:
+            return False
+
+        if position is None:
+            # 全部平仓会把仓位从列表中原地删除, 按下标遍历, 不复制列表
+            positions = self.symbol_index.get(symbol, [])
+            k = 0
+            while k < len(positions):
+                pos = positions[k]
+                self._close(price_fp, pos, size_fp)
+                if k < len(positions) and positions[k] is pos:
+                    k += 1
+        else:
+            self._close(price_fp, position, size_fp)
+
+        return True
+
+    def _close(self, price: int, position: FixedPosition, size: Optional[int]):
+        '''按定点价格关闭(或部分关闭)仓位'''
+        pp, sp, vp, cp = (self._price_precision, self._size_precision,
+                          self._value_precision, self._commission_precision)
+
+        self._update(position, self.date, price)
+
+        if size is None or size >= position.position_size_fp:
+            # 全部平仓
+            size = position.position_size_fp
+            trade_commission = _rescale(price * size * self._commission, pp + sp + cp, cp)
+            self._cumulative_return = self._sub_commission(
+                self._cumulative_return + position.profit_loss_fp, trade_commission
+            )
+
+            # 创建交易记录
+            trade = Trade(
+                position.symbol, position.is_short, position.open_date, position.last_date,
+                position.open_price, position.last_price, position.position_size,
+                position.profit_loss, position.change_pct,
+                from_fixed(trade_commission, cp), self.cumulative_return
+            )
+            self.trades.append(trade)
+            self.realized_pnl[position.is_short].add(position.profit_loss_fp, trade_commission)
+
+            # 更新账户状态
+            self._assets_value -= position.current_value_fp
+            self._cash = self._sub_commission(self._cash + position.current_value_fp, trade_commission)
+            self._remove_position(position)
+
+            if self.log_text:
+                logging.info(f"清仓: {trade}")
+            if self.journal is not None:
+                self._journal_trade(trade)
+        else:
+            # 部分平仓, 比例沿用Decimal的有效位数计算以保证与Decimal版本一致
+            partial_ratio = Decimal(size) / Decimal(position.position_size_fp)
+            closed_value = to_fixed(position.current_value * partial_ratio, vp)
+            closed_profit_loss_dec = PrecisionConfig.round_value(position.profit_loss * partial_ratio)
+            closed_profit_loss = to_fixed(closed_profit_loss_dec, vp)
+            trade_commission = _rescale(price * size * self._commission, pp + sp + cp, cp)
+
+            # 更新剩余仓位
+            position.position_size_fp -= size
+            self._update(position, self.date, price)
+
+            self._cumulative_return = self._sub_commission(
+                self._cumulative_return + closed_profit_loss, trade_commission
+            )
+
+            # 创建交易记录
+            price_dec = from_fixed(price, pp)
+            open_price = position.open_price
+            trade = Trade(
+                position.symbol, position.is_short, position.open_date, self.date,
+                open_price, price_dec, from_fixed(size, sp), closed_profit_loss_dec,
+                float((price_dec - open_price) / open_price),
+                from_fixed(trade_commission, cp), self.cumulative_return
+            )
+            self.trades.append(trade)
+            self.realized_pnl[position.is_short].add(closed_profit_loss, trade_commission)
+
+            # 更新账户状态
+            self._assets_value -= closed_value
+            self._cash = self._sub_commission(self._cash + closed_value, trade_commission)
+
+            if self.log_text:
+                logging.info(f"部分清仓: {trade}")
+            if self.journal is not None:
+                self._journal_trade(trade, partial=True)
+
+    def order_target_percent(self, symbol: str, target_percent: float, price: float, short=False):
+        '''按目标百分比调整仓位'''
+        self._begin_trade()
+        price_fp = 0 if isnan(price) else to_fixed(price, self._price_precision)
+
+        if price_fp <= 0 or isnan(target_percent) or target_percent < 0 or target_percent > 1:
+            print("参数错误，请检查价格和仓位比例是否正确")
+            return False
+
+        # 计算目标价值和可用资产(预留1%的buffer)
+        total_assets = _tdiv((self._cash + self._assets_value) * 99, 100)
+        numerator, denominator = Decimal(str(target_percent)).as_integer_ratio()
+        target_value = _tdiv(total_assets * numerator, denominator)
+
+        # 查找现有仓位
+        existing_positions = self.symbol_index.get(symbol)
+        existing_position = existing_positions[0] if existing_positions else None
+
+        # 处理目标仓位为0的情况
+        if target_percent == 0:
+            if existing_position:
+                if self.log_text:
+                    logging.info("调仓比例为0, 直接关闭仓位")
+                self._close(price_fp, existing_position, None)
+            return True
+
+        # 处理新开仓的情况
+        if existing_position is None:
+            if self.log_text:
+                logging.info("没有持仓,直接开仓")
+            return self._open_checked(price_fp, self._size_for_value(target_value, price_fp), symbol, short)
+
+        # 调整现有仓位
+        current_value = existing_position.current_value_fp
+        if target_value == current_value:
+            return True
+
+        if target_value > current_value:
+            # 增加仓位
+            size = self._size_for_value(target_value - current_value, price_fp)
+            if self.log_text:
+                logging.info("增加仓位")
+            return self._open_checked(price_fp, size, symbol, short)
+        else:
+            # 减少仓位
+            size_to_reduce = _div_fixed(
+                current_value - target_value, self._value_precision,
+                price_fp, self._price_precision, self._size_precision
+            )
+            if existing_position.position_size_fp > size_to_reduce:
+                if self.log_text:
+                    logging.info("减少仓位")
+                self._close(price_fp, existing_position, size_to_reduce)
+            else:
+                if self.log_text:
+                    logging.info("要减少的仓位大于现有仓位,直接关闭仓位")
+                self._close(price_fp, existing_position, None)
+            return True
+
+    def _open_checked(self, price: int, size: int, symbol: str, short: bool):
+        '''带参数检查的开仓, 对应order_target_percent里调用open的行为'''
+        if size <= 0:
+            print("参数错误，请检查价格和仓位大小是否正确")
+            if self.log_text:
+                logging.info("参数错误，请检查价格和仓位大小是否正确")
+            return False
+        return self._open(price, size, symbol, short)
+
+    def update_positions(self, date: datetime, record):
+        '''按当前bar的收盘价更新所有持仓'''
+        price_precision = self._price_precision
+        for position in self._positions.values():
+            last_price = record.get(
+                (position.symbol, 'Close'),
+                record.get('Close', 0)
+            )
+            if last_price > 0:
+                self._update(position, date, to_fixed(last_price, price_precision))
+
+    def _update_position(self, position: FixedPosition, date: datetime, last_price: float):
+        '''按最新价格更新单个持仓'''
+        self._update(position, date, to_fixed(last_price, self._price_precision))
+
+    def _merge_group(self, positions: List[FixedPosition]) -> FixedPosition:
+        '''按开仓顺序合并同向仓位: 按数量加权开仓价, 累加开仓手续费, 价格取最后一个仓位的'''
+        total_size = 0
+        weighted_open_price = 0
+        open_commission = 0
+        for position in positions:
+            size = position.position_size_fp + total_size
+            if size > 0:
+                weighted_open_price = _tdiv(
+                    total_size * weighted_open_price + position.position_size_fp * position.open_price_fp,
+                    size
+                )
+            else:
+                weighted_open_price = position.open_price_fp
+            total_size = size
+            open_commission += position.open_commission_fp
+
+        first = positions[0]
+        merged = FixedPosition(
+            first.symbol, first.open_date, weighted_open_price, total_size, first.is_short, open_commission
+        )
+        last_date = max(position.last_date for position in positions)
+        self._update(merged, last_date, positions[-1].last_price_fp)
+        return merged
+
+    def update_assets_value(self):
+        '''按持仓最新价值汇总资产价值'''
+        self._assets_value = sum(position.current_value_fp for position in self._positions.values())
+
+    def total_value(self) -> float:
+        '''当前总资产(现金+持仓价值)'''
+        return (self._cash + self._assets_value) / self._value_scale
+
+    def _unrealized_pnl(self) -> Tuple[int, int]:
+        '''多/空头未平仓收益'''
+        long_profit = 0
+        short_profit = 0
+        for position in self.position_book.values():
+            if position.is_short:
+                short_profit += position.profit_loss_fp
+            else:
+                long_profit += position.profit_loss_fp
+        return long_profit, short_profit
@@ -1,5 +1,9 @@
+import numpy as np
 import pandas as pd
 from datetime import timedelta
+from typing import Optional
+
+from .resample import resample_to_higher_freq
 
 def sort_the_factor(factor_data, factor, ascending=False):
     # 排序截面因子数据，默认从高到低
@@ -40,6 +44,65 @@ def classify_factors_into_buckets(factor_data, buckets: int = 5, ascending: bool
     buckets = pd.qcut(sorted_factor_series, buckets, labels=False) + 1 
     return buckets
 
+# 一次性计算整个因子面板的截面排名和分桶
+def factor_rank_matrix(factors_df, factor, buckets: int = 5, ascending: bool = True, duplicates: str = 'raise'):
+    """
+    对整个因子面板按日期做截面排名和分桶, 结果为 日期 x 标的 的矩阵, 回测中按日期取一行即可
+    与 sort_the_factor + classify_factors_into_buckets 的处理方式一致:
+    因子值为NaN或0的标的不参与排名(结果为NaN), 分桶边界为截面分位数(同pd.qcut), 区间左开右闭
+    排名相同的因子值取平均排名, 分在同一个桶
+
+    :param factors_df: 因子数据, 列为 (symbol, factor) 的MultiIndex
+    :param factor: 因子名称
+    :param buckets: 分组数量
+    :param ascending: True 表示因子值越小排名/分桶越靠前, False 则相反
+    :param duplicates: 同pd.qcut, 某天的分桶边界重复(大量相同的因子值)时 'raise' 报错, 'drop' 去掉重复的边界(这天的分桶数变少)
+    :return: (ranks, bucket_labels) 百分位排名(0, 1] 和分桶编号 [1, buckets]
+    """
+    if duplicates not in ('raise', 'drop'):
+        raise ValueError("duplicates 只支持 'raise' 或 'drop'")
+    values, panel, edges = _factor_bucket_edges(factors_df, factor, buckets, ascending)
+    repeated = _repeated_edges(edges)
+    if duplicates == 'raise' and repeated.any():
+        dates = values.index[repeated.any(axis=1)]
+        raise ValueError(f"分桶边界重复, 可以设置 duplicates='drop': {dates[0]} 等{len(dates)}天")
+
+    ranks = pd.DataFrame(panel, index=values.index, columns=values.columns).rank(axis=1, pct=True)
+    labels = _bucket_labels(panel, edges, repeated)
+    bucket_labels = pd.DataFrame(labels, index=values.index, columns=values.columns)
+    return ranks, bucket_labels
+
+def _factor_bucket_edges(factors_df, factor, buckets: int, ascending: bool = True):
+    """取出因子面板(因子值为0的设为NaN, 降序时取反)和每天的分桶边界(与pd.qcut相同的分位数)"""
+    values = factors_df.xs(factor, axis=1, level=1).astype(float)
+    panel = values.to_numpy(copy=True)
+    panel[panel == 0] = np.nan  # 去掉因子值为 0 的标的
+    if not ascending:
+        panel = -panel
+
+    has_valid = (~np.isnan(panel)).any(axis=1)
+    edges = np.full((panel.shape[0], buckets + 1), np.nan)
+    edges[has_valid] = np.nanpercentile(panel[has_valid], np.linspace(0, 1, buckets + 1) * 100, axis=1).T
+    return values, panel, edges
+
+def _repeated_edges(edges: np.ndarray) -> np.ndarray:
+    """与前一个边界相同的分桶边界(pd.qcut 中重复的边界)"""
+    repeated = np.zeros(edges.shape, dtype=bool)
+    repeated[:, 1:] = edges[:, 1:] == edges[:, :-1]
+    return repeated
+
+def _bucket_labels(panel: np.ndarray, edges: np.ndarray, repeated: np.ndarray) -> np.ndarray:
+    """分桶编号: 大于的(不重复的)内部边界数+1, 与 pd.qcut(duplicates='drop') 一致"""
+    labels = np.ones(panel.shape)
+    for k in range(1, edges.shape[1] - 1):
+        labels += (panel > edges[:, k:k + 1]) & ~repeated[:, k:k + 1]
+    labels[np.isnan(panel)] = np.nan
+    return labels
+
+def _descending_order(values: np.ndarray) -> np.ndarray:
+    """按值从高到低排列的下标, 相同的值与 sort_the_factor(sort_values) 的先后顺序一致"""
+    return pd.Series(values).sort_values(ascending=False).index.to_numpy()
+
 
 def calculate_benchmark_net_value(benchmark_df, start_date=None, end_date=None):
     """
@@ -68,11 +131,201 @@ def calculate_benchmark_net_value(benchmark_df, start_date=None, end_date=None):
     return benchmark_df[['benchmark_net_value']]
 
 
+# 因子算子: 输入和输出都是 日期 x 标的 的 DataFrame, 计算在二维数组上一次完成, 不逐个标的循环
+# 时间序列算子(ts_*)沿日期方向滚动, 与 pandas rolling 的结果一致(min_periods 默认等于窗口)
+# 截面算子(cs_*)在每个日期的所有标的之间计算, NaN 不参与计算, 结果仍为 NaN
+_ROLLING_BLOCK = 1 << 22  # 滚动窗口分块计算时每块最多的元素数, 控制中间数组的内存
+
+def _wrap(x: pd.DataFrame, values: np.ndarray) -> pd.DataFrame:
+    return pd.DataFrame(values, index=x.index, columns=x.columns)
+
+def _values(x: pd.DataFrame) -> np.ndarray:
+    return x.to_numpy(dtype=np.float64, na_value=np.nan)
+
+def panel_field(prices_df: pd.DataFrame, field: str) -> pd.DataFrame:
+    '''
+    从 (symbol, field) 大表中取出单个字段的 日期 x 标的 矩阵, 非数值转为NaN
+    '''
+    values = prices_df.xs(field, axis=1, level=1)
+    if not all(pd.api.types.is_numeric_dtype(dtype) for dtype in values.dtypes):
+        values = values.apply(pd.to_numeric, errors='coerce')
+    return values.astype(np.float64)
+
+def factor_frame(**factors: pd.DataFrame) -> pd.DataFrame:
+    '''
+    把若干 日期 x 标的 的因子矩阵合成 (symbol, factor) 列的因子大表,
+    可以直接传给 sort_the_factor / factor_rank_matrix / Backtest(factors=...)
+
+    factor_frame(momentum=ts_return(close, 10), volatility=ts_std(close.pct_change(), 20))
+    '''
+    if not factors:
+        raise ValueError("至少需要一个因子")
+    frames = list(factors.values())
+    index, symbols = frames[0].index, frames[0].columns
+    for frame in frames[1:]:
+        index, symbols = index.union(frame.index), symbols.union(frame.columns, sort=False)
+    values = np.stack([_values(frame.reindex(index=index, columns=symbols)) for frame in frames], axis=2)
+    columns = pd.MultiIndex.from_product([symbols, list(factors)])
+    return pd.DataFrame(values.reshape(len(index), -1), index=index, columns=columns)
+
+def _rolling(values: np.ndarray, window: int, min_periods: Optional[int], func) -> np.ndarray:
+    '''
+    按窗口滚动计算, func(windows, valid, count) 对形如 (行, 标的, 窗口) 的数组沿最后一维聚合
+    窗口内非NaN数量少于 min_periods 时结果为NaN
+    '''
+    if window <= 0:
+        raise ValueError("window 必须是正整数")
+    min_periods = window if min_periods is None else min_periods
+    rows, width = values.shape
+    # 前面补 window-1 行NaN, 开头不足一个窗口的部分按已有数据计算
+    padded = np.concatenate([np.full((window - 1, width), np.nan), values])
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+
+    out = np.full((rows, width), np.nan)
+    step = max(1, _ROLLING_BLOCK // max(1, width * window))
+    for start in range(0, rows, step):
+        block = windows[start:start + step]
+        valid = ~np.isnan(block)
+        count = valid.sum(axis=2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            result = func(block, valid, count)
+        out[start:start + step] = np.where(count >= max(min_periods, 1), result, np.nan)
+    return out
+
+def _rolling_moments(values: np.ndarray, window: int, min_periods: Optional[int]):
+    '''
+    滚动均值和标准差(ddof=1), 用累加和相减得到每个窗口的和与平方和, 与窗口长度无关
+    按行分块重新累加, 每块先减去块内均值, 避免累加和过大时相减的误差
+    '''
+    if window <= 0:
+        raise ValueError("window 必须是正整数")
+    min_periods = max(window if min_periods is None else min_periods, 1)
+    rows, width = values.shape
+    mean, std = np.full((rows, width), np.nan), np.full((rows, width), np.nan)
+    step = max(4 * window, 1024)
+    for start in range(0, rows, step):
+        # 这一块的结果需要从 start - window + 1 行开始的数据
+        head = max(start - window + 1, 0)
+        block = values[head:start + step]
+        valid = ~np.isnan(block)
+        with np.errstate(invalid='ignore'):
+            center = np.where(valid, block, 0.0).sum(axis=0) / np.maximum(valid.sum(axis=0), 1)
+        filled = np.where(valid, block - center, 0.0)
+
+        def window_sum(a):
+            total = np.concatenate([np.zeros((1, width)), np.cumsum(a, axis=0)])
+            lagged = np.concatenate([np.zeros((window, width)), total])[:len(total)]
+            return (total - lagged)[1 + start - head:]
+
+        count = window_sum(valid.astype(np.float64))
+        total, squares = window_sum(filled), window_sum(filled ** 2)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            block_mean = total / count
+            variance = np.maximum(squares - total * block_mean, 0.0) / (count - 1)
+        enough = count >= min_periods
+        mean[start:start + step] = np.where(enough, block_mean + center, np.nan)
+        std[start:start + step] = np.where(enough & (count > 1), np.sqrt(variance), np.nan)
+    return mean, std
+
+def _window_rank(block, valid, count):
+    # 窗口最后一个值在窗口内的百分位排名, 相同值取平均排名, 同 rolling(...).rank(pct=True)
+    current = block[..., -1:]
+    less = (valid & (block < current)).sum(axis=2)
+    equal = (valid & (block == current)).sum(axis=2)
+    rank = (less + (equal + 1) / 2) / count
+    return np.where(np.isnan(current[..., 0]), np.nan, rank)
+
+def delay(x: pd.DataFrame, n: int = 1) -> pd.DataFrame:
+    '''n 期之前的值'''
+    values = _values(x)
+    out = np.full(values.shape, np.nan)
+    if n >= 0:
+        out[n:] = values[:len(values) - n]
+    else:
+        out[:n] = values[-n:]
+    return _wrap(x, out)
+
+def ts_return(x: pd.DataFrame, n: int = 1) -> pd.DataFrame:
+    '''n 期收益率 x / delay(x, n) - 1'''
+    values = _values(x)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _wrap(x, values / _values(delay(x, n)) - 1)
+
+def ts_mean(x: pd.DataFrame, window: int, min_periods: Optional[int] = None) -> pd.DataFrame:
+    '''滚动均值'''
+    return _wrap(x, _rolling_moments(_values(x), window, min_periods)[0])
+
+def ts_std(x: pd.DataFrame, window: int, min_periods: Optional[int] = None) -> pd.DataFrame:
+    '''滚动标准差(ddof=1)'''
+    return _wrap(x, _rolling_moments(_values(x), window, min_periods)[1])
+
+def ts_rank(x: pd.DataFrame, window: int, min_periods: Optional[int] = None) -> pd.DataFrame:
+    '''当前值在过去 window 期中的百分位排名 (0, 1]'''
+    return _wrap(x, _rolling(_values(x), window, min_periods, _window_rank))
+
+def ts_zscore(x: pd.DataFrame, window: int, min_periods: Optional[int] = None) -> pd.DataFrame:
+    '''(x - 滚动均值) / 滚动标准差'''
+    values = _values(x)
+    mean, std = _rolling_moments(values, window, min_periods)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return _wrap(x, (values - mean) / std)
+
+def cs_rank(x: pd.DataFrame) -> pd.DataFrame:
+    '''每个日期的截面百分位排名 (0, 1], 相同值取平均排名, 同 rank(axis=1, pct=True)'''
+    values = _values(x)
+    rows, width = values.shape
+    order = np.argsort(values, axis=1, kind='stable')  # NaN 排在最后
+    ordered = np.take_along_axis(values, order, axis=1)
+
+    # 排序后相同值的区间 [first, last], 平均排名为 (first + last) / 2 + 1
+    positions = np.broadcast_to(np.arange(width), (rows, width))
+    starts = np.ones((rows, width), dtype=bool)
+    starts[:, 1:] = ordered[:, 1:] != ordered[:, :-1]
+    ends = np.ones((rows, width), dtype=bool)
+    ends[:, :-1] = starts[:, 1:]
+    first = np.maximum.accumulate(np.where(starts, positions, 0), axis=1)
+    last = np.minimum.accumulate(np.where(ends, positions, width)[:, ::-1], axis=1)[:, ::-1]
+
+    count = (~np.isnan(values)).sum(axis=1, keepdims=True)
+    ranks = np.empty((rows, width))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        np.put_along_axis(ranks, order, ((first + last) / 2 + 1) / count, axis=1)
+    ranks[np.isnan(values)] = np.nan
+    return _wrap(x, ranks)
+
+def cs_demean(x: pd.DataFrame) -> pd.DataFrame:
+    '''减去每个日期的截面均值'''
+    values = _values(x)
+    valid = ~np.isnan(values)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean = np.where(valid, values, 0.0).sum(axis=1, keepdims=True) / valid.sum(axis=1, keepdims=True)
+    return _wrap(x, values - mean)
+
+def cs_zscore(x: pd.DataFrame) -> pd.DataFrame:
+    '''截面标准化 (x - 截面均值) / 截面标准差(ddof=1)'''
+    demeaned = _values(cs_demean(x))
+    valid = ~np.isnan(demeaned)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(np.where(valid, demeaned ** 2, 0.0).sum(axis=1, keepdims=True) / (valid.sum(axis=1, keepdims=True) - 1))
+        return _wrap(x, demeaned / std)
+
+def winsorize(x: pd.DataFrame, lower: float = 0.025, upper: float = 0.975) -> pd.DataFrame:
+    '''截面去极值: 每个日期把超出 [lower, upper] 分位数的值截断到分位数上'''
+    if not 0 <= lower <= upper <= 1:
+        raise ValueError("分位数需要满足 0 <= lower <= upper <= 1")
+    values = _values(x)
+    bounds = np.full((len(values), 2), np.nan)
+    has_valid = (~np.isnan(values)).any(axis=1)
+    if has_valid.any():
+        bounds[has_valid] = np.nanquantile(values[has_valid], [lower, upper], axis=1).T
+    return _wrap(x, np.clip(values, bounds[:, :1], bounds[:, 1:]))
+
+
 # 修饰符
 def run_weekly(method):
     def wrapper(self, i, record):
         # 获取当前日期
-        date = self.data.index[i]
+        date = self.date
         
         # 检查是否达到下次运行时间
         if not hasattr(self, '_next_run_date') or date >= self._next_run_date:
@@ -88,7 +341,7 @@ def run_weekly(method):
 def run_monthly(method):
     def wrapper(self, i, record):
         # 获取当前日期
-        date = self.data.index[i]
+        date = self.date
         
         # 检查是否达到下次运行时间
         if not hasattr(self, '_next_run_date') or date >= self._next_run_date:
@@ -100,46 +353,3 @@ def run_monthly(method):
             return result
         
     return wrapper
-
-
-def resample_to_higher_freq(df, target_freq='1D'):
-    """
-    将低级别 K线数据合并成高级别数据
-    :param df: 低级别的K线数据，包含列 ["Open time", "Close time", "Open", "High", "Low", "Close", "Volume", ...]
-    :param target_freq: 目标频率，例如 "1D" 表示合并成日级别数据
-    :return: 合并后的 DataFrame
-    """
-
-    # 确保 Open time 为 datetime 类型
-    df['Open time'] = pd.to_datetime(df['Open time'])
-
-    # 设置 Open time 为索引，以便 resample 操作
-    df = df.set_index('Open time')
-
-    # 定义合并逻辑
-    resampled = df.resample(target_freq).agg({
-        'Open': 'first',              # 第一个 Open 值
-        'High': 'max',                # 最高价
-        'Low': 'min',                 # 最低价
-        'Close': 'last',              # 最后一个 Close 值
-        'Volume': 'sum',              # 成交量总和
-        'Quote asset volume': 'sum',  # Quote asset volume 总和
-        'Number of trades': 'sum',    # 成交笔数总和
-        'Taker buy base asset volume': 'sum',  # 主动买入成交量总和
-        'Taker buy quote asset volume': 'sum'  # 主动买入成交额总和
-    })
-
-    # 重新创建 Close time 列，表示每个周期的结束时间
-    resampled['Close time'] = resampled.index + pd.to_timedelta(target_freq) - pd.Timedelta(milliseconds=1)
-
-    # 将索引重置为普通列
-    resampled = resampled.reset_index().rename(columns={"Open time": "Open time"})
-
-    # 调整列顺序
-    resampled = resampled[[
-        'Open time', 'Close time', 'Open', 'High', 'Low', 'Close',
-        'Volume', 'Quote asset volume', 'Number of trades',
-        'Taker buy base asset volume', 'Taker buy quote asset volume'
-    ]]
-
-    return resampled
\ No newline at end of file
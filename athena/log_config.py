@@ -4,6 +4,11 @@ from dotenv import load_dotenv
 load_dotenv()
 
 log_path = os.getenv('log_path')
+# 结构化事件日志的默认路径: 放在文本日志旁边, 没有配置log_path时放在athena/log目录下
+journal_path = os.getenv('journal_path') or (
+    os.path.splitext(log_path)[0] + '.journal' if log_path
+    else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'log', 'backtest.journal')
+)
 
 def setup_logging():
     logging.basicConfig(
@@ -11,4 +16,4 @@ def setup_logging():
         filemode='w',  
         level=logging.INFO, 
         format='%(message)s'
-    )
\ No newline at end of file
+    )
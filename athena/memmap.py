@@ -0,0 +1,70 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+# 内存映射面板的目录结构:
+#   values.npy   按原始列顺序保存的 日期 x (symbol, field) float64 二维数组(行优先, 连续)
+#   dates.npy    日期索引(int64 纳秒)
+#   columns.json 列 (symbol, field) 和索引名称
+# 多个回测进程打开同一个目录时共享操作系统的页缓存, 不需要各自复制一份价格表
+
+def save_memmap_panel(panel_df: pd.DataFrame, directory: str):
+    '''
+    把 (symbol, field) 大表写成内存映射面板, 数值统一保存为float64
+    :param panel_df: 索引为日期, 列为 (symbol, field) 的 DataFrame
+    :param directory: 输出目录
+    '''
+    if not isinstance(panel_df.columns, pd.MultiIndex):
+        raise ValueError("输入的 DataFrame 的列必须是 (symbol, field) 的多重索引")
+    if not isinstance(panel_df.index, pd.DatetimeIndex):
+        raise ValueError("输入的 DataFrame 必须以时间作为索引 (DatetimeIndex)")
+
+    os.makedirs(directory, exist_ok=True)
+    values = np.lib.format.open_memmap(
+        os.path.join(directory, 'values.npy'), mode='w+', dtype=np.float64, shape=panel_df.shape
+    )
+    values[:] = panel_df.to_numpy(dtype=np.float64)
+    values.flush()
+    del values
+
+    np.save(os.path.join(directory, 'dates.npy'), panel_df.index.asi8)
+    with open(os.path.join(directory, 'columns.json'), 'w') as f:
+        json.dump({'index_name': panel_df.index.name, 'columns': [list(column) for column in panel_df.columns]}, f)
+
+def open_memmap_panel(directory: str, mode: str = 'r', start_date=None, end_date=None) -> pd.DataFrame:
+    '''
+    打开内存映射面板, 返回直接建立在映射数组上的DataFrame(不复制数据), 可以直接传给Backtest
+    :param mode: 'r' 只读, 'c' 写时复制(修改只在当前进程可见), 'r+' 读写
+    :param start_date / end_date: 日期范围, 按行切片, 仍然是映射数组的视图
+    '''
+    values = np.load(os.path.join(directory, 'values.npy'), mmap_mode=mode)
+    dates = np.load(os.path.join(directory, 'dates.npy'))
+    with open(os.path.join(directory, 'columns.json')) as f:
+        meta = json.load(f)
+
+    index = pd.DatetimeIndex(dates.view('datetime64[ns]'), name=meta['index_name'])
+    start = index.searchsorted(pd.to_datetime(start_date), side='left') if start_date else 0
+    stop = index.searchsorted(pd.to_datetime(end_date), side='right') if end_date else len(index)
+
+    columns = pd.MultiIndex.from_tuples([tuple(column) for column in meta['columns']])
+    return pd.DataFrame(values[start:stop], index=index[start:stop], columns=columns, copy=False)
+
+def memmap_field(panel_df: pd.DataFrame, field: str) -> pd.DataFrame:
+    '''
+    单个字段的 日期 x 标的 表
+    open_memmap_panel 返回的面板上取出的是映射数组的跨步视图, 不复制数据
+    '''
+    positions = np.flatnonzero(panel_df.columns.get_level_values(1) == field)
+    if len(positions) == 0:
+        raise ValueError(f"面板中没有字段 {field}")
+
+    values = panel_df.to_numpy()
+    step = positions[1] - positions[0] if len(positions) > 1 else 1
+    if len(positions) > 1 and not np.all(np.diff(positions) == step):
+        # 字段列不等距时只能复制
+        return pd.DataFrame(values[:, positions], index=panel_df.index,
+                            columns=panel_df.columns.get_level_values(0)[positions])
+    view = values[:, positions[0]:positions[-1] + 1:step]
+    return pd.DataFrame(view, index=panel_df.index,
+                        columns=panel_df.columns.get_level_values(0)[positions], copy=False)
@@ -0,0 +1,135 @@
+from typing import Dict, Optional, Union
+import numpy as np
+import pandas as pd
+
+from .result import Result
+
+_DAY = pd.Timedelta(days=1).value
+_YEAR = pd.Timedelta(days=365.25).value
+
+def infer_periods_per_year(index) -> float:
+    '''
+    根据时间索引推断每年的bar数量
+    日线及日内数据: 每天的bar数 x 每年的天数(有周末数据时按365天, 否则按252个交易日),
+    例如A股日线252, 加密货币日线365, 加密货币15分钟线 96 x 365
+    周线、月线等低于日频的数据按平均间隔折算
+    '''
+    index = pd.DatetimeIndex(index)
+    if len(index) < 2:
+        raise ValueError("至少需要两个时间点才能推断频率")
+    steps = np.diff(index.asi8)
+    if np.median(steps) > _DAY:
+        return _YEAR / ((index.asi8[-1] - index.asi8[0]) / (len(index) - 1))
+    days_per_year = 365 if (index.dayofweek >= 5).any() else 252
+    bars_per_day = np.median(np.unique(index.normalize().asi8, return_counts=True)[1])
+    return float(days_per_year * bars_per_day)
+
+def _benchmark_net_value(benchmark, index) -> Optional[np.ndarray]:
+    '''基准净值对齐到策略的时间索引, 可以传入净值序列或包含 benchmark_net_value 列的 DataFrame'''
+    if benchmark is None:
+        return None
+    if isinstance(benchmark, pd.DataFrame):
+        if 'benchmark_net_value' in benchmark.columns:
+            benchmark = benchmark['benchmark_net_value']
+        elif benchmark.shape[1] == 1:
+            benchmark = benchmark.iloc[:, 0]
+        else:
+            return None
+    if len(benchmark) == 0:
+        return None
+    return benchmark.reindex(index, method='ffill').to_numpy(dtype=np.float64)
+
+def _moments(values: np.ndarray, mask: np.ndarray):
+    '''按列计算 mask 内的数量、均值、标准差(ddof=1), 以及NaN处为0的离差'''
+    count = mask.sum(axis=0)
+    mean = np.where(mask, values, 0.0).sum(axis=0) / count
+    deviation = np.where(mask, values - mean, 0.0)
+    std = np.sqrt(np.einsum('ij,ij->j', deviation, deviation) / (count - 1))
+    return count, mean, std, deviation
+
+def metrics_matrix(net_values: np.ndarray, periods_per_year: float, benchmark: Optional[np.ndarray] = None,
+                   risk_free: float = 0.0) -> Dict[str, np.ndarray]:
+    '''
+    对 日期 x 回测 的净值矩阵一次性计算所有指标, 每个指标返回长度为回测数量的数组
+    不同回测长度不同时用NaN补齐, NaN不参与计算
+    :param benchmark: 与净值矩阵行对齐的基准净值(一维)
+    :param risk_free: 年化无风险收益率
+    '''
+    values = np.asarray(net_values, dtype=np.float64)
+    if values.ndim == 1:
+        values = values[:, None]
+    columns = np.arange(values.shape[1])
+    rows = np.arange(len(values))[:, None]
+    valid = ~np.isnan(values)
+    periods = periods_per_year
+    rf = (1 + risk_free) ** (1 / periods) - 1  # 每期无风险收益
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        returns = values[1:] / values[:-1] - 1
+        paired = ~np.isnan(returns)
+        count, mean, std, _ = _moments(returns, paired)
+
+        # 年化收益: 首尾净值的几何年化
+        first = values[valid.argmax(axis=0), columns]
+        last = values[len(values) - 1 - valid[::-1].argmax(axis=0), columns]
+        annual_return = (last / first) ** (periods / count) - 1
+
+        downside = np.where(paired, np.minimum(returns - rf, 0.0), 0.0)
+        downside = np.sqrt(np.einsum('ij,ij->j', downside, downside) / count)
+
+        # 最大回撤及持续时间(从前一个高点到恢复或结束的bar数)
+        peak = np.fmax.accumulate(values, axis=0)
+        drawdown = values / peak - 1
+        max_drawdown = np.where(valid, drawdown, np.inf).min(axis=0)
+        last_peak = np.maximum.accumulate(np.where(drawdown < 0, 0, rows), axis=0)
+        duration = (rows - last_peak).max(axis=0).astype(np.float64)
+
+        metrics = {
+            'annual_return': annual_return,
+            'annual_volatility': std * np.sqrt(periods),
+            'sharpe': (mean - rf) / std * np.sqrt(periods),
+            'sortino': (mean - rf) / downside * np.sqrt(periods),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_duration': duration,
+            'calmar': annual_return / np.abs(max_drawdown),
+        }
+        if benchmark is not None:
+            benchmark = np.asarray(benchmark, dtype=np.float64)
+            market = np.broadcast_to((benchmark[1:] / benchmark[:-1] - 1)[:, None], returns.shape)
+            both = paired & ~np.isnan(market)
+            n, strategy_mean, _, strategy_deviation = _moments(returns, both)
+            _, market_mean, market_std, market_deviation = _moments(market, both)
+            covariance = np.einsum('ij,ij->j', strategy_deviation, market_deviation) / (n - 1)
+            beta = covariance / market_std ** 2
+            _, active_mean, tracking, _ = _moments(returns - market, both)
+            metrics['beta'] = beta
+            # 詹森alpha, 按每期收益年化
+            metrics['alpha'] = ((strategy_mean - rf) - beta * (market_mean - rf)) * periods
+            metrics['tracking_error'] = tracking * np.sqrt(periods)
+            metrics['information_ratio'] = active_mean / tracking * np.sqrt(periods)
+    return metrics
+
+def calculate_metrics(net_value: Union[pd.Series, pd.DataFrame, Result], benchmark=None,
+                      periods_per_year: Optional[float] = None, risk_free: float = 0.0):
+    '''
+    回测指标: 年化收益, 年化波动率, 夏普, 索提诺, 最大回撤及持续bar数, 卡玛比率,
+    有基准时还有 beta, alpha, 跟踪误差, 信息比率
+    不依赖绘图模块, 返回原始浮点数
+
+    :param net_value: 净值序列、Result, 或 日期 x 回测 的净值表(参数扫描时一次计算所有回测)
+    :param benchmark: 基准净值序列或 calculate_benchmark_net_value 的结果, 传入Result时默认使用其中的基准
+    :param periods_per_year: 每年的bar数量, 默认根据索引推断
+    :param risk_free: 年化无风险收益率
+    :return: Series/Result 返回 {指标: float}, DataFrame 返回 回测 x 指标 的表
+    '''
+    if isinstance(net_value, Result):
+        benchmark = net_value.benchmark if benchmark is None else benchmark
+        net_value = net_value.net_value
+    if periods_per_year is None:
+        periods_per_year = infer_periods_per_year(net_value.index)
+    benchmark = _benchmark_net_value(benchmark, net_value.index)
+
+    metrics = metrics_matrix(net_value.to_numpy(dtype=np.float64), periods_per_year, benchmark, risk_free)
+    if isinstance(net_value, pd.DataFrame):
+        return pd.DataFrame(metrics, index=net_value.columns)
+    return {key: float(value[0]) for key, value in metrics.items()}
@@ -0,0 +1,91 @@
+from typing import Dict, Hashable, List, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+class FactorPanel:
+    '''
+    因子面板: 日期 x 因子 x 标的 的三维连续数组
+    日期轴可以预先对齐到Backtest的bar索引, 标的轴对齐到Backtest.symbols
+    回测中用 panel.cross_section(i, 'momentum') 取第i根bar的截面因子, 返回的是数组视图, 不复制数据
+    '''
+    def __init__(self, values: np.ndarray, dates: Sequence, factors: Sequence[Hashable], symbols: Sequence[Hashable]):
+        values = np.ascontiguousarray(values, dtype=float)
+        if values.shape != (len(dates), len(factors), len(symbols)):
+            raise ValueError("values 的形状必须是 (日期数, 因子数, 标的数)")
+
+        self.values = values
+        self.dates = pd.Index(dates)
+        self.factors: List[Hashable] = list(factors)
+        self.symbols: List[Hashable] = list(symbols)
+        self.factor_index: Dict[Hashable, int] = {factor: j for j, factor in enumerate(self.factors)}
+        self.symbol_index: Dict[Hashable, int] = {symbol: k for k, symbol in enumerate(self.symbols)}
+
+    @classmethod
+    def from_frame(cls, factors_df: pd.DataFrame, index: Optional[Sequence] = None,
+                   symbols: Optional[Sequence] = None, factors: Optional[Sequence] = None) -> 'FactorPanel':
+        '''
+        从 (symbol, factor) MultiIndex列的因子表构建
+        :param index: 对齐的日期轴(例如Backtest.index), 缺失的日期为NaN
+        :param symbols: 对齐的标的轴(例如Backtest.symbols), 缺失的标的为NaN
+        :param factors: 需要的因子, 默认全部
+        '''
+        columns = factors_df.columns
+        if not isinstance(columns, pd.MultiIndex):
+            raise ValueError("因子表的列必须是 (symbol, factor) 的MultiIndex")
+
+        symbols = list(columns.get_level_values(0).unique() if symbols is None else symbols)
+        factors = list(columns.get_level_values(1).unique() if factors is None else factors)
+        dates = factors_df.index if index is None else pd.Index(index)
+
+        aligned = factors_df.reindex(
+            index=dates,
+            columns=pd.MultiIndex.from_product([symbols, factors])
+        )
+        values = aligned.to_numpy(dtype=float).reshape(len(dates), len(symbols), len(factors))
+        return cls(values.transpose(0, 2, 1), dates, factors, symbols)
+
+    @classmethod
+    def from_hdf(cls, path: str, key: str = 'factors', index: Optional[Sequence] = None,
+                 symbols: Optional[Sequence] = None, factors: Optional[Sequence] = None) -> 'FactorPanel':
+        '''从.h5文件读取因子表并构建'''
+        return cls.from_frame(pd.read_hdf(path, key), index=index, symbols=symbols, factors=factors)
+
+    def align(self, index: Sequence, symbols: Sequence) -> 'FactorPanel':
+        '''对齐到新的日期轴和标的轴'''
+        dates = pd.Index(index)
+        rows = self.dates.get_indexer(dates)
+        cols = np.array([self.symbol_index.get(symbol, -1) for symbol in symbols], dtype=int)
+
+        row_at, col_at = np.flatnonzero(rows >= 0), np.flatnonzero(cols >= 0)
+        all_factors = np.arange(len(self.factors))
+
+        values = np.full((len(dates), len(self.factors), len(cols)), np.nan)
+        values[np.ix_(row_at, all_factors, col_at)] = \
+            self.values[np.ix_(rows[row_at], all_factors, cols[col_at])]
+        return FactorPanel(values, dates, self.factors, symbols)
+
+    def get_loc(self, date) -> int:
+        '''日期对应的行号'''
+        return self.dates.get_loc(date)
+
+    def cross_section(self, i: int, factor: Hashable) -> np.ndarray:
+        '''第i个日期的截面因子值(按symbols顺序), 返回视图'''
+        return self.values[i, self.factor_index[factor]]
+
+    def factor(self, factor: Hashable) -> pd.DataFrame:
+        '''单个因子的 日期 x 标的 表'''
+        return pd.DataFrame(self.values[:, self.factor_index[factor], :],
+                            index=self.dates, columns=self.symbols, copy=False)
+
+    def to_frame(self) -> pd.DataFrame:
+        '''还原成 (symbol, factor) MultiIndex列的因子表'''
+        values = self.values.transpose(0, 2, 1).reshape(len(self.dates), -1)
+        columns = pd.MultiIndex.from_product([self.symbols, self.factors])
+        return pd.DataFrame(values, index=self.dates, columns=columns)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __repr__(self):
+        return (f"FactorPanel(dates={len(self.dates)}, factors={self.factors}, "
+                f"symbols={len(self.symbols)})")
@@ -1,5 +1,3 @@
-import matplotlib.pyplot as plt
-import matplotlib.font_manager as fm
 import pandas as pd
 import os
 import warnings
@@ -9,28 +7,40 @@ warnings.filterwarnings('ignore')
 from typing import Type
 from .result import Result  # 导入定义 Result 的模块
 from .factor_research import run_factor_multiple_returns
+from .metrics import calculate_metrics
 
 from dotenv import load_dotenv
 load_dotenv()
 
-# 配色方案
-color_map = plt.get_cmap('Set1')
-color_map_alpha = plt.get_cmap('Pastel1')
-plt.rc('font', family='Arial')
-
-# 绘图标准用Arial字体，标题用regular_font，其他用italics_font
-# size全部为12
-# pad为12
-# figsize为7,5
-regular_font_path = os.getenv('regular_font')
-legend_font_path = os.getenv('legend_font')
-bold_font_path = os.getenv('bold_font')
-italics_font_path = os.getenv('italics_font')
-
-regular_font = fm.FontProperties(fname=regular_font_path, size=12)
-legend_font = fm.FontProperties(fname=legend_font_path, size=10)
-bold_font = fm.FontProperties(fname=bold_font_path, size=12)
-italics_font = fm.FontProperties(fname=italics_font_path, size=12)
+# matplotlib、配色和字体在第一次绘图时由 _load_style 加载, 只计算指标时不需要导入
+plt = None
+color_map = color_map_alpha = None
+regular_font = legend_font = bold_font = italics_font = None
+
+def _load_style():
+    '''
+    导入matplotlib并设置配色和字体
+    绘图标准用Arial字体，标题用regular_font，其他用italics_font
+    size全部为12
+    pad为12
+    figsize为7,5
+    '''
+    global plt, color_map, color_map_alpha, regular_font, legend_font, bold_font, italics_font
+    if plt is not None:
+        return
+    import matplotlib.pyplot as pyplot
+    import matplotlib.font_manager as fm
+
+    # 配色方案
+    color_map = pyplot.get_cmap('Set1')
+    color_map_alpha = pyplot.get_cmap('Pastel1')
+    pyplot.rc('font', family='Arial')
+
+    regular_font = fm.FontProperties(fname=os.getenv('regular_font'), size=12)
+    legend_font = fm.FontProperties(fname=os.getenv('legend_font'), size=10)
+    bold_font = fm.FontProperties(fname=os.getenv('bold_font'), size=12)
+    italics_font = fm.FontProperties(fname=os.getenv('italics_font'), size=12)
+    plt = pyplot
 
 class Visualization:
     def __init__(self, res: Result):
@@ -38,6 +48,7 @@ class Visualization:
         self.result = res
 
     def plot_portfolio_returns(self, use_benchmark: bool = True):
+        _load_style()
 
         plt.figure(figsize=(10, 5))
         plt.plot(self.result.net_value.index, self.result.net_value, color = color_map(0), lw=2, label='Portfolio Returns')
@@ -53,6 +64,7 @@ class Visualization:
         plt.show()
     
     def plot_long_short_portfolio_returns(self):
+        _load_style()
 
         long_returns = self.result.long_returns + self.result.returns[0]
         short_returns = self.result.short_returns + self.result.returns[0]
@@ -73,6 +85,7 @@ class Visualization:
         plt.show()
     
     def plot_factor_multiple_returns(self, layered_results, long_and_short=None, label='Long and Short Portfolio'):
+        _load_style()
         # 可视化各层收益差异
         plt.figure(figsize=(10, 5))
         
@@ -91,59 +104,28 @@ class Visualization:
 
     def calculate_metrics(self):
         """
-        计算回测指标：
+        计算回测指标(格式化为字符串, 便于打印)：
         - 年化收益率
         - 年化波动率
         - 最大回撤
         - 夏普比率
-        - 收益基准超额
+        - 相对基准的alpha
+        指标由 athena.metrics 计算, 年化按索引推断的bar频率; 需要原始数值时直接使用 calculate_metrics
         """
-        metrics = {}
-        net_value = self.result.net_value  # 策略净值
-        returns = net_value.pct_change().dropna()  # 策略每日收益率
+        risk_free_rate = 0.02  # 假设年化无风险收益为 2%
         benchmark_net_value = self.result.benchmark['benchmark_net_value']  # 基准净值
-        benchmark_returns = benchmark_net_value.pct_change().dropna()  # 基准每日收益率
-        
-        # 策略年化收益率
-        strategy_total_return = net_value.iloc[-1] / net_value.iloc[0] - 1
-        strategy_annualized_return = (1 + strategy_total_return) ** (252 / len(net_value)) - 1  # 假设每年252个交易日
-        metrics['strategy_annualized_return'] = self.format_as_percentage(strategy_annualized_return)
-
-        # 基准年化收益率
-        benchmark_total_return = benchmark_net_value.iloc[-1] / benchmark_net_value.iloc[0] - 1
-        benchmark_annualized_return = (1 + benchmark_total_return) ** (252 / len(benchmark_net_value)) - 1  # 假设每年252个交易日
-        metrics['benchmark_annualized_return'] = self.format_as_percentage(benchmark_annualized_return)
-
-        # 策略年化波动率
-        strategy_annualized_volatility = returns.std() * np.sqrt(252)
-        metrics['strategy_annualized_volatility'] = self.format_as_percentage(strategy_annualized_volatility)
-
-        # 基准年化波动率
-        benchmark_returns = benchmark_net_value.pct_change().dropna()  # 使用每日收益率
-        benchmark_annualized_volatility = benchmark_returns.std() * np.sqrt(252)
-        metrics['benchmark_annualized_volatility'] = self.format_as_percentage(benchmark_annualized_volatility)
-        
-        # 策略最大回撤 (Maximum Drawdown)
-        rolling_max = net_value.cummax()
-        drawdown = net_value / rolling_max - 1
-        strategy_max_drawdown = drawdown.min()
-        metrics['strategy_max_drawdown'] = self.format_as_percentage(strategy_max_drawdown)
-        
-        # 基准最大回撤 (Maximum Drawdown)
-        rolling_max = benchmark_net_value.cummax()
-        drawdown = benchmark_net_value / rolling_max - 1
-        benchmark_max_drawdown = drawdown.min()
-        metrics['benchmark_max_drawdown'] = self.format_as_percentage(benchmark_max_drawdown)
+        strategy = calculate_metrics(self.result.net_value, benchmark=benchmark_net_value, risk_free=risk_free_rate)
+        benchmark = calculate_metrics(benchmark_net_value)
 
-        # 夏普比率 (Sharpe Ratio)
-        risk_free_rate = 0.02  # 假设年化无风险收益为 2%
-        sharpe_ratio = (strategy_annualized_return - risk_free_rate) / strategy_annualized_volatility
-        metrics['sharpe_ratio'] = self.format_as_float(sharpe_ratio)
-        
-        # 收益基准超额 (Alpha/Excess Return)
-        benchmark_total_return = benchmark_net_value.iloc[-1] / benchmark_net_value.iloc[0] - 1
-        alpha = strategy_annualized_return - benchmark_total_return
-        metrics['alpha'] = self.format_as_percentage(alpha)
+        metrics = {}
+        metrics['strategy_annualized_return'] = self.format_as_percentage(strategy['annual_return'])
+        metrics['benchmark_annualized_return'] = self.format_as_percentage(benchmark['annual_return'])
+        metrics['strategy_annualized_volatility'] = self.format_as_percentage(strategy['annual_volatility'])
+        metrics['benchmark_annualized_volatility'] = self.format_as_percentage(benchmark['annual_volatility'])
+        metrics['strategy_max_drawdown'] = self.format_as_percentage(strategy['max_drawdown'])
+        metrics['benchmark_max_drawdown'] = self.format_as_percentage(benchmark['max_drawdown'])
+        metrics['sharpe_ratio'] = self.format_as_float(strategy['sharpe'])
+        metrics['alpha'] = self.format_as_percentage(strategy['alpha'])
 
         return metrics
 
@@ -159,6 +141,7 @@ class Visualization:
         :param res: 回测结果对象 (Result)
         :return: (多头每日开仓金额, 多头每日平仓金额, 空头每日开仓金额, 空头每日平仓金额)
         """
+        _load_style()
         # 1. 记录每日开仓和平仓的成交金额，并区分多空头
         trade_data_long_open = []  # 多头开仓数据
         trade_data_long_close = []  # 多头平仓数据
@@ -0,0 +1,62 @@
+from collections.abc import Mapping, Sequence
+from typing import Any, Dict, Hashable, Iterator
+
+import numpy as np
+import pandas as pd
+
+class BarRecord(Mapping):
+    '''
+    单根bar的只读视图,替代原来 to_dict('records') 生成的字典
+    数据本身存放在BarRecords的二维数组里,这里只保存该行的视图和共享的列索引
+    依旧支持 record[(symbol, 'Close')] 和 record.get(...) 的用法
+    '''
+    __slots__ = ('_row', '_columns')
+
+    def __init__(self, row: np.ndarray, columns: Dict[Hashable, int]):
+        self._row = row
+        self._columns = columns
+
+    def __getitem__(self, key: Hashable) -> Any:
+        return self._row[self._columns[key]]
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        j = self._columns.get(key)
+        if j is None:
+            return default
+        return self._row[j]
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._columns
+
+    def __iter__(self) -> Iterator[Hashable]:
+        return iter(self._columns)
+
+    def __len__(self) -> int:
+        return len(self._columns)
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
+class BarRecords(Sequence):
+    '''
+    按列存储的行情数据
+    整个价格表只保存为一个二维数组,加上一个预先计算好的 (symbol, field) -> 列号 的索引
+    每根bar按需生成BarRecord视图,不会为每根bar单独构造字典
+    '''
+    def __init__(self, data: pd.DataFrame):
+        self.values: np.ndarray = data.to_numpy()
+        self.columns: Dict[Hashable, int] = {key: j for j, key in enumerate(data.columns)}
+
+    def __len__(self) -> int:
+        return self.values.shape[0]
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return BarRecord(self.values[i], self.columns)
+
+    def __iter__(self) -> Iterator[BarRecord]:
+        columns = self.columns
+        for row in self.values:
+            yield BarRecord(row, columns)
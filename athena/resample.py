@@ -0,0 +1,225 @@
+from typing import Dict, Optional
+import numpy as np
+import pandas as pd
+
+# K线字段的聚合规则
+DEFAULT_AGG_FUNCS = {
+    'Open': 'first',                             # 第一个 Open 值
+    'High': 'max',                               # 最高价
+    'Low': 'min',                                # 最低价
+    'Close': 'last',                             # 最后一个 Close 值
+    'Volume': 'sum',                             # 成交量总和
+    'Quote asset volume': 'sum',                 # Quote asset volume 总和
+    'Number of trades': 'sum',                   # 成交笔数总和
+    'Taker buy base asset volume': 'sum',        # 主动买入成交量总和
+    'Taker buy quote asset volume': 'sum',       # 主动买入成交额总和
+}
+
+_COLUMN_BLOCK = 256  # 每次聚合的列数, 控制中间数组的内存
+
+def _bin_bounds(index: pd.DatetimeIndex, target_freq: str):
+    '''
+    目标频率的分箱: 返回每个箱的标签和对应的行区间 [starts, stops)
+    分箱规则(起点、左右闭合、标签)与 DataFrame.resample 完全一致, 空箱的行区间为空
+    '''
+    counts = pd.Series(np.ones(len(index), dtype=np.int64), index=index).resample(target_freq).sum()
+    stops = np.cumsum(counts.to_numpy())
+    starts = stops - counts.to_numpy()
+    return counts.index, starts, stops
+
+def _aggregate(values: np.ndarray, starts: np.ndarray, stops: np.ndarray, how: str) -> np.ndarray:
+    '''
+    按行区间聚合, 忽略NaN, 与pandas的 first/last/max/min/sum 一致
+    values 为 列 x 时间 的二维数组(每行是一列的时间序列, 连续存放), 返回 列 x 箱
+    values 是调用方取出的副本, 求和时会直接在上面把NaN替换为0
+    '''
+    nonempty = stops > starts
+    out_shape = (values.shape[0], len(starts))
+    if how == 'sum':
+        out = np.zeros(out_shape)
+        if nonempty.any():
+            values[np.isnan(values)] = 0.0
+            out[:, nonempty] = np.add.reduceat(values, starts[nonempty], axis=1)
+        return out
+
+    out = np.full(out_shape, np.nan)
+    if not nonempty.any():
+        return out
+    if how in ('max', 'min'):
+        ufunc = np.fmax if how == 'max' else np.fmin
+        out[:, nonempty] = ufunc.reduceat(values, starts[nonempty], axis=1)
+        return out
+
+    size = values.shape[1]
+    steps = np.arange(size)
+    missing = np.isnan(values)
+    if how == 'last':
+        # 每个时间点及之前最后一个非NaN值的位置, 在箱的最后一个时间点取出
+        last_valid = np.maximum.accumulate(np.where(missing, -1, steps), axis=1)
+        picked = last_valid[:, stops[nonempty] - 1]
+        valid = picked >= starts[nonempty]
+    elif how == 'first':
+        # 每个时间点及之后第一个非NaN值的位置, 在箱的第一个时间点取出
+        first_valid = np.minimum.accumulate(np.where(missing, size, steps)[:, ::-1], axis=1)[:, ::-1]
+        picked = first_valid[:, starts[nonempty]]
+        valid = picked < stops[nonempty]
+    else:
+        raise ValueError(f"不支持的聚合方式: {how}")
+
+    picked = picked.clip(0, size - 1)
+    out[:, nonempty] = np.where(valid, np.take_along_axis(values, picked, axis=1), np.nan)
+    return out
+
+def resample_frame(df: pd.DataFrame, target_freq: str, aggs: Dict) -> pd.DataFrame:
+    '''
+    对所有列一次性重采样, aggs 为 列 -> 'first'/'last'/'max'/'min'/'sum'
+    结果与 df.resample(target_freq).agg(aggs) 相同, 列顺序与aggs一致
+    '''
+    if not isinstance(df.index, pd.DatetimeIndex):
+        raise ValueError("输入的 DataFrame 必须以时间作为索引 (DatetimeIndex)")
+    if not df.index.is_monotonic_increasing:
+        df = df.sort_index(kind='stable')
+
+    columns = list(aggs)
+    positions = df.columns.get_indexer(columns)
+    if (positions < 0).any():
+        raise ValueError("aggs 中的列不在 DataFrame 中")
+    labels, starts, stops = _bin_bounds(df.index, target_freq)
+    # 转置成 列 x 时间, 只有浮点列时是pandas内部数组的视图, 每列的时间序列连续存放
+    values = df.to_numpy(dtype=np.float64).T
+    how = np.array([aggs[column] for column in columns])
+
+    out = np.empty((len(columns), len(labels)))
+    for method in np.unique(how):
+        targets = np.flatnonzero(how == method)
+        for block in range(0, len(targets), _COLUMN_BLOCK):
+            cols = targets[block:block + _COLUMN_BLOCK]
+            out[cols] = _aggregate(values[positions[cols]], starts, stops, method)
+
+    resampled = pd.DataFrame(out.T, index=labels, columns=df.columns[positions])
+    # 整数列求和后仍为整数, 与pandas一致
+    dtypes = df.dtypes.to_numpy()
+    for j, position in enumerate(positions):
+        if how[j] == 'sum' and pd.api.types.is_integer_dtype(dtypes[position]):
+            resampled.isetitem(j, resampled.iloc[:, j].astype(dtypes[position]))
+    return resampled
+
+def _panel_aggs(prices_df: pd.DataFrame, agg_funcs: Optional[Dict[str, str]]) -> Dict:
+    '''(symbol, field) 列的聚合规则, 按标的顺序排列, 跳过没有可重采样字段的标的'''
+    agg_funcs = agg_funcs or DEFAULT_AGG_FUNCS
+    available = set(prices_df.columns)
+    aggs = {}
+    for symbol in prices_df.columns.remove_unused_levels().levels[0]:
+        symbol_aggs = {(symbol, field): how for field, how in agg_funcs.items() if (symbol, field) in available}
+        if not symbol_aggs:
+            print(f"[警告] {symbol} 缺少可重采样的字段，已跳过！")
+        aggs.update(symbol_aggs)
+    return aggs
+
+def resample_multi_index_dataframe(prices_df, target_freq='1D', agg_funcs=None):
+    """
+    将多标的大表按指定的频率进行重采样，例如将15min数据合并成1D。
+    所有标的和字段在一个二维数组上一次性聚合, 不再逐个标的调用resample
+
+    :param prices_df: 包含多索引的K线数据大表，索引为日期，columns为多级索引 (symbol, fields)
+    :param target_freq: 目标频率，例如 '1D' 表示日级别
+    :param agg_funcs: 字段 -> 聚合方式, 默认 DEFAULT_AGG_FUNCS
+    :return: 重采样后的 DataFrame
+    """
+    # 检查索引是否是 DatetimeIndex
+    if not isinstance(prices_df.index, pd.DatetimeIndex):
+        raise ValueError("输入的 DataFrame 必须以时间作为索引 (DatetimeIndex)")
+
+    aggs = _panel_aggs(prices_df, agg_funcs)
+    if not aggs:
+        print("[警告] 未找到可重采样的数据！")
+        return pd.DataFrame()  # 返回空 DataFrame
+    return resample_frame(prices_df, target_freq, aggs)
+
+def append_resampled(resampled_df, new_prices_df, target_freq='1D', agg_funcs=None):
+    """
+    把新的低级别K线追加到已经重采样的大表中, 不需要重新处理历史数据
+    resampled_df 最后一个周期可能还没走完, 与新数据落在同一周期时按聚合规则合并
+    (first取原值, last/max/min/sum与新数据合并)
+
+    要求新数据都在已处理数据之后, 并且目标频率的分箱不依赖数据起点
+    (能整除一天的频率如 '1h', '4h', '1D', 或 'W', 'M' 这类锚定频率)
+
+    :param resampled_df: resample_multi_index_dataframe 的结果
+    :param new_prices_df: 新的低级别K线, 格式与原始大表相同
+    :return: 追加后的重采样大表
+    """
+    aggs = _panel_aggs(new_prices_df, agg_funcs)
+    if not aggs:
+        return resampled_df
+    new = resample_frame(new_prices_df, target_freq, aggs)
+    if resampled_df is None or resampled_df.empty:
+        return new
+
+    columns = resampled_df.columns.append(new.columns.difference(resampled_df.columns, sort=False))
+    dtypes = {**new.dtypes.to_dict(), **resampled_df.dtypes.to_dict()}
+    how = np.array([(agg_funcs or DEFAULT_AGG_FUNCS).get(field) for _, field in columns])
+    # 在一个二维数组上合并, 最后一次性构造DataFrame, 避免在宽表上逐列赋值
+    before_all = resampled_df.reindex(columns=columns).to_numpy(dtype=np.float64)
+    after_all = new.reindex(columns=columns).to_numpy(dtype=np.float64)
+
+    # 两段之间没有数据的周期, 与一次性重采样时的空箱一致
+    last = resampled_df.index[-1]
+    gap = pd.date_range(last, new.index[0], freq=target_freq)[1:-1]
+    is_rest = new.index > last
+    index = resampled_df.index.append(gap).append(new.index[is_rest])
+    values = np.full((len(index), len(columns)), np.nan)
+    values[:len(before_all)] = before_all
+    values[len(index) - is_rest.sum():] = after_all[is_rest]
+
+    if not is_rest.all():
+        rows = resampled_df.index.get_indexer(new.index[~is_rest])
+        before, after = values[rows], after_all[~is_rest]
+        merged = np.where(how == 'first', np.where(np.isnan(before), after, before), after)
+        merged = np.where(how == 'last', np.where(np.isnan(after), before, after), merged)
+        merged = np.where(how == 'max', np.fmax(before, after), merged)
+        merged = np.where(how == 'min', np.fmin(before, after), merged)
+        merged = np.where(how == 'sum', np.nan_to_num(before) + np.nan_to_num(after), merged)
+        values[rows] = merged
+
+    # 空箱(或新数据中没有的标的)的求和为0, 与一次性重采样一致
+    sums = how == 'sum'
+    values[:, sums] = np.where(np.isnan(values[:, sums]), 0.0, values[:, sums])
+    combined = pd.DataFrame(values, index=index, columns=columns)
+    # 整数列求和后仍为整数, 与一次性重采样一致
+    for j, column in enumerate(columns):
+        if sums[j] and pd.api.types.is_integer_dtype(dtypes[column]):
+            combined.isetitem(j, combined.iloc[:, j].astype(dtypes[column]))
+    return combined
+
+def resample_to_higher_freq(df, target_freq='1D'):
+    """
+    将低级别 K线数据合并成高级别数据
+    :param df: 低级别的K线数据，包含列 ["Open time", "Close time", "Open", "High", "Low", "Close", "Volume", ...]
+    :param target_freq: 目标频率，例如 "1D" 表示合并成日级别数据
+    :return: 合并后的 DataFrame
+    """
+
+    # 确保 Open time 为 datetime 类型
+    df['Open time'] = pd.to_datetime(df['Open time'])
+
+    # 设置 Open time 为索引，以便 resample 操作
+    df = df.set_index('Open time')
+
+    # 定义合并逻辑
+    resampled = resample_frame(df, target_freq, DEFAULT_AGG_FUNCS)
+
+    # 重新创建 Close time 列，表示每个周期的结束时间
+    resampled['Close time'] = resampled.index + pd.to_timedelta(target_freq) - pd.Timedelta(milliseconds=1)
+
+    # 将索引重置为普通列
+    resampled = resampled.reset_index()
+
+    # 调整列顺序
+    resampled = resampled[[
+        'Open time', 'Close time', 'Open', 'High', 'Low', 'Close',
+        'Volume', 'Quote asset volume', 'Number of trades',
+        'Taker buy base asset volume', 'Taker buy quote asset volume'
+    ]]
+
+    return resampled
@@ -14,4 +14,7 @@ class Result:
     net_value: pd.Series # 净值
     trades: List[Trade] # 交易列表
     open_positions: List[Position]
-    benchmark: pd.DataFrame
\ No newline at end of file
+    benchmark: pd.DataFrame
+
+    turnover: Optional[pd.Series] = None # 换手率(WeightBacktest)
+    commission: Optional[pd.Series] = None # 手续费(WeightBacktest)
@@ -0,0 +1,109 @@
+from typing import Iterable, Optional
+import numpy as np
+import pandas as pd
+
+class Schedule:
+    '''
+    调仓日程, 在回测开始前根据bar索引一次性解析出需要调用next的bar
+    Backtest(..., schedule=month_end()) 时引擎只在这些bar上调用next,
+    两次调仓之间的bar没有成交, 由Broker按价格矩阵一次性结算持仓价值和收益
+
+    rule:
+    'month_end' / 'month_start': 每月最后/第一根bar
+    'week_end' / 'week_start': 每周最后/第一根bar
+    'day_end' / 'day_start': 每天最后/第一根bar(日内数据按天调仓)
+    'every_n_bars': 从offset开始每n根bar
+    'dates': 指定日期, 每个日期取当天或之后的第一根bar
+    '''
+    _PERIODS = {'month': 'M', 'week': 'W', 'day': 'D'}
+
+    def __init__(self, rule: str, n: Optional[int] = None, offset: int = 0,
+                 dates: Optional[Iterable] = None):
+        period, _, edge = rule.rpartition('_')
+        if rule == 'every_n_bars':
+            if n is None or n <= 0:
+                raise ValueError("every_n_bars 需要正整数 n")
+        elif rule == 'dates':
+            if dates is None:
+                raise ValueError("dates 需要传入日期列表")
+            dates = pd.DatetimeIndex([pd.Timestamp(date) for date in dates]).sort_values()
+        elif period not in self._PERIODS or edge not in ('start', 'end'):
+            raise ValueError(f"不支持的调仓规则: {rule}")
+
+        self.rule = rule
+        self.n = n
+        self.offset = offset
+        self.dates = dates
+
+    def resolve(self, index: Iterable, start: int = 0, previous=None, following=None) -> np.ndarray:
+        '''
+        返回需要调仓的bar序号(升序)
+        分段读取数据时可以逐段解析: start 为这一段第一根bar在整个回测中的序号,
+        previous / following 为上一段最后一根bar和下一段第一根bar的时间(没有则为None)
+        '''
+        index = pd.DatetimeIndex(index)
+        size = len(index)
+        if size == 0:
+            return np.empty(0, dtype=int)
+
+        if self.rule == 'every_n_bars':
+            first = max(self.offset - start, (self.offset - start) % self.n)
+            return np.arange(first, size, self.n)
+
+        if self.rule == 'dates':
+            dates = self.dates
+            if previous is not None:
+                dates = dates[dates > pd.Timestamp(previous)]
+            bars = index.searchsorted(dates, side='left')
+            return np.unique(bars[bars < size])
+
+        period, _, edge = self.rule.rpartition('_')
+        freq = self._PERIODS[period]
+        periods = index.to_period(freq).asi8
+        if edge == 'start':
+            first = True if previous is None else pd.Timestamp(previous).to_period(freq).ordinal != periods[0]
+            changed = np.r_[first, periods[1:] != periods[:-1]]
+        else:
+            last = True if following is None else pd.Timestamp(following).to_period(freq).ordinal != periods[-1]
+            changed = np.r_[periods[1:] != periods[:-1], last]
+        return np.flatnonzero(changed)
+
+    def __repr__(self):
+        if self.rule == 'every_n_bars':
+            return f"Schedule('every_n_bars', n={self.n}, offset={self.offset})"
+        if self.rule == 'dates':
+            return f"Schedule('dates', {len(self.dates)} dates)"
+        return f"Schedule({self.rule!r})"
+
+
+def month_end() -> Schedule:
+    '''每月最后一根bar'''
+    return Schedule('month_end')
+
+def month_start() -> Schedule:
+    '''每月第一根bar'''
+    return Schedule('month_start')
+
+def week_start() -> Schedule:
+    '''每周第一根bar'''
+    return Schedule('week_start')
+
+def week_end() -> Schedule:
+    '''每周最后一根bar'''
+    return Schedule('week_end')
+
+def day_start() -> Schedule:
+    '''每天第一根bar'''
+    return Schedule('day_start')
+
+def day_end() -> Schedule:
+    '''每天最后一根bar'''
+    return Schedule('day_end')
+
+def every_n_bars(n: int, offset: int = 0) -> Schedule:
+    '''从第offset根bar开始每n根bar调仓一次'''
+    return Schedule('every_n_bars', n=n, offset=offset)
+
+def on_dates(dates: Iterable) -> Schedule:
+    '''在指定日期调仓, 非交易日顺延到之后的第一根bar'''
+    return Schedule('dates', dates=dates)
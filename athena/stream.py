@@ -0,0 +1,65 @@
+from typing import Iterable, Iterator, Optional, Tuple, Union
+import os
+import pandas as pd
+
+def frame_chunks(data: pd.DataFrame, chunksize: int) -> Iterator[pd.DataFrame]:
+    '''把内存中的行情表按行数切成若干块'''
+    for start in range(0, len(data), chunksize):
+        yield data.iloc[start:start + chunksize]
+
+_READERS = {
+    '.h5': lambda path, key: pd.read_hdf(path, key),
+    '.hdf5': lambda path, key: pd.read_hdf(path, key),
+    '.pkl': lambda path, key: pd.read_pickle(path),
+    '.pickle': lambda path, key: pd.read_pickle(path),
+    '.parquet': lambda path, key: pd.read_parquet(path),
+    '.csv': lambda path, key: pd.read_csv(path, header=[0, 1], index_col=0, parse_dates=True),
+}
+
+def file_chunks(paths: Union[str, Iterable[str]], key: Optional[str] = None) -> Iterator[pd.DataFrame]:
+    '''
+    逐个读取文件作为数据块, 例如按月保存的行情文件
+    :param paths: 文件列表, 一个文件, 或者一个目录(按文件名排序读取目录下支持格式的文件, 其他文件跳过)
+    :param key: .h5文件中的key
+    支持 .h5/.hdf5, .pkl/.pickle, .parquet, .csv(两层列名, 第一列为时间索引), 明确给出的文件格式不支持时报错
+    返回的是生成器, 只能读取一次
+    '''
+    if isinstance(paths, str) and os.path.isdir(paths):
+        paths = [os.path.join(paths, name) for name in sorted(os.listdir(paths))
+                 if os.path.splitext(name)[1].lower() in _READERS and os.path.isfile(os.path.join(paths, name))]
+    elif isinstance(paths, str):
+        paths = [paths]
+
+    for path in paths:
+        reader = _READERS.get(os.path.splitext(path)[1].lower())
+        if reader is None:
+            raise ValueError(f"不支持的文件格式: {path}")
+        yield reader(path, key)
+
+def filter_chunks(chunks: Iterable[pd.DataFrame], start_date=None, end_date=None) -> Iterator[pd.DataFrame]:
+    '''只保留 [start_date, end_date] 之间的bar, 结束日期之后的块不再读取'''
+    start_date = pd.to_datetime(start_date) if start_date else None
+    end_date = pd.to_datetime(end_date) if end_date else None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if end_date is not None and chunk.index[0] > end_date:
+            break
+        if start_date is not None and chunk.index[-1] < start_date:
+            continue
+        yield chunk.loc[start_date:end_date]
+
+def with_following(chunks: Iterable[pd.DataFrame]) -> Iterator[Tuple[pd.DataFrame, Optional[pd.Timestamp]]]:
+    '''
+    逐块返回 (数据块, 下一块第一根bar的时间), 最后一块为 (数据块, None)
+    最多同时持有两个数据块, 跳过空块
+    '''
+    current = None
+    for chunk in chunks:
+        if len(chunk) == 0:
+            continue
+        if current is not None:
+            yield current, chunk.index[0]
+        current = chunk
+    if current is not None:
+        yield current, None
@@ -0,0 +1,134 @@
+from typing import Any, Callable, Dict, Iterator, List, Optional, Type, Union
+from multiprocessing import Pool, shared_memory
+import inspect
+import itertools
+import os
+
+import numpy as np
+import pandas as pd
+
+from .backtesting import Strategy, Backtest
+from .result import Result
+from .memmap import open_memmap_panel
+from .metrics import calculate_metrics
+
+# Backtest构造函数的参数, 参数网格里的这些键传给Backtest, 其余的传给策略的init
+_BACKTEST_PARAMS = set(inspect.signature(Backtest.__init__).parameters) - {'self', 'strategy', 'data'}
+
+# 子进程里共享的数据, 由 _init_worker 设置
+_worker: Dict[str, Any] = {}
+
+
+def parameter_grid(grid: Union[Dict[str, List], List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    '''
+    展开参数网格
+    {'momentum_window': [10, 20], 'commission': [0, 0.001]} -> 4组参数
+    也可以直接传入参数字典的列表
+    '''
+    if isinstance(grid, dict):
+        keys = list(grid)
+        return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+    return [dict(params) for params in grid]
+
+def summarize(result: Result) -> Dict[str, float]:
+    '''回测结果的简要统计: 最终资产, 夏普比率, 最大回撤, 年化按索引推断的bar频率'''
+    metrics = calculate_metrics(result.net_value) if len(result.net_value) > 1 else {}
+    sharpe = metrics.get('sharpe', np.nan)
+    return {
+        'final_value': float(result.returns.iloc[-1]),
+        'sharpe': sharpe if np.isfinite(sharpe) else 0.0,
+        'max_drawdown': metrics.get('max_drawdown', 0.0),
+    }
+
+def _init_worker(shm_name: str, shape, dtype, index, columns, strategy, benchmark, backtest_kwargs):
+    '''子进程初始化: 连接共享内存, 直接在共享的数组上构造价格表(不复制)'''
+    shm = shared_memory.SharedMemory(name=shm_name)
+    values = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _worker['shm'] = shm
+    _worker['data'] = pd.DataFrame(values, index=index, columns=columns, copy=False)
+    _worker['strategy'] = strategy
+    _worker['benchmark'] = benchmark
+    _worker['backtest_kwargs'] = backtest_kwargs
+
+def _init_memmap_worker(directory, strategy, benchmark, backtest_kwargs):
+    '''子进程初始化: 打开内存映射面板, 所有子进程共享同一份页缓存'''
+    _worker['data'] = open_memmap_panel(directory)
+    _worker['strategy'] = strategy
+    _worker['benchmark'] = benchmark
+    _worker['backtest_kwargs'] = backtest_kwargs
+
+def _run_one(task):
+    '''在子进程中跑一组参数'''
+    i, params, keep = task
+    backtest_params = {key: value for key, value in params.items() if key in _BACKTEST_PARAMS}
+    strategy_params = {key: value for key, value in params.items() if key not in _BACKTEST_PARAMS}
+
+    kwargs = dict(_worker['backtest_kwargs'])
+    kwargs.update(backtest_params)
+    kwargs.setdefault('benchmark', _worker['benchmark'])
+
+    result = Backtest(_worker['strategy'], _worker['data'], **kwargs).run(**strategy_params)
+
+    summary = {'run': i, **params, **summarize(result)}
+    if keep:
+        summary['result'] = result
+    return summary
+
+def run_parameter_sweep(
+    strategy: Type[Strategy],
+    grid: Union[Dict[str, List], List[Dict[str, Any]]],
+    data: Union[pd.DataFrame, str],
+    benchmark: pd.DataFrame = None,
+    processes: Optional[int] = None,
+    keep: Union[bool, Callable[[Dict[str, Any]], bool]] = False,
+    **backtest_kwargs
+) -> Iterator[Dict[str, Any]]:
+    '''
+    多进程参数扫描
+    :param strategy: 策略类, 需要定义在模块顶层以便子进程导入
+    :param grid: 参数网格, Backtest的参数(cash, commission, ledger...)传给Backtest, 其余作为关键字参数传给策略的init
+    :param data: 价格数据, 通过共享内存传给子进程, 不会随每个任务复制;
+                 也可以传入 save_memmap_panel 写出的目录, 子进程直接映射同一份文件
+    :param processes: 进程数, 默认为CPU数, 1表示在当前进程顺序执行
+    :param keep: 是否保留完整的Result, 可以传入 params -> bool 的函数只保留选中的几组
+    :return: 按完成顺序逐个返回 {'run', 参数..., 'final_value', 'sharpe', 'max_drawdown'[, 'result']}
+    '''
+    params_list = parameter_grid(grid)
+    backtest_kwargs.setdefault('verbosity', 'off')  # 扫描时默认不写日志
+    tasks = [
+        (i, params, keep(params) if callable(keep) else bool(keep))
+        for i, params in enumerate(params_list)
+    ]
+
+    processes = processes or os.cpu_count() or 1
+    if isinstance(data, str) and processes > 1:
+        initargs = (data, strategy, benchmark, backtest_kwargs)
+        with Pool(processes, initializer=_init_memmap_worker, initargs=initargs) as pool:
+            yield from pool.imap_unordered(_run_one, tasks)
+        return
+    if isinstance(data, str):
+        data = open_memmap_panel(data)
+
+    if processes == 1:
+        # 顺序执行时直接使用原始数据
+        _worker.update(data=data, strategy=strategy, benchmark=benchmark, backtest_kwargs=backtest_kwargs)
+        try:
+            for task in tasks:
+                yield _run_one(task)
+        finally:
+            _worker.clear()
+        return
+
+    values = np.ascontiguousarray(data.to_numpy(dtype=float))
+    shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+    try:
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[:] = values
+        initargs = (shm.name, values.shape, values.dtype, data.index, data.columns,
+                    strategy, benchmark, backtest_kwargs)
+        del values
+
+        with Pool(processes, initializer=_init_worker, initargs=initargs) as pool:
+            yield from pool.imap_unordered(_run_one, tasks)
+    finally:
+        shm.close()
+        shm.unlink()
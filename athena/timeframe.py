@@ -0,0 +1,167 @@
+from typing import Dict, Hashable, Optional
+import numpy as np
+import pandas as pd
+
+from .records import BarRecord
+from .resample import DEFAULT_AGG_FUNCS, _bin_bounds
+
+def _bin_labels(index: pd.DatetimeIndex, freq: str) -> np.ndarray:
+    '''每根bar所在的目标周期(与 resample 的分箱一致), 返回 int64 纳秒'''
+    labels, starts, stops = _bin_bounds(index, freq)
+    return np.repeat(labels.asi8, stops - starts)
+
+
+class TimeframeBars:
+    '''
+    回测过程中逐根bar增量聚合的高级别K线
+    只保存正在形成的那根bar和最近一根走完的bar, 不会预先生成整张高级别大表
+    一个周期在下一根bar进入新周期(或数据结束)时视为走完, 与 Schedule 判断周期末的方式相同,
+    因此在周期最后一根bar的 next 中即可读到这个周期的bar, 不会读到还没走完的周期
+    数据的最后一根bar总是结束它所在的周期: 数据在周期中途结束时(例如日线周期只有上午的bar),
+    最后一根bar的 next 中读到的是这部分bar聚合出的不完整bar, 与 resample 的最后一行相同
+    引擎每根bar只移动游标, 读取 record/date/count 时才把游标之前的bar并入, 不读取时几乎没有开销
+
+    列与基础bar相同, 按字段名取 agg_funcs 中的聚合方式, 没有列出的字段取最后一个值
+    要求目标周期的分箱不依赖数据起点(如 '1h', '4h', '1D', 'W', 'M')
+    '''
+    def __init__(self, freq: str, agg_funcs: Optional[Dict[str, str]] = None):
+        self.freq = freq
+        self.agg_funcs = agg_funcs or DEFAULT_AGG_FUNCS
+        self._record: Optional[BarRecord] = None
+        self._date: Optional[pd.Timestamp] = None
+        self._count = 0
+
+        self._columns: Optional[Dict[Hashable, int]] = None
+        self._groups: Dict[str, np.ndarray] = {}
+        self._partial: Optional[np.ndarray] = None
+        self._labels = np.empty(0, dtype=np.int64)
+        self._closes = np.empty(0, dtype=bool)
+        self._values: Optional[np.ndarray] = None
+        self._position = 0  # 当前块中已经聚合到的行
+        self._cursor = 0  # 当前块中已经可以聚合的行(不含)
+
+    @property
+    def record(self) -> Optional[BarRecord]:
+        '''最近一根走完的bar, 还没有走完的周期时为None'''
+        if self._cursor > self._position:
+            self._advance()
+        return self._record
+
+    @property
+    def date(self) -> Optional[pd.Timestamp]:
+        '''最近一根走完的bar的周期标签'''
+        if self._cursor > self._position:
+            self._advance()
+        return self._date
+
+    @property
+    def count(self) -> int:
+        '''已经走完的bar数量'''
+        if self._cursor > self._position:
+            self._advance()
+        return self._count
+
+    def seek(self, stop: int):
+        '''引擎推进到当前块的第stop根bar(不含), 聚合推迟到读取时'''
+        self._cursor = stop
+
+    def start_chunk(self, index, values: np.ndarray, columns: Dict[Hashable, int], following=None):
+        '''
+        切换到新的数据块, 未走完的周期延续到新块
+        :param following: 下一块第一根bar的时间, 没有则为None(数据结束, 最后一个周期在块的最后一根bar走完)
+        '''
+        if self._columns is None:
+            self._columns = columns
+            how = np.array([self.agg_funcs.get(key[1] if isinstance(key, tuple) else key, 'last')
+                            for key in columns])
+            self._groups = {method: np.flatnonzero(how == method) for method in np.unique(how)}
+            self._partial = self._empty()
+        elif list(columns) != list(self._columns):
+            raise ValueError("多周期bar要求各数据块的列相同")
+
+        index = pd.DatetimeIndex(index)
+        if following is not None:
+            index = index.append(pd.DatetimeIndex([following]))
+        labels = _bin_labels(index, self.freq)
+        self._closes = np.r_[labels[1:] != labels[:-1], following is None]
+        self._labels = labels[:len(self._closes)]
+        self._values = values
+        self._position = self._cursor = 0
+
+    def finish_chunk(self):
+        '''换块前把当前块剩下的bar并入'''
+        if self._values is not None:
+            self._cursor = len(self._values)
+            self._advance()
+
+    def _advance(self):
+        '''把 [已聚合位置, 游标) 的bar并入正在形成的周期, 遇到周期末时生成走完的bar'''
+        start, stop, values = self._position, self._cursor, self._values
+        if stop - start == 1:
+            # 每根bar都读取时只需要并入一行
+            self._fold_row(values[start])
+            if self._closes[start]:
+                self._close(start)
+            self._position = stop
+            return
+        for close in np.flatnonzero(self._closes[start:stop]) + start:
+            self._fold(values[start:close + 1])
+            self._close(close)
+            start = close + 1
+        if start < stop:
+            self._fold(values[start:stop])
+        self._position = stop
+
+    def _close(self, row: int):
+        self._record = BarRecord(self._partial, self._columns)
+        self._date = pd.Timestamp(self._labels[row])
+        self._count += 1
+        self._partial = self._empty()
+
+    def _empty(self) -> np.ndarray:
+        partial = np.full(len(self._columns), np.nan)
+        if 'sum' in self._groups:
+            partial[self._groups['sum']] = 0.0
+        return partial
+
+    def _fold_row(self, row: np.ndarray):
+        '''并入一行'''
+        partial = self._partial
+        for method, cols in self._groups.items():
+            value = np.asarray(row[cols], dtype=np.float64)
+            if method == 'sum':
+                partial[cols] += np.where(np.isnan(value), 0.0, value)
+            elif method == 'max':
+                partial[cols] = np.fmax(partial[cols], value)
+            elif method == 'min':
+                partial[cols] = np.fmin(partial[cols], value)
+            elif method == 'first':
+                current = partial[cols]
+                partial[cols] = np.where(np.isnan(current), value, current)
+            elif method == 'last':
+                partial[cols] = np.where(np.isnan(value), partial[cols], value)
+            else:
+                raise ValueError(f"不支持的聚合方式: {method}")
+
+    def _fold(self, rows: np.ndarray):
+        '''把若干行并入正在形成的周期, 忽略NaN, 与 resample 的聚合结果一致'''
+        partial = self._partial
+        for method, cols in self._groups.items():
+            block = np.asarray(rows[:, cols], dtype=np.float64)
+            valid = ~np.isnan(block)
+            if method == 'sum':
+                partial[cols] += np.where(valid, block, 0.0).sum(axis=0)
+            elif method == 'max':
+                partial[cols] = np.fmax(partial[cols], np.fmax.reduce(block, axis=0))
+            elif method == 'min':
+                partial[cols] = np.fmin(partial[cols], np.fmin.reduce(block, axis=0))
+            elif method == 'first':
+                found = valid.any(axis=0)
+                first = block[valid.argmax(axis=0), np.arange(len(cols))]
+                partial[cols] = np.where(np.isnan(partial[cols]) & found, first, partial[cols])
+            elif method == 'last':
+                found = valid.any(axis=0)
+                last = block[len(block) - 1 - valid[::-1].argmax(axis=0), np.arange(len(cols))]
+                partial[cols] = np.where(found, last, partial[cols])
+            else:
+                raise ValueError(f"不支持的聚合方式: {method}")
@@ -14,30 +14,40 @@ class PrecisionConfig:
     PCT_PRECISION = 4    # 百分比精度(change_pct等)
     COMMISSION_PRECISION = 8  # 手续费精度（需要更高精度）
 
+    _quantizers: Dict[int, Decimal] = {}  # 按精度缓存量化因子,避免每次调用都重新构造Decimal
+
+    @classmethod
+    def quantizer(cls, precision: int) -> Decimal:
+        """获取指定精度的量化因子"""
+        q = cls._quantizers.get(precision)
+        if q is None:
+            q = cls._quantizers[precision] = Decimal(f"0.{'0' * precision}")
+        return q
+
     @classmethod
     def round_commission(cls, value: Decimal) -> Decimal:
         """处理手续费精度"""
-        return value.quantize(Decimal(f"0.{'0' * cls.COMMISSION_PRECISION}"))
+        return value.quantize(cls.quantizer(cls.COMMISSION_PRECISION))
 
     @classmethod
     def round_price(cls, value: Decimal) -> Decimal:
         """处理价格精度"""
-        return value.quantize(Decimal(f"0.{'0' * cls.PRICE_PRECISION}"))
+        return value.quantize(cls.quantizer(cls.PRICE_PRECISION))
     
     @classmethod
     def round_size(cls, value: Decimal) -> Decimal:
         """处理数量精度"""
-        return value.quantize(Decimal(f"0.{'0' * cls.SIZE_PRECISION}"))
+        return value.quantize(cls.quantizer(cls.SIZE_PRECISION))
     
     @classmethod
     def round_value(cls, value: Decimal) -> Decimal:
         """处理金额精度"""
-        return value.quantize(Decimal(f"0.{'0' * cls.VALUE_PRECISION}"))
+        return value.quantize(cls.quantizer(cls.VALUE_PRECISION))
     
     @classmethod
     def round_percentage(cls, value: Decimal) -> Decimal:
         """处理百分比精度"""
-        return value.quantize(Decimal(f"0.{'0' * cls.PCT_PRECISION}"))
+        return value.quantize(cls.quantizer(cls.PCT_PRECISION))
 
 @dataclass
 class Position:
@@ -0,0 +1,164 @@
+import numpy as np
+import pandas as pd
+
+from .result import Result
+
+def _equity_after_commission(equity: float, weights: np.ndarray, current: np.ndarray, commission: float) -> float:
+    '''
+    求解调仓后的资产x: x = equity - commission * sum(|weights * x - current|)
+    f(x) = x - equity + commission * sum(|weights * x - current|) 是分段线性的增函数(commission * sum(|weights|) < 1),
+    拐点为 current / weights, 先找出根所在的区间, 再在区间内按线性方程直接求解
+    '''
+    active = weights != 0
+    a = np.abs(weights[active])
+    b = current[active] / weights[active]
+    constant = equity - commission * np.abs(current[~active]).sum()
+    if not len(a):
+        return constant
+
+    order = np.argsort(b)
+    a, b = a[order], b[order]
+    # f(b_k), sum(a_j * |b_k - b_j|) 用前缀和计算
+    left_a = np.cumsum(a) - a
+    left_ab = np.cumsum(a * b) - a * b
+    right_a = a.sum() - left_a - a
+    right_ab = (a * b).sum() - left_ab - a * b
+    f = b - constant + commission * (b * (left_a - right_a) - left_ab + right_ab)
+
+    k = np.searchsorted(f, 0.0)
+    if k == 0:
+        slope = 1 - commission * a.sum()
+        if slope <= 0:
+            raise ValueError("总权重过大, 手续费后的资产无解")
+        return float(b[0] - f[0] / slope)
+    if k == len(b):
+        return float(b[-1] - f[-1] / (1 + commission * a.sum()))
+    return float(b[k - 1] - f[k - 1] * (b[k] - b[k - 1]) / (f[k] - f[k - 1]))
+
+
+class WeightBacktest:
+    """
+    向量化的目标权重回测
+    输入 日期 x 标的 的目标权重矩阵, 在有权重的日期按收盘价调仓到目标权重, 其余日期持仓数量不变
+    权重为负表示做空, 整行为NaN表示当天不调仓(行内的NaN视为0)
+    逐bar的净值、多/空头收益、换手率和手续费全部用数组运算完成, 只在调仓日做一次向量计算
+    返回与Backtest相同的Result, 可以直接交给Visualization使用
+    """
+    def __init__(
+        self,
+        data: pd.DataFrame,
+        weights: pd.DataFrame,
+        cash: float = 10_000,
+        commission: float = .0,
+        benchmark: pd.DataFrame = None, # 这里传入的benchmark得是net value
+        start_date: str = None,
+        end_date: str = None,
+        price_field: str = 'Close' # 调仓和估值使用的价格字段
+    ):
+        # 日期筛选
+        if start_date or end_date:
+            start_date = pd.to_datetime(start_date) if start_date else data.index[0]
+            end_date = pd.to_datetime(end_date) if end_date else data.index[-1]
+            data = data.loc[start_date:end_date]
+            if benchmark is not None:
+                benchmark = benchmark.loc[start_date:end_date]
+
+        if not isinstance(data.columns, pd.MultiIndex):
+            raise ValueError("data 的列必须是 (symbol, field) 的MultiIndex")
+
+        self.data = data
+        self.cash = float(cash)
+        self.commission = float(commission)
+        self.benchmark = benchmark
+        self.symbols = weights.columns.tolist()
+
+        prices = data.xs(price_field, axis=1, level=1).reindex(columns=self.symbols)
+        self.prices = prices.astype(float)
+        self.weights = weights.reindex(index=data.index).astype(float)
+
+    def run(self) -> Result:
+        '''运行回测'''
+        index = self.data.index
+        c = self.commission
+
+        raw = self.prices.to_numpy()
+        tradable = ~np.isnan(raw)
+        prices = self.prices.ffill().to_numpy()   # 停牌/缺失时沿用最后价格估值
+        prices_filled = np.nan_to_num(prices)
+
+        target = self.weights.to_numpy()
+        rebalance = ~np.all(np.isnan(target), axis=1)
+        target = np.nan_to_num(target)
+
+        T, N = prices.shape
+        rebalance_bars = np.flatnonzero(rebalance)
+
+        # 每个调仓日的持仓数量和调仓后的资产, 只有这里是按调仓日顺序计算的
+        holdings = np.zeros((len(rebalance_bars) + 1, N))
+        equity_after = np.empty(len(rebalance_bars) + 1)
+        equity_after[0] = self.cash
+        reference = np.zeros((len(rebalance_bars) + 1, N))
+        turnover = np.zeros(T)
+        commission = np.zeros(T)
+        long_commission = np.zeros(T)
+        short_commission = np.zeros(T)
+
+        held = np.zeros(N)
+        equity = self.cash
+        last_price = prices_filled[0]
+        for k, t in enumerate(rebalance_bars, start=1):
+            price = prices_filled[t]
+            equity = equity + held @ (price - last_price)
+            current = held * price
+            can_trade = tradable[t]  # 当天没有价格的标的保持原有持仓
+
+            # 手续费按成交金额收取, 调仓后资产 = 调仓前资产 - 手续费
+            equity_new = _equity_after_commission(
+                equity, target[t][can_trade], current[can_trade], c
+            ) if c else equity
+            target_value = np.where(can_trade, target[t] * equity_new, current)
+
+            traded = np.abs(target_value - current)
+            long_traded = np.abs(np.maximum(target_value, 0) - np.maximum(current, 0))
+            short_traded = np.abs(np.minimum(target_value, 0) - np.minimum(current, 0))
+            turnover[t] = traded.sum() / equity if equity else 0.0
+            commission[t] = c * traded.sum()
+            long_commission[t] = c * long_traded.sum()
+            short_commission[t] = c * short_traded.sum()
+
+            with np.errstate(divide='ignore', invalid='ignore'):
+                held = np.where(can_trade & (price > 0), target_value / price, held)
+            equity = equity_new
+            last_price = price
+            holdings[k] = held
+            equity_after[k] = equity
+            reference[k] = price
+
+        # 每根bar所属的调仓区间, 区间内资产 = 调仓后资产 + 持仓 x 价格变动
+        segment = np.cumsum(rebalance)
+        held_by_bar = holdings[segment]
+        returns = equity_after[segment] + np.einsum(
+            'ij,ij->i', held_by_bar, prices_filled - reference[segment]
+        )
+
+        # 多/空头收益: 上一根bar的持仓在本bar的价格变动, 扣除各自的手续费
+        held_before = np.vstack([np.zeros((1, N)), held_by_bar[:-1]])
+        price_change = np.vstack([np.zeros((1, N)), np.diff(prices_filled, axis=0)])
+        pnl = held_before * price_change
+        long_returns = np.cumsum(np.where(held_before > 0, pnl, 0.0).sum(axis=1) - long_commission)
+        short_returns = np.cumsum(np.where(held_before < 0, pnl, 0.0).sum(axis=1) - short_commission)
+
+        returns_series = pd.Series(returns, index=index, dtype=float)
+        net_value_series = returns_series / returns_series.iloc[0]
+
+        return Result(
+            returns=returns_series,
+            long_returns=pd.Series(long_returns, index=index, dtype=float),
+            short_returns=pd.Series(short_returns, index=index, dtype=float),
+            net_value=net_value_series,
+            trades=[],
+            open_positions=[],
+            benchmark=self.benchmark,
+            turnover=pd.Series(turnover, index=index, dtype=float),
+            commission=pd.Series(commission, index=index, dtype=float)
+        )
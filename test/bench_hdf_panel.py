@@ -0,0 +1,71 @@
+'''
+按字段建表的.h5面板与整表fixed格式读取的耗时对比, 同时检查读出的数据一致
+python test/bench_hdf_panel.py [日期数] [标的数]
+'''
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import conftest  # noqa: F401  把仓库根目录加入 sys.path
+from athena.data import read_hdf_panel, save_hdf_panel
+
+FIELDS = ['Open', 'High', 'Low', 'Close']
+
+
+def random_panel(n_dates, n_symbols, seed=0):
+    rng = np.random.default_rng(seed)
+    columns = pd.MultiIndex.from_product([[f'S{k:04d}' for k in range(n_symbols)], FIELDS])
+    values = rng.random((n_dates, len(columns)))
+    return pd.DataFrame(values, index=pd.date_range('2000-01-01', periods=n_dates, name='date'), columns=columns)
+
+
+def timed(func, *args, repeat=3, **kwargs):
+    '''取多次中最快的一次'''
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def main(n_dates=6000, n_symbols=1000):
+    panel = random_panel(n_dates, n_symbols)
+    symbols = list(panel.columns.get_level_values(0).unique())
+    start_date, end_date = panel.index[3000], panel.index[3030]
+    print(f"{n_dates} 天 x {panel.shape[1]} 列 ({n_symbols} 个标的 x {len(FIELDS)} 个字段)")
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixed_path, table_path = os.path.join(directory, 'fixed.h5'), os.path.join(directory, 'table.h5')
+        panel.to_hdf(fixed_path, key='prices', mode='w')
+        save_hdf_panel(panel, table_path)
+
+        cases = [
+            ('全部', {}),
+            ('一个月', {'start_date': start_date, 'end_date': end_date}),
+            ('一个月, Close', {'start_date': start_date, 'end_date': end_date, 'fields': ['Close']}),
+            ('全部日期, 50个标的', {'symbols': symbols[:50]}),
+        ]
+        for name, kwargs in cases:
+            def read_fixed():
+                # 原来的用法: 整表读入后再用 pandas 筛选
+                df = pd.read_hdf(fixed_path, key='prices')
+                mask = np.ones(df.shape[1], dtype=bool)
+                if 'symbols' in kwargs:
+                    mask &= df.columns.get_level_values(0).isin(kwargs['symbols'])
+                if 'fields' in kwargs:
+                    mask &= df.columns.get_level_values(1).isin(kwargs['fields'])
+                return df.loc[kwargs.get('start_date'):kwargs.get('end_date'), mask]
+
+            expected, old = timed(read_fixed)
+            result, new = timed(read_hdf_panel, table_path, **kwargs)
+            pd.testing.assert_frame_equal(result, expected, check_freq=False)
+            print(f"{name:<18} fixed整表 {old * 1e3:8.1f}ms  read_hdf_panel {new * 1e3:8.1f}ms")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,38 @@
+'''
+long_to_wide 与原来逐只股票循环转换的耗时对比, 同时检查两者结果一致
+python test/bench_long_to_wide.py
+'''
+import time
+
+import pandas as pd
+
+import conftest  # noqa: F401  把仓库根目录加入 sys.path
+from athena.data import long_to_wide
+from test_long_to_wide import MAPPING, legacy_tushare_wide, random_long_frame
+
+SIZES = [(50, 250), (300, 500), (1000, 750)]
+LEGACY_LIMIT = 300  # 原来的循环随标的数平方增长, 更大的规模只测新实现
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    fields = list(MAPPING)
+    print(f"{'标的':>6} {'天数':>6} {'行数':>9} {'原来(s)':>10} {'long_to_wide(ms)':>18} {'加速':>8}")
+    for n_symbols, n_days in SIZES:
+        df = random_long_frame(n_symbols, n_days)
+        result, new = timed(long_to_wide, df, 'trade_date', 'ts_code', fields, rename=MAPPING)
+        if n_symbols <= LEGACY_LIMIT:
+            expected, old = timed(legacy_tushare_wide, df, fields)
+            pd.testing.assert_frame_equal(result, expected, check_freq=False)
+            print(f"{n_symbols:>6} {n_days:>6} {len(df):>9} {old:>10.2f} {new * 1e3:>18.1f} {old / new:>7.0f}x")
+        else:
+            print(f"{n_symbols:>6} {n_days:>6} {len(df):>9} {'-':>10} {new * 1e3:>18.1f} {'-':>8}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+'''
+resample_multi_index_dataframe 与原来逐个标的 resample().agg 的耗时对比, 同时检查两者结果一致
+python test/bench_resample.py [标的数] [天数]
+'''
+import sys
+import time
+
+import pandas as pd
+
+import conftest  # noqa: F401  把仓库根目录加入 sys.path
+from athena.resample import append_resampled, resample_multi_index_dataframe
+from test_resample import FREQS, kline_panel, legacy_resample
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main(n_symbols=300, days=365):
+    panel = kline_panel(n_symbols, days)
+    print(f"{len(panel)} 根15分钟K线 x {n_symbols} 个标的 ({panel.shape[1]} 列)")
+    for freq in FREQS:
+        expected, old = timed(legacy_resample, panel, freq)
+        result, new = timed(resample_multi_index_dataframe, panel, freq)
+        pd.testing.assert_frame_equal(result, expected, rtol=1e-12)
+        print(f"{freq:>4}  逐个标的 {old:6.2f}s  一次性聚合 {new:6.2f}s  {old / new:5.1f}x")
+
+    # 每天追加一次新的K线, 与重新对整个大表重采样比较
+    history, today = panel.iloc[:-96], panel.iloc[-96:]
+    resampled = resample_multi_index_dataframe(history, '1D')
+    full, old = timed(resample_multi_index_dataframe, panel, '1D')
+    appended, new = timed(append_resampled, resampled, today, '1D')
+    pd.testing.assert_frame_equal(appended, full, rtol=1e-12, check_freq=False)
+    print(f"追加一天  全部重采样 {old:6.2f}s  append_resampled {new:6.3f}s")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,19 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DATA = os.path.join(ROOT, 'athena', 'data')
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope='session')
+def prices():
+    return pd.read_hdf(os.path.join(DATA, 'prices_data.h5'), key='prices')
+
+
+@pytest.fixture(scope='session')
+def factors():
+    return pd.read_hdf(os.path.join(DATA, 'factors_data.h5'), key='factors')
@@ -0,0 +1,252 @@
+import contextlib
+import io
+from decimal import Decimal
+
+import pytest
+
+import athena.backtesting as backtesting
+from athena import Backtest, Strategy, sort_the_factor
+from athena.broker import Broker
+from athena.trading import Position, PrecisionConfig
+
+
+class LegacyMergeBroker(Broker):
+    '''开仓只追加仓位, 每根bar结束时按旧的 merge_positions 从 open_positions 重建全部持仓, 作为对照'''
+    def _add_position(self, position):
+        self._slots[id(position)] = self._next_slot
+        self._positions[self._next_slot] = position
+        self._next_slot += 1
+        self.symbol_index.setdefault(position.symbol, []).append(position)
+        side = self.short_positions if position.is_short else self.long_positions
+        side.setdefault(position.symbol, position)
+        self.position_book.setdefault((position.symbol, position.is_short), position)
+
+    def merge_positions(self):
+        merged_map = {}
+        for position in self.open_positions:
+            key = (position.symbol, position.is_short)
+            entry = merged_map.setdefault(key, {
+                'open_date': position.open_date, 'last_date': position.last_date,
+                'last_price': position.last_price, 'position_size': Decimal('0'),
+                'weighted_open_price': Decimal('0'), 'open_commission': Decimal('0'),
+            })
+            total_size = PrecisionConfig.round_size(entry['position_size'] + Decimal(str(position.position_size)))
+            if total_size > 0:
+                entry['weighted_open_price'] = PrecisionConfig.round_price(
+                    (entry['position_size'] * entry['weighted_open_price'] +
+                     Decimal(str(position.position_size)) * Decimal(str(position.open_price)))
+                    / total_size
+                )
+            else:
+                entry['weighted_open_price'] = position.open_price
+            entry['position_size'] = total_size
+            entry['open_commission'] = PrecisionConfig.round_commission(
+                entry['open_commission'] + Decimal(str(position.open_commission))
+            )
+            entry['last_date'] = max(entry['last_date'], position.last_date)
+            entry['last_price'] = position.last_price
+
+        merged_positions = []
+        for (symbol, is_short), entry in merged_map.items():
+            position = Position(
+                symbol=symbol, open_date=entry['open_date'],
+                open_price=float(entry['weighted_open_price']),
+                position_size=float(entry['position_size']), is_short=is_short
+            )
+            position.open_commission = float(entry['open_commission'])
+            position.update(last_date=entry['last_date'], last_price=float(entry['last_price']))
+            merged_positions.append(position)
+        self.open_positions = merged_positions
+
+
+def repeat_fill_strategy(factors):
+    class RepeatFill(Strategy):
+        '''同一根bar内对同一标的多次开仓, 再按标的平仓和调仓'''
+        def init(self):
+            pass
+
+        def next(self, i, record):
+            if i % 5:
+                return
+            longs_held, shorts_held = self.broker.current_position_status()
+            ranked = sort_the_factor(factors.loc[self.date], 'total_mv')
+            shorts, longs = ranked[:5].index.tolist(), ranked[-5:].index.tolist()
+            for symbol in longs_held:
+                if symbol not in longs:
+                    self.close(symbol=symbol, price=record[(symbol, 'Open')])
+            for symbol in shorts_held:
+                if symbol not in shorts:
+                    self.close(symbol=symbol, price=record[(symbol, 'Open')])
+            for symbol in longs:
+                self.order_target_percent(symbol, 1 / 20, record[(symbol, 'Close')])
+                self.open(record[(symbol, 'Close')], 0.01, symbol=symbol, is_fractional=True)
+            for symbol in shorts:
+                self.open(record[(symbol, 'Open')], 0.01, symbol=symbol, short=True, is_fractional=True)
+                self.open(record[(symbol, 'Close')], 0.01, symbol=symbol, short=True, is_fractional=True)
+                self.order_target_percent(symbol, 1 / 40, record[(symbol, 'Close')], short=True)
+    return RepeatFill
+
+
+class Rebalance(Strategy):
+    '''每根bar按目标比例调仓, 并不时追加开仓和部分平仓'''
+    def init(self):
+        pass
+
+    def next(self, i, record):
+        symbols = self.symbols[:5]
+        for k, symbol in enumerate(symbols):
+            target = 0.05 + 0.04 * ((i + k) % 4)
+            self.order_target_percent(symbol, target, record[(symbol, 'Close')], short=(k % 2 == 1))
+        if i % 7 == 0:
+            self.open(record[(symbols[0], 'Close')], 0.05, symbol=symbols[0], is_fractional=True)
+        if i % 11 == 0:
+            self.close(record[(symbols[1], 'Close')], symbol=symbols[1], size=1.5)
+
+
+def strategies(factors):
+    return {'repeat_fill': repeat_fill_strategy(factors), 'rebalance': Rebalance}
+
+
+# 旧版本(每根bar结束时合并)的成交笔数和最终总资产
+LEGACY = {'repeat_fill': (489, 1001381.88), 'rebalance': (343, 830181.91)}
+
+
+def run(strategy, prices, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Backtest(strategy, prices, commission=0.001, cash=1_000_000, verbosity='off', **kwargs).run()
+
+
+def summary(result):
+    trades = [tuple(str(value) for value in vars(trade).values()) for trade in result.trades]
+    return trades, result.returns.tolist(), result.long_returns.tolist(), result.short_returns.tolist()
+
+
+@pytest.fixture(scope='module')
+def legacy(prices, factors):
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(backtesting, 'Broker', LegacyMergeBroker)
+        return {name: summary(run(strategy, prices)) for name, strategy in strategies(factors).items()}
+
+
+@pytest.mark.parametrize('name', sorted(LEGACY))
+def test_legacy_reference(legacy, name):
+    trades, returns, _, _ = legacy[name]
+    assert (len(trades), returns[-1]) == LEGACY[name]
+
+
+@pytest.mark.parametrize('name', sorted(LEGACY))
+@pytest.mark.parametrize('ledger', ['decimal', 'fixed'])
+@pytest.mark.parametrize('mark_to_market', ['bar', 'deferred'])
+def test_fills_match_legacy_merge(prices, factors, legacy, name, ledger, mark_to_market):
+    result = run(strategies(factors)[name], prices, ledger=ledger, mark_to_market=mark_to_market)
+    trades, returns, long_returns, short_returns = summary(result)
+    expected = legacy[name]
+    assert len(trades) == len(expected[0])
+    assert trades == expected[0]
+    assert returns == expected[1]
+    assert long_returns == expected[2]
+    assert short_returns == expected[3]
+
+
+@pytest.mark.parametrize('ledger', ['decimal', 'fixed'])
+def test_fills_merge_at_end_of_bar(ledger):
+    from athena.ledger import FixedBroker
+    broker = (FixedBroker if ledger == 'fixed' else Broker)(cash=100_000, commission=0.001)
+    broker.log_text = False
+    broker.date = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        broker.open(10.0, 100, symbol='A')
+        broker.open(12.0, 300, symbol='A')
+        broker.open(20.0, 50, symbol='A', short=True)
+
+    # bar内各自记账
+    assert len(broker.symbol_index['A']) == 3
+    assert broker.long_positions['A'] is broker.open_positions[0]
+
+    broker.mark_to_market(1, {('A', 'Close'): 11.0})
+    assert len(broker.open_positions) == 2
+    merged = broker.long_positions['A']
+    assert broker.open_positions[0] is merged
+    assert merged.position_size == Decimal('400')
+    assert merged.open_price == Decimal('11.5')
+    assert float(merged.open_commission) == 4.6
+    assert broker.symbol_index['A'] == [merged, broker.short_positions['A']]
+
+
+@pytest.mark.parametrize('ledger', ['decimal', 'fixed'])
+def test_close_symbol_closes_every_entry_in_order(ledger):
+    from athena.ledger import FixedBroker
+    broker = (FixedBroker if ledger == 'fixed' else Broker)(cash=100_000, commission=0.0)
+    broker.log_text = False
+    broker.date = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        broker.open(10.0, 100, symbol='A')
+        broker.open(10.0, 100, symbol='B')
+        broker.open(11.0, 200, symbol='A')
+        broker.open(12.0, 300, symbol='A', short=True)
+
+        # 部分平仓不删除仓位, 每个仓位各平一次
+        broker.close(13.0, symbol='A', size=50)
+        assert [float(trade.position_size) for trade in broker.trades] == [50, 50, 50]
+        assert [float(p.position_size) for p in broker.symbol_index['A']] == [50, 150, 250]
+
+        broker.close(13.0, symbol='A')
+    assert [float(trade.open_price) for trade in broker.trades[3:]] == [10, 11, 12]
+    assert 'A' not in broker.symbol_index
+    assert 'A' not in broker.long_positions and 'A' not in broker.short_positions
+    assert [p.symbol for p in broker.open_positions] == ['B']
+    assert list(broker.position_book) == [('B', False)]
+
+
+def test_remove_keeps_order_and_replaces_book_entry():
+    broker = Broker(cash=100_000, commission=0.0)
+    broker.log_text = False
+    broker.date = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for symbol in 'ABCD':
+            broker.open(10.0, 10, symbol=symbol)
+        broker.open(11.0, 10, symbol='B')
+    first_b, second_b = broker.symbol_index['B']
+
+    broker.close(12.0, position=first_b)
+    assert broker.long_positions['B'] is second_b
+    assert broker.position_book[('B', False)] is second_b
+    broker.close(12.0, symbol='C')
+    assert [p.symbol for p in broker.open_positions] == ['A', 'D', 'B']
+
+    # 整体替换持仓时重建索引
+    broker.open_positions = broker.open_positions[:2]
+    assert list(broker.symbol_index) == ['A', 'D']
+    assert broker.current_position_count() == (2, 0)
+
+
+@pytest.mark.parametrize('ledger', ['decimal', 'fixed'])
+def test_position_status_lists_every_open_position(ledger):
+    from athena.ledger import FixedBroker
+    broker = (FixedBroker if ledger == 'fixed' else Broker)(cash=100_000, commission=0.0)
+    broker.log_text = False
+    broker.date = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        broker.open(10.0, 10, symbol='A')
+        broker.open(10.0, 10, symbol='B', short=True)
+        broker.open(11.0, 10, symbol='A')
+        # bar结束合并之前, 同一标的的两个仓位各算一个(与原来遍历open_positions一致)
+        assert broker.current_position_status() == (['A', 'A'], ['B'])
+        assert broker.current_position_count() == (2, 1)
+
+        broker.mark_to_market(1, {('A', 'Close'): 11.0, ('B', 'Close'): 10.0})
+        assert broker.current_position_status() == (['A'], ['B'])
+        assert broker.current_position_count() == (1, 1)
+
+
+def test_position_status_follows_open_order_after_close():
+    broker = Broker(cash=100_000, commission=0.0)
+    broker.log_text = False
+    broker.date = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        for symbol in 'ABA':
+            broker.open(10.0, 10, symbol=symbol)
+        broker.close(12.0, position=broker.symbol_index['A'][0])
+    assert [p.symbol for p in broker.open_positions] == ['B', 'A']
+    assert broker.current_position_status() == (['B', 'A'], [])
+    assert broker.current_position_count() == (2, 0)
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import types
+
+import pandas as pd
+
+import athena.data as data
+from athena.cache import DataCache
+
+
+def stub_value(symbol, date, field):
+    '''每个(标的, 日期, 字段)对应确定的数值, 方便核对缓存读出的数据'''
+    return int(symbol[1:]) * 1e6 + date.dayofyear * 10 + len(field)
+
+
+class StubAPI:
+    '''模拟数据接口: 只返回工作日的数据, 并记录每次调用的标的和区间'''
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, symbols, start, end):
+        self.calls.append((sorted(symbols), pd.Timestamp(start), pd.Timestamp(end)))
+        rows = [{'date': date.strftime('%Y-%m-%d'), 'symbol': symbol,
+                 **{field: stub_value(symbol, date, field) for field in ('close', 'open')}}
+                for date in pd.bdate_range(start, end) for symbol in symbols]
+        return pd.DataFrame(rows, columns=['date', 'symbol', 'close', 'open'])
+
+
+def expected_long(symbols, fields, start, end):
+    dates = pd.bdate_range(start, end)
+    frames = [pd.DataFrame({'date': dates, 'symbol': symbol,
+                            **{field: [stub_value(symbol, d, field) for d in dates] for field in fields}})
+              for symbol in symbols]
+    return pd.concat(frames, ignore_index=True)
+
+
+def fetch(cache, api, symbols, start, end, fields=('close',)):
+    return cache.fetch('stub', '1d', symbols, list(fields), start, end, api, 'date', 'symbol')
+
+
+def assert_long_equal(result, expected):
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected,
+                                  check_dtype=False, check_index_type=False)
+
+
+def test_repeat_request_reads_cache(tmp_path):
+    cache, api = DataCache(str(tmp_path)), StubAPI()
+    first = fetch(cache, api, ['S1', 'S2'], '2024-01-01', '2024-01-31')
+    assert api.calls == [(['S1', 'S2'], pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-31'))]
+
+    # 同一区间或子区间不再调用接口, 新建的 DataCache 也能读到磁盘上的缓存
+    second = fetch(DataCache(str(tmp_path)), api, ['S1', 'S2'], '2024-01-01', '2024-01-31')
+    inner = fetch(cache, api, ['S2'], '2024-01-10', '2024-01-20')
+    assert len(api.calls) == 1
+    expected = expected_long(['S1', 'S2'], ['close'], '2024-01-01', '2024-01-31')
+    assert_long_equal(first, expected)
+    assert_long_equal(second, expected)
+    assert_long_equal(inner, expected_long(['S2'], ['close'], '2024-01-10', '2024-01-20'))
+
+
+def test_wider_range_fetches_only_missing_part(tmp_path):
+    cache, api = DataCache(str(tmp_path)), StubAPI()
+    fetch(cache, api, ['S1', 'S2'], '2024-02-01', '2024-02-29')
+    api.calls.clear()
+
+    result = fetch(cache, api, ['S1', 'S2'], '2024-01-15', '2024-03-15')
+    assert api.calls == [
+        (['S1', 'S2'], pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-31')),
+        (['S1', 'S2'], pd.Timestamp('2024-03-01'), pd.Timestamp('2024-03-15')),
+    ]
+    assert_long_equal(result, expected_long(['S1', 'S2'], ['close'], '2024-01-15', '2024-03-15'))
+
+    # 扩大后的区间已经全部缓存
+    api.calls.clear()
+    fetch(cache, api, ['S1', 'S2'], '2024-01-15', '2024-03-15')
+    assert api.calls == []
+
+
+def test_symbols_grouped_by_missing_ranges(tmp_path):
+    cache, api = DataCache(str(tmp_path)), StubAPI()
+    fetch(cache, api, ['S1'], '2024-01-01', '2024-01-31')
+    fetch(cache, api, ['S2'], '2024-01-15', '2024-01-31')
+    api.calls.clear()
+
+    result = fetch(cache, api, ['S1', 'S2', 'S3', 'S4'], '2024-01-01', '2024-01-31')
+    assert sorted(api.calls) == [
+        (['S2'], pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-14')),
+        (['S3', 'S4'], pd.Timestamp('2024-01-01'), pd.Timestamp('2024-01-31')),
+    ]
+    assert_long_equal(result, expected_long(['S1', 'S2', 'S3', 'S4'], ['close'], '2024-01-01', '2024-01-31'))
+
+
+def test_new_field_downloads_again(tmp_path):
+    cache, api = DataCache(str(tmp_path)), StubAPI()
+    fetch(cache, api, ['S1'], '2024-01-01', '2024-01-31')
+    result = fetch(cache, api, ['S1'], '2024-01-01', '2024-01-31', fields=('open', 'close'))
+    assert len(api.calls) == 2
+    assert_long_equal(result, expected_long(['S1'], ['open', 'close'], '2024-01-01', '2024-01-31'))
+
+    fetch(cache, api, ['S1'], '2024-01-01', '2024-01-31', fields=('open',))
+    assert len(api.calls) == 2
+
+
+def test_empty_response_marks_range_cached(tmp_path):
+    cache, calls = DataCache(str(tmp_path)), []
+
+    def suspended(symbols, start, end):
+        calls.append(symbols)
+        return None
+
+    result = fetch(cache, suspended, ['S1'], '2024-01-01', '2024-01-31')
+    assert result.empty
+    fetch(cache, suspended, ['S1'], '2024-01-01', '2024-01-31')
+    assert len(calls) == 1
+
+
+def test_ricequant_handler_extends_cached_range(tmp_path, monkeypatch):
+    api = StubAPI()
+
+    def get_price(symbols, start_date, end_date, frequency, fields):
+        prices = api(symbols, start_date, end_date).rename(columns={'symbol': 'order_book_id'})
+        return prices.set_index(['order_book_id', 'date'])[fields]
+
+    monkeypatch.setattr(data, '_rqdatac', lambda: types.SimpleNamespace(get_price=get_price))
+    cache = DataCache(str(tmp_path))
+    with contextlib.redirect_stdout(io.StringIO()):
+        data.RiceQuantDataHandler('2024-02-01', '2024-02-29', cache=cache).get_prices_from_ricequant(['S1', 'S2'])
+        wide = data.RiceQuantDataHandler('2024-01-15', '2024-02-29', cache=cache).get_prices_from_ricequant(['S1', 'S2'])
+
+    assert [call[1:] for call in api.calls] == [
+        (pd.Timestamp('2024-02-01'), pd.Timestamp('2024-02-29')),
+        (pd.Timestamp('2024-01-15'), pd.Timestamp('2024-01-31')),
+    ]
+    dates = pd.bdate_range('2024-01-15', '2024-02-29')
+    pd.testing.assert_index_equal(wide.index, pd.DatetimeIndex(dates, name='date'))
+    assert list(wide.columns) == [('S1', 'Close'), ('S2', 'Close')]
+    assert wide[('S2', 'Close')].tolist() == [stub_value('S2', d, 'close') for d in dates]
@@ -0,0 +1,137 @@
+import contextlib
+import io
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import athena.data as data
+from athena.data import CryptoDataHandler
+
+INGEST = data._ingest_crypto_file
+SYMBOLS = ['BTCUSDT', 'ETHUSDT', 'SOLUSDT', 'BNBUSDT']
+
+
+class RecordIngest:
+    '''记录重新读取的文件, 写到日志文件里, 子进程中调用也能记录'''
+    def __init__(self, log_path):
+        self.log_path = log_path
+
+    def __call__(self, task):
+        with open(self.log_path, 'a') as f:
+            f.write(os.path.basename(task[0]) + '\n')
+        return INGEST(task)
+
+    def read(self):
+        if not os.path.exists(self.log_path):
+            return []
+        with open(self.log_path) as f:
+            names = sorted(f.read().split())
+        os.remove(self.log_path)
+        return names
+
+
+def binance_frame(symbol, shift=0.0, periods=96):
+    '''币安K线格式: Open time 为时间列, 数值以字符串保存'''
+    rng = np.random.default_rng(SYMBOLS.index(symbol))
+    close = 100 + np.cumsum(rng.normal(0, 1, periods)) + shift
+    return pd.DataFrame({
+        'Open time': pd.date_range('2024-01-01', periods=periods, freq='15min').strftime('%Y-%m-%d %H:%M:%S'),
+        'Open': (close - 0.5).astype(str),
+        'Close': close.astype(str),
+        'Volume': rng.integers(1, 1000, periods).astype(str),
+    })
+
+
+def write_file(directory, symbol, frame):
+    path = os.path.join(directory, f'{symbol}_15m.pkl')
+    frame.to_pickle(path)
+    return path
+
+
+def expected_panel(frames, fields=('Open', 'Close')):
+    panels = {}
+    for symbol in sorted(frames, key=lambda s: f'{s}_15m.pkl'):
+        df = frames[symbol]
+        values = df[list(fields)].apply(pd.to_numeric)
+        values.index = pd.DatetimeIndex(pd.to_datetime(df['Open time']), name='trade_date')
+        panels[symbol] = values
+    return pd.concat(panels, axis=1)
+
+
+@pytest.fixture
+def source(tmp_path):
+    directory = tmp_path / 'klines'
+    directory.mkdir()
+    frames = {symbol: binance_frame(symbol) for symbol in SYMBOLS}
+    for symbol, frame in frames.items():
+        write_file(str(directory), symbol, frame)
+    return str(directory), frames
+
+
+def load(directory, processes, store_path=None, fields=('Open', 'Close')):
+    handler = CryptoDataHandler(None, None)
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = handler.create_prices_dataframe(directory, fields=list(fields), processes=processes,
+                                             store_path=store_path)
+    # 目录的遍历顺序和系统有关, 按标的排序后比较
+    return df.reindex(columns=sorted(df.columns, key=lambda c: (f'{c[0]}_15m.pkl', list(fields).index(c[1]))))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_load_matches_files(source, processes):
+    directory, frames = source
+    pd.testing.assert_frame_equal(load(directory, processes), expected_panel(frames))
+    pd.testing.assert_frame_equal(load(directory, processes, fields=['Close']), expected_panel(frames, ['Close']))
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_store_reloads_only_changed_files(source, tmp_path, monkeypatch, processes):
+    directory, frames = source
+    store_path = str(tmp_path / 'store.h5')
+    recorder = RecordIngest(str(tmp_path / 'ingested.log'))
+    monkeypatch.setattr(data, '_ingest_crypto_file', recorder)
+
+    pd.testing.assert_frame_equal(load(directory, processes, store_path), expected_panel(frames))
+    assert recorder.read() == sorted(f'{symbol}_15m.pkl' for symbol in SYMBOLS)
+
+    # 没有变化时全部从合并存储读取, 其他字段也在存储里
+    pd.testing.assert_frame_equal(load(directory, processes, store_path, fields=['Close', 'Volume']),
+                                  expected_panel(frames, ['Close', 'Volume']))
+    assert recorder.read() == []
+
+    # 改写一个文件(修改时间变化)
+    frames['ETHUSDT'] = binance_frame('ETHUSDT', shift=50.0)
+    path = write_file(directory, 'ETHUSDT', frames['ETHUSDT'])
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    pd.testing.assert_frame_equal(load(directory, processes, store_path), expected_panel(frames))
+    assert recorder.read() == ['ETHUSDT_15m.pkl']
+
+    # 修改时间不变、大小变化
+    frames['SOLUSDT'] = binance_frame('SOLUSDT', periods=80)
+    path = os.path.join(directory, 'SOLUSDT_15m.pkl')
+    stat = os.stat(path)
+    write_file(directory, 'SOLUSDT', frames['SOLUSDT'])
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert os.stat(path).st_size != stat.st_size
+    pd.testing.assert_frame_equal(load(directory, processes, store_path), expected_panel(frames))
+    assert recorder.read() == ['SOLUSDT_15m.pkl']
+
+    # 删除的文件从存储中移除
+    os.remove(os.path.join(directory, 'BNBUSDT_15m.pkl'))
+    del frames['BNBUSDT']
+    pd.testing.assert_frame_equal(load(directory, processes, store_path), expected_panel(frames))
+    assert recorder.read() == []
+    with pd.HDFStore(store_path, mode='r') as store:
+        assert sorted(store.get('manifest').index) == sorted(f'{symbol}_15m.pkl' for symbol in frames)
+        assert len([key for key in store.keys() if key.startswith('/files/')]) == len(frames)
+
+
+def test_bad_files_are_skipped(source):
+    directory, frames = source
+    pd.DataFrame({'Close': ['1']}).to_pickle(os.path.join(directory, 'XRPUSDT_15m.pkl'))
+    with open(os.path.join(directory, 'ADAUSDT_15m.pkl'), 'wb') as f:
+        f.write(b'not a pickle')
+    pd.testing.assert_frame_equal(load(directory, 2), expected_panel(frames))
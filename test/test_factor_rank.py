@@ -0,0 +1,92 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import classify_factors_into_buckets, factor_rank_matrix, sort_the_factor
+from athena.factor_research import _bucket_lookup
+
+from conftest import DATA
+
+
+@pytest.fixture(scope='module')
+def multi_sort_factors():
+    return pd.read_hdf(os.path.join(DATA, 'factors_data_multi_sort.h5'))
+
+
+def per_date_buckets(factors_df, date, factor, buckets, ascending=True):
+    '''原来逐日的分桶方式: sort_the_factor 从高到低排序后 pd.qcut'''
+    return classify_factors_into_buckets(sort_the_factor(factors_df.loc[date], factor), buckets, ascending)
+
+
+@pytest.mark.parametrize('buckets', [5, 10])
+@pytest.mark.parametrize('ascending', [True, False])
+@pytest.mark.parametrize('source, factor', [
+    ('factors', 'total_mv'), ('multi_sort_factors', 'total_mv'), ('multi_sort_factors', 'pe_ttm'),
+])
+def test_rank_matrix_matches_per_date_buckets(request, source, factor, buckets, ascending):
+    factors_df = request.getfixturevalue(source)
+    ranks, labels = factor_rank_matrix(factors_df, factor, buckets, ascending)
+    for date in factors_df.index:
+        expected = per_date_buckets(factors_df, date, factor, buckets, ascending)
+        row = labels.loc[date]
+        assert row.dropna().index.sort_values().equals(expected.index.sort_values())
+        np.testing.assert_array_equal(row[expected.index].to_numpy(), expected.to_numpy())
+
+        values = factors_df.loc[date].xs(factor, level=1)[expected.index]
+        expected_ranks = (values if ascending else -values).rank(pct=True)
+        np.testing.assert_allclose(ranks.loc[date, expected.index].to_numpy(), expected_ranks.to_numpy())
+
+
+@pytest.mark.parametrize('source, factor', [
+    ('factors', 'total_mv'), ('multi_sort_factors', 'total_mv'), ('multi_sort_factors', 'pe_ttm'),
+])
+def test_bucket_lookup_keeps_sort_the_factor_order(request, source, factor):
+    factors_df = request.getfixturevalue(source)
+    if factor == 'pe_ttm':
+        # pe_ttm 有相同的因子值, 检查并列时的先后顺序
+        values = factors_df.xs(factor, axis=1, level=1)
+        assert values.apply(lambda row: row[row != 0].dropna().duplicated().any(), axis=1).any()
+
+    targets = _bucket_lookup(factors_df, factor, 5)
+    for date in factors_df.index:
+        expected = per_date_buckets(factors_df, date, factor, 5)
+        got = targets(date)
+        for k in range(1, 6):
+            assert got[k] == expected.index[expected == k].tolist()
+
+
+def tied_factors():
+    '''半数标的因子值相同, 分位数边界重复'''
+    symbols = [f'S{k}' for k in range(10)]
+    dates = pd.date_range('2024-01-01', periods=3)
+    values = np.array([
+        np.arange(1, 11),
+        [1, 1, 1, 1, 1, 1, 2, 3, 4, 5],
+        [0, np.nan, 7, 7, 7, 7, 7, 7, 8, 9],
+    ], dtype=float)
+    columns = pd.MultiIndex.from_product([symbols, ['f']])
+    return pd.DataFrame(values, index=dates, columns=columns)
+
+
+def test_duplicate_edges_raise_like_qcut():
+    factors_df = tied_factors()
+    with pytest.raises(ValueError):
+        per_date_buckets(factors_df, factors_df.index[1], 'f', 5)
+    with pytest.raises(ValueError, match='duplicates'):
+        factor_rank_matrix(factors_df, 'f', 5)
+
+    targets = _bucket_lookup(factors_df, 'f', 5)
+    assert targets(factors_df.index[0])[5] == ['S9', 'S8']
+    with pytest.raises(ValueError):
+        targets(factors_df.index[1])
+
+
+def test_duplicate_edges_drop_matches_qcut_drop():
+    factors_df = tied_factors()
+    _, labels = factor_rank_matrix(factors_df, 'f', 5, duplicates='drop')
+    for date in factors_df.index:
+        series = sort_the_factor(factors_df.loc[date], 'f').iloc[:, 0]
+        expected = pd.qcut(series, 5, labels=False, duplicates='drop') + 1
+        np.testing.assert_array_equal(labels.loc[date, expected.index].to_numpy(), expected.to_numpy())
@@ -0,0 +1,147 @@
+import contextlib
+import io
+import threading
+import time
+import types
+
+import pandas as pd
+import pytest
+
+import athena.data as data
+import athena.fetch as fetch
+from athena.fetch import TokenBucket, batched, call_with_retry, fetch_concurrent
+
+
+class Flaky:
+    '''前 failures 次调用抛出异常, 之后返回 x * 10, 记录调用次数'''
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, x):
+        with self.lock:
+            self.calls += 1
+            fail = self.calls <= self.failures
+        if fail:
+            raise ConnectionError('timeout')
+        return x * 10
+
+
+def test_call_with_retry_backs_off_then_succeeds(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fetch.time, 'sleep', sleeps.append)
+    func = Flaky(failures=2)
+    assert call_with_retry(func, {'x': 3}, retries=3, backoff=0.5) == 30
+    assert func.calls == 3
+    assert sleeps == [0.5, 1.0]
+
+
+def test_call_with_retry_raises_after_last_attempt(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(fetch.time, 'sleep', sleeps.append)
+    func = Flaky(failures=10)
+    with pytest.raises(ConnectionError):
+        call_with_retry(func, {'x': 3}, retries=2, backoff=1.0)
+    assert func.calls == 3
+    assert sleeps == [1.0, 2.0]
+
+
+def test_fetch_concurrent_keeps_task_order():
+    finished = []
+
+    def slow(x):
+        # 排在前面的任务最晚完成
+        time.sleep(0.02 * (8 - x))
+        finished.append(x)
+        return x * 10
+
+    tasks = [{'x': x} for x in range(8)]
+    assert fetch_concurrent(slow, tasks, workers=8, backoff=0) == [x * 10 for x in range(8)]
+    assert finished != sorted(finished)
+
+
+def test_fetch_concurrent_retries_each_task():
+    failing = {2: Flaky(failures=1), 5: Flaky(failures=2)}
+
+    def api(x):
+        return failing[x](x) if x in failing else x * 10
+
+    tasks = [{'x': x} for x in range(8)]
+    assert fetch_concurrent(api, tasks, workers=4, retries=2, backoff=0) == [x * 10 for x in range(8)]
+    assert failing[2].calls == 2 and failing[5].calls == 3
+
+    failing = {4: Flaky(failures=10)}
+    with pytest.raises(ConnectionError):
+        fetch_concurrent(api, tasks, workers=4, retries=1, backoff=0)
+
+
+def test_token_bucket_limits_rate():
+    limiter = TokenBucket(rate=50, capacity=1)
+    start = time.monotonic()
+    fetch_concurrent(lambda x: x, [{'x': x} for x in range(6)], workers=3, limiter=limiter, backoff=0)
+    # 第一次调用用掉初始令牌, 之后每次等待 1/50 秒
+    assert time.monotonic() - start >= 5 / 50 * 0.9
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_batched():
+    assert batched(list('abcde'), 2) == [['a', 'b'], ['c', 'd'], ['e']]
+    assert batched(list('ab'), 0) == [['a'], ['b']]
+
+
+def stub_tushare(daily):
+    pro = types.SimpleNamespace(daily=daily)
+    return types.SimpleNamespace(set_token=lambda token: None, pro_api=lambda: pro)
+
+
+def test_tushare_prices_concurrent_with_retries(monkeypatch):
+    stocks = [f'{k:06d}.SZ' for k in range(1, 7)]
+    dates = pd.bdate_range('2024-01-02', '2024-01-12')
+    attempts = {}
+    lock = threading.Lock()
+
+    def daily(ts_code, start_date, end_date):
+        with lock:
+            attempts[ts_code] = attempts.get(ts_code, 0) + 1
+            first = attempts[ts_code] == 1
+        if first and ts_code in stocks[::2]:
+            raise ConnectionError('timeout')
+        time.sleep(0.01 * (6 - stocks.index(ts_code)))
+        assert (start_date, end_date) == ('20240102', '20240112')
+        # tushare按日期降序返回
+        return pd.DataFrame({'trade_date': dates[::-1].strftime('%Y%m%d'),
+                             'close': [stocks.index(ts_code) * 100 + d.day for d in dates[::-1]]})
+
+    monkeypatch.setattr(data, '_tushare', lambda: stub_tushare(daily))
+    handler = data.TushareDataHandler('20240102', '20240112', token='stub', workers=4,
+                                      calls_per_minute=None, retries=2, backoff=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        prices = handler.get_prices_from_tushare(stocks)
+
+    assert attempts == {stock: 2 if stock in stocks[::2] else 1 for stock in stocks}
+    assert list(prices.columns) == [(stock, 'Close') for stock in stocks]
+    assert prices.index.equals(pd.DatetimeIndex(dates, name='trade_date'))
+    for k, stock in enumerate(stocks):
+        assert prices[(stock, 'Close')].tolist() == [k * 100 + d.day for d in dates]
+
+
+def test_tushare_batches_respect_max_rows(monkeypatch):
+    stocks = [f'{k:06d}.SH' for k in range(1, 8)]
+    requested = []
+
+    def daily(ts_code, start_date, end_date):
+        requested.append(ts_code)
+        return pd.DataFrame({'trade_date': ['20240102'] * len(ts_code.split(',')),
+                             'ts_code': ts_code.split(','), 'close': 1.0})
+
+    monkeypatch.setattr(data, '_tushare', lambda: stub_tushare(daily))
+    # 5个交易日, 每次最多12行 -> 每批2只股票
+    handler = data.TushareDataHandler('20240102', '20240108', token='stub', workers=2,
+                                      calls_per_minute=None, max_rows=12, backoff=0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        prices = handler.get_prices_from_tushare_parallel(stocks)
+
+    assert sorted(requested) == [','.join(batch) for batch in batched(stocks, 2)]
+    assert list(prices.columns.get_level_values(0)) == stocks
@@ -0,0 +1,106 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import Backtest, Strategy, iter_hdf_panel, read_hdf_panel, save_hdf_panel
+
+
+@pytest.fixture(scope='module')
+def panel(prices):
+    df = prices.iloc[:120, :48].copy()
+    df.iloc[5:9, 3] = np.nan
+    return df
+
+
+@pytest.fixture(scope='module')
+def path(panel, tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('hdf') / 'panel.h5')
+    save_hdf_panel(panel, path)
+    return path
+
+
+def symbols_of(panel):
+    return list(panel.columns.get_level_values(0).unique())
+
+
+def expected(panel, start_date=None, end_date=None, symbols=None, fields=None):
+    '''用 df.loc 取出同样的部分, 列保持原来的顺序'''
+    mask = np.ones(panel.shape[1], dtype=bool)
+    if symbols is not None:
+        mask &= panel.columns.get_level_values(0).isin(symbols)
+    if fields is not None:
+        mask &= panel.columns.get_level_values(1).isin(fields)
+    return panel.loc[start_date:end_date, mask]
+
+
+def test_round_trip(panel, path):
+    pd.testing.assert_frame_equal(read_hdf_panel(path), panel)
+
+
+def filters(panel):
+    dates, symbols = panel.index, symbols_of(panel)
+    return [
+        {'start_date': dates[30]},
+        {'end_date': dates[70]},
+        # 不在索引上的日期
+        {'start_date': dates[10] + pd.Timedelta(hours=1), 'end_date': dates[40] - pd.Timedelta(hours=1)},
+        {'symbols': [symbols[7], symbols[2], 'MISSING']},
+        {'fields': ['Close']},
+        {'fields': ['Close', 'Open'], 'symbols': symbols[::3]},
+        {'start_date': dates[50], 'end_date': dates[59], 'symbols': symbols[:4], 'fields': ['Open']},
+    ]
+
+
+@pytest.mark.parametrize('k', range(7))
+def test_filters_match_loc(panel, path, k):
+    kwargs = filters(panel)[k]
+    pd.testing.assert_frame_equal(read_hdf_panel(path, **kwargs), expected(panel, **kwargs))
+
+
+@pytest.mark.parametrize('k', range(7))
+@pytest.mark.parametrize('chunksize', [1, 17, 1000])
+def test_chunks_join_back(panel, path, k, chunksize):
+    kwargs = filters(panel)[k]
+    chunks = list(iter_hdf_panel(path, chunksize=chunksize, **kwargs))
+    assert all(len(chunk) <= chunksize for chunk in chunks)
+    pd.testing.assert_frame_equal(pd.concat(chunks), expected(panel, **kwargs))
+
+
+def test_empty_selections(panel, path):
+    assert read_hdf_panel(path, start_date='2100-01-01').empty
+    assert read_hdf_panel(path, symbols=['MISSING']).empty
+    assert list(iter_hdf_panel(path, fields=['Volume'])) == []
+
+
+def test_save_replaces_existing_key(panel, path, tmp_path):
+    copy = str(tmp_path / 'panel.h5')
+    save_hdf_panel(panel, copy)
+    save_hdf_panel(panel.loc[:, (slice(None), 'Close')], copy)
+    with pd.HDFStore(copy, mode='r') as store:
+        assert sorted(store.keys()) == ['/prices/Close', '/prices/_columns']
+    pd.testing.assert_frame_equal(read_hdf_panel(copy), expected(panel, fields=['Close']))
+
+    save_hdf_panel(panel, copy, key='other')
+    pd.testing.assert_frame_equal(read_hdf_panel(copy, key='other'), panel)
+    with pytest.raises(ValueError):
+        save_hdf_panel(panel.xs('Close', axis=1, level=1), copy)
+
+
+class Hold(Strategy):
+    def init(self):
+        pass
+
+    def next(self, i, record):
+        if i == 0:
+            for symbol in self.symbols[:3]:
+                self.order_target_percent(symbol, 0.2, record[(symbol, 'Close')])
+
+
+def test_chunks_as_backtest_source(panel, path):
+    with contextlib.redirect_stdout(io.StringIO()):
+        streamed = Backtest(Hold, iter_hdf_panel(path, chunksize=25), cash=100_000, verbosity='off').run()
+        in_memory = Backtest(Hold, panel, cash=100_000, verbosity='off').run()
+    pd.testing.assert_series_equal(streamed.returns, in_memory.returns)
@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+
+from conftest import ROOT
+
+# numpy/pandas 已经导入后, import athena 的耗时上限(秒); 本机实测约 25ms
+IMPORT_BUDGET = 0.06
+LAZY_MODULES = ['rqdatac', 'tushare', 'matplotlib']
+
+SCRIPT = '''
+import json, logging, sys, time
+import numpy, pandas
+start = time.perf_counter()
+from athena import Backtest, Strategy
+import athena.plotting, athena.data
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'elapsed': elapsed,
+    'loaded': [name for name in %r if name in sys.modules],
+    'handlers': len(logging.getLogger().handlers),
+}))
+''' % LAZY_MODULES
+
+
+def import_athena():
+    '''在新的解释器中导入athena, 返回耗时和已加载的可选依赖'''
+    output = subprocess.run([sys.executable, '-c', SCRIPT], cwd=ROOT, check=True,
+                            capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_does_not_load_optional_dependencies():
+    report = import_athena()
+    assert report['loaded'] == []
+    # 导入时不配置日志
+    assert report['handlers'] == 0
+
+
+def test_import_time_within_budget():
+    # 取三次中最快的一次, 避免偶尔的调度抖动
+    elapsed = min(import_athena()['elapsed'] for _ in range(3))
+    assert elapsed < IMPORT_BUDGET, f'import athena 耗时 {elapsed * 1e3:.1f}ms, 超过 {IMPORT_BUDGET * 1e3:.0f}ms'
@@ -0,0 +1,91 @@
+import contextlib
+import importlib
+import io
+import os
+
+import pytest
+
+from athena import Backtest, Strategy
+from athena import log_config
+from athena.journal import EventJournal, read_journal
+
+
+class Hold(Strategy):
+    def init(self):
+        pass
+
+    def next(self, i, record):
+        symbol = self.symbols[0]
+        if i == 0:
+            self.open(record[(symbol, 'Close')], 0.5, symbol=symbol, is_fractional=True)
+        elif i == 10:
+            self.close(record[(symbol, 'Close')], symbol=symbol)
+
+
+def test_journal_round_trip(tmp_path, prices):
+    path = str(tmp_path / 'run.journal')
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = Backtest(Hold, prices.iloc[:20], cash=100_000, commission=0.001,
+                          verbosity='journal', journal_path=path).run()
+    df = read_journal(path)
+    assert df['event'].value_counts().to_dict() == {'bar': 20, 'equity': 20, 'open': 1, 'close': 1}
+    assert df.loc[df['event'] == 'equity', 'value'].tolist() == result.returns.tolist()
+    assert df.loc[df['event'] == 'open', 'symbol'].item() == prices.columns[0][0]
+
+
+def test_bad_path_fails_on_construction(tmp_path):
+    with pytest.raises(OSError):
+        EventJournal(str(tmp_path / 'missing' / 'run.journal'))
+
+
+def failing_write(f, item):
+    raise OSError('disk full')
+
+
+def test_writer_error_raised_from_flush(tmp_path):
+    journal = EventJournal(str(tmp_path / 'run.journal'))
+    journal._write = failing_write
+    journal.record_bar(0, 1.0, 0.0)
+    with pytest.raises(OSError, match='disk full'):
+        journal.flush()
+    # 之后的flush和close也会报错, 且后台线程已经结束
+    journal.record_bar(1, 1.0, 0.0)
+    with pytest.raises(OSError, match='disk full'):
+        journal.flush()
+    with pytest.raises(OSError, match='disk full'):
+        journal.close()
+    assert not journal._writer.is_alive()
+
+
+def test_writer_error_raised_from_close(tmp_path):
+    journal = EventJournal(str(tmp_path / 'run.journal'), capacity=4)
+    journal._write = failing_write
+    for bar in range(3):
+        journal.record_bar(bar, 1.0, 0.0)
+    with pytest.raises(OSError, match='disk full'):
+        journal.close()
+    assert not journal._writer.is_alive()
+
+
+def test_writer_error_surfaces_from_backtest(tmp_path, prices, monkeypatch):
+    monkeypatch.setattr(EventJournal, '_write', lambda self, f, item: failing_write(f, item))
+    with pytest.raises(OSError, match='disk full'), contextlib.redirect_stdout(io.StringIO()):
+        Backtest(Hold, prices.iloc[:20], cash=100_000, verbosity='journal',
+                 journal_path=str(tmp_path / 'run.journal')).run()
+
+
+def test_default_journal_path_under_log_directory(monkeypatch, tmp_path):
+    try:
+        monkeypatch.delenv('journal_path', raising=False)
+        monkeypatch.delenv('log_path', raising=False)
+        importlib.reload(log_config)
+        assert log_config.journal_path == os.path.join(
+            os.path.dirname(log_config.__file__), 'log', 'backtest.journal'
+        )
+
+        monkeypatch.setenv('log_path', str(tmp_path / 'logs' / 'backtest_log.txt'))
+        importlib.reload(log_config)
+        assert log_config.journal_path == str(tmp_path / 'logs' / 'backtest_log.journal')
+    finally:
+        monkeypatch.undo()
+        importlib.reload(log_config)
@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena.data import long_to_wide
+
+MAPPING = {'open': 'Open', 'close': 'Close', 'vol': 'Volume'}
+
+
+def random_long_frame(n_symbols, n_days, missing=0.05, seed=0):
+    '''乱序且缺失部分行的长表 (trade_date, ts_code, open, close, vol)'''
+    rng = np.random.default_rng(seed)
+    days = pd.bdate_range('2020-01-01', periods=n_days)
+    df = pd.DataFrame({
+        'trade_date': np.tile(days, n_symbols),
+        'ts_code': np.repeat([f'{k:06d}.SZ' for k in range(n_symbols)], n_days),
+    })
+    df = df[rng.random(len(df)) > missing].sample(frac=1, random_state=seed)
+    for field in MAPPING:
+        df[field] = rng.random(len(df))
+    return df.reset_index(drop=True)
+
+
+def legacy_tushare_wide(combined_data, fields, field_mapping=MAPPING):
+    '''原来tushare接口的转换方式: 逐只股票、逐个字段用布尔索引取出序列再拼成大表'''
+    combined_data = combined_data.set_index(['trade_date', 'ts_code'])[fields]
+    combined_data = combined_data.rename(columns=field_mapping)
+    new_structure_data = {}
+    for stock in combined_data.index.get_level_values('ts_code').unique():
+        for field in [field_mapping.get(field, field) for field in fields]:
+            series = combined_data.loc[combined_data.index.get_level_values('ts_code') == stock, field]
+            new_structure_data[(stock, field)] = series.droplevel('ts_code')
+    return pd.DataFrame(new_structure_data).sort_index(ascending=True)
+
+
+def legacy_ricequant_wide(asset_prices, fields):
+    '''原来米筐接口的转换方式: 日期按第一次出现的顺序, 逐个标的reindex'''
+    field_mapping = {field: field.capitalize() for field in fields}
+    asset_prices = asset_prices.rename(columns=field_mapping).set_index('date')
+    new_structure_data = {}
+    for order_book_id in asset_prices['order_book_id'].unique():
+        for new_field in field_mapping.values():
+            series = asset_prices.loc[asset_prices['order_book_id'] == order_book_id, new_field]
+            new_structure_data[(order_book_id, new_field)] = series.reindex(asset_prices.index.unique()).values
+    return pd.DataFrame(new_structure_data, index=asset_prices.index.unique())
+
+
+@pytest.mark.parametrize('fields', [['close'], ['open', 'close', 'vol'], ['vol', 'open']])
+@pytest.mark.parametrize('missing', [0.0, 0.1])
+def test_matches_legacy_tushare_reshape(fields, missing):
+    df = random_long_frame(40, 60, missing)
+    expected = legacy_tushare_wide(df, fields)
+    result = long_to_wide(df, 'trade_date', 'ts_code', fields, rename=MAPPING)
+    # 列顺序、索引名称(trade_date)和缺失值位置都与原来一致; 原来的sort_index会推断出索引的freq, 不比较
+    pd.testing.assert_frame_equal(result, expected, check_freq=False)
+    assert result.index.name == 'trade_date'
+
+
+def test_matches_legacy_ricequant_reshape():
+    df = random_long_frame(30, 50, 0.1).rename(columns={'trade_date': 'date', 'ts_code': 'order_book_id'})
+    fields = ['open', 'close']
+    result = long_to_wide(df, 'date', 'order_book_id', fields, rename={f: f.capitalize() for f in fields})
+    # 原来按日期第一次出现的顺序排列, 现在按日期升序
+    expected = legacy_ricequant_wide(df, fields).sort_index()
+    pd.testing.assert_frame_equal(result, expected)
+
+    ordered = df.sort_values('date', kind='stable')
+    pd.testing.assert_frame_equal(
+        long_to_wide(ordered, 'date', 'order_book_id', fields, rename={f: f.capitalize() for f in fields}, sort=False),
+        legacy_ricequant_wide(ordered, fields),
+    )
+
+
+def test_round_trip_prices(prices):
+    long_df = prices.stack(level=0, future_stack=True).rename_axis(['date', 'symbol']).reset_index()
+    fields = list(prices.columns.get_level_values(1).unique())
+    result = long_to_wide(long_df, 'date', 'symbol', fields)
+    pd.testing.assert_frame_equal(result, prices.rename_axis('date'), check_column_type=False)
+
+
+def test_symbols_order_and_filter():
+    df = random_long_frame(5, 10)
+    symbols = ['000003.SZ', '000000.SZ', 'missing.SZ']
+    result = long_to_wide(df, 'trade_date', 'ts_code', ['close'], symbols=symbols)
+    assert list(result.columns) == [(symbol, 'close') for symbol in symbols]
+    assert result[('missing.SZ', 'close')].isna().all()
+    expected = legacy_tushare_wide(df, ['close'], {})
+    pd.testing.assert_frame_equal(result[symbols[:2]], expected[symbols[:2]], check_freq=False)
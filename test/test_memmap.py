@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import memmap_field, open_memmap_panel, save_memmap_panel
+
+
+@pytest.fixture(scope='module')
+def panel(prices):
+    df = prices.iloc[:100, :40].copy()
+    df.iloc[3:7, 5] = np.nan
+    return df
+
+
+@pytest.fixture(scope='module')
+def directory(panel, tmp_path_factory):
+    directory = str(tmp_path_factory.mktemp('memmap') / 'panel')
+    save_memmap_panel(panel, directory)
+    return directory
+
+
+def mapped_array(directory):
+    '''同一个文件的另一份映射, 用来确认文件内容'''
+    return np.load(f'{directory}/values.npy', mmap_mode='r')
+
+
+def memmap_base(frame):
+    '''DataFrame数据所在的映射数组, 数据被复制过时为None'''
+    array = frame.to_numpy()
+    while array is not None and not isinstance(array, np.memmap):
+        array = array.base
+    return array
+
+
+def assert_zero_copy(frame):
+    base = memmap_base(frame)
+    assert base is not None
+    assert np.shares_memory(frame.to_numpy(), base)
+
+
+def test_round_trip_without_copy(panel, directory):
+    mapped = open_memmap_panel(directory)
+    pd.testing.assert_frame_equal(mapped, panel)
+    assert_zero_copy(mapped)
+    assert not mapped.to_numpy().flags.writeable
+
+
+@pytest.mark.parametrize('start, end', [(None, None), (10, None), (None, 60), (25, 25), (30, 80)])
+def test_date_slices_are_views(panel, directory, start, end):
+    start_date = panel.index[start] if start is not None else None
+    end_date = panel.index[end] if end is not None else None
+    mapped = open_memmap_panel(directory, start_date=start_date, end_date=end_date)
+    pd.testing.assert_frame_equal(mapped, panel.loc[start_date:end_date])
+    assert_zero_copy(mapped)
+
+
+def test_copy_on_write_mode(panel, directory):
+    mapped = open_memmap_panel(directory, mode='c')
+    mapped.iloc[0, 0] = -1.0
+    assert mapped.iloc[0, 0] == -1.0
+    # 修改只在当前进程可见, 文件不变
+    assert mapped_array(directory)[0, 0] == panel.iloc[0, 0]
+
+
+def test_field_is_a_strided_view(panel, directory):
+    mapped = open_memmap_panel(directory)
+    for field in panel.columns.get_level_values(1).unique():
+        view = memmap_field(mapped, field)
+        pd.testing.assert_frame_equal(view, panel.xs(field, axis=1, level=1), check_names=False)
+        assert np.shares_memory(view.to_numpy(), mapped.to_numpy())
+        assert_zero_copy(view)
+
+
+def test_uneven_field_columns_are_copied(tmp_path, panel):
+    # 两个标的缺少 Open 字段, Close 列的间距不相等
+    dropped = {(panel.columns[4][0], 'Open'), (panel.columns[8][0], 'Open')}
+    uneven = panel[[column for column in panel.columns if column not in dropped]]
+    save_memmap_panel(uneven, str(tmp_path / 'uneven'))
+    mapped = open_memmap_panel(str(tmp_path / 'uneven'))
+
+    close = memmap_field(mapped, 'Close')
+    pd.testing.assert_frame_equal(close, uneven.xs('Close', axis=1, level=1), check_names=False)
+    assert not np.shares_memory(close.to_numpy(), mapped.to_numpy())
+    assert memmap_base(close) is None
+    # 间距相等的部分仍然是视图
+    view = memmap_field(mapped.iloc[:, 10:], 'Open')
+    pd.testing.assert_frame_equal(view, uneven.iloc[:, 10:].xs('Open', axis=1, level=1), check_names=False)
+    assert_zero_copy(view)
+
+
+def test_invalid_inputs(panel, tmp_path):
+    with pytest.raises(ValueError):
+        save_memmap_panel(panel.xs('Close', axis=1, level=1), str(tmp_path / 'a'))
+    with pytest.raises(ValueError):
+        save_memmap_panel(panel.reset_index(drop=True), str(tmp_path / 'b'))
+    with pytest.raises(ValueError):
+        memmap_field(panel, 'Volume')
@@ -0,0 +1,124 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import Result
+from athena.metrics import calculate_metrics, infer_periods_per_year, metrics_matrix
+
+CRYPTO_15MIN = pd.date_range('2024-01-01', periods=96 * 40, freq='15min')
+WEEKDAY_DAILY = pd.bdate_range('2020-01-01', periods=500)
+CRYPTO_DAILY = pd.date_range('2020-01-01', periods=500, freq='D')
+WEEKLY = pd.date_range('2020-01-05', periods=150, freq='W')
+# A股日内: 每个交易日4根bar
+INTRADAY = WEEKDAY_DAILY[:300].repeat(4) + pd.to_timedelta(np.tile([9.5, 10.5, 13, 14], 300), unit='h')
+
+
+def random_net_value(index, seed=0, scale=0.01):
+    rng = np.random.default_rng(seed)
+    return pd.Series(np.cumprod(1 + rng.normal(0.0005, scale, len(index))), index=index)
+
+
+def reference_metrics(net_value, periods, benchmark=None, risk_free=0.0):
+    '''用pandas逐项计算的指标'''
+    returns = net_value.pct_change().dropna()
+    rf = (1 + risk_free) ** (1 / periods) - 1
+    excess = returns - rf
+    annual_return = (net_value.iloc[-1] / net_value.iloc[0]) ** (periods / len(returns)) - 1
+    drawdown = net_value / net_value.cummax() - 1
+    # 回撤持续时间: 距离上一个高点的bar数
+    duration = drawdown.groupby((drawdown >= 0).cumsum()).cumcount().max()
+    metrics = {
+        'annual_return': annual_return,
+        'annual_volatility': returns.std() * np.sqrt(periods),
+        # 夏普: 每期超额收益的均值 / 每期收益的标准差, 再按每年bar数年化
+        'sharpe': excess.mean() / returns.std() * np.sqrt(periods),
+        'sortino': excess.mean() / np.sqrt((excess.clip(upper=0) ** 2).mean()) * np.sqrt(periods),
+        'max_drawdown': drawdown.min(),
+        'max_drawdown_duration': float(duration),
+        'calmar': annual_return / abs(drawdown.min()),
+    }
+    if benchmark is not None:
+        market = benchmark.reindex(net_value.index, method='ffill').pct_change().dropna()
+        # 詹森alpha: 超额收益对市场超额收益回归的截距, 按每期收益年化
+        beta, intercept = np.polyfit(market - rf, excess, 1)
+        active = returns - market
+        metrics.update({
+            'beta': beta,
+            'alpha': intercept * periods,
+            'tracking_error': active.std() * np.sqrt(periods),
+            'information_ratio': active.mean() / active.std() * np.sqrt(periods),
+        })
+    return metrics
+
+
+def assert_metrics_equal(result, expected):
+    assert set(result) == set(expected)
+    for key, value in expected.items():
+        assert result[key] == pytest.approx(value, rel=1e-9, abs=1e-12), key
+
+
+@pytest.mark.parametrize('index, expected', [
+    (CRYPTO_15MIN, 96 * 365),             # 加密货币15分钟线, 没有休市
+    (WEEKDAY_DAILY, 252),                 # 只有工作日的日线
+    (CRYPTO_DAILY, 365),                  # 加密货币日线
+    (INTRADAY, 252 * 4),
+])
+def test_infer_intraday_and_daily(index, expected):
+    assert infer_periods_per_year(index) == expected
+
+
+def test_infer_weekly_and_monthly():
+    assert infer_periods_per_year(WEEKLY) == pytest.approx(365.25 / 7)
+    assert round(infer_periods_per_year(WEEKLY)) == 52
+    assert infer_periods_per_year(pd.date_range('2020-01-31', periods=60, freq='ME')) == pytest.approx(12, rel=0.01)
+    with pytest.raises(ValueError):
+        infer_periods_per_year(WEEKLY[:1])
+
+
+@pytest.mark.parametrize('index, periods', [(CRYPTO_15MIN, 96 * 365), (WEEKDAY_DAILY, 252), (WEEKLY, 365.25 / 7)])
+@pytest.mark.parametrize('risk_free', [0.0, 0.03])
+def test_metrics_match_pandas(index, periods, risk_free):
+    net_value = random_net_value(index, seed=1)
+    benchmark = random_net_value(index, seed=2, scale=0.008)
+    # 年化使用推断的频率, 不是固定的252
+    assert_metrics_equal(calculate_metrics(net_value, risk_free=risk_free),
+                         reference_metrics(net_value, periods, risk_free=risk_free))
+    assert_metrics_equal(calculate_metrics(net_value, benchmark=benchmark, risk_free=risk_free),
+                         reference_metrics(net_value, periods, benchmark, risk_free))
+
+
+def test_benchmark_is_forward_filled_and_result_input():
+    net_value = random_net_value(WEEKDAY_DAILY, seed=3)
+    benchmark = random_net_value(WEEKDAY_DAILY, seed=4).iloc[::3]
+    frame = pd.DataFrame({'benchmark_net_value': benchmark})
+    expected = reference_metrics(net_value, 252, benchmark)
+    assert_metrics_equal(calculate_metrics(net_value, benchmark=frame), expected)
+
+    result = Result(returns=net_value.pct_change(), long_returns=None, short_returns=None, net_value=net_value,
+                    trades=[], open_positions=[], benchmark=frame)
+    assert_metrics_equal(calculate_metrics(result), expected)
+    assert_metrics_equal(calculate_metrics(result, periods_per_year=365), reference_metrics(net_value, 365, benchmark))
+
+
+def test_nan_padded_columns_match_single_series():
+    index = CRYPTO_15MIN
+    benchmark = random_net_value(index, seed=9, scale=0.008)
+    full = random_net_value(index, seed=5)
+    late = random_net_value(index, seed=6).where(pd.Series(np.arange(len(index)) >= 700, index=index))
+    early = random_net_value(index, seed=7).where(pd.Series(np.arange(len(index)) < 2500, index=index))
+    table = pd.DataFrame({'full': full, 'late': late, 'early': early})
+
+    matrix = calculate_metrics(table, benchmark=benchmark, risk_free=0.02)
+    assert list(matrix.index) == ['full', 'late', 'early']
+    for name in table:
+        single = calculate_metrics(table[name].dropna(), benchmark=benchmark, periods_per_year=96 * 365,
+                                   risk_free=0.02)
+        assert_metrics_equal(matrix.loc[name].to_dict(), single)
+        assert_metrics_equal(single, reference_metrics(table[name].dropna(), 96 * 365, benchmark, 0.02))
+
+
+def test_metrics_matrix_accepts_one_dimensional_values():
+    net_value = random_net_value(WEEKDAY_DAILY, seed=8)
+    metrics = metrics_matrix(net_value.to_numpy(), 252)
+    assert all(value.shape == (1,) for value in metrics.values())
+    assert_metrics_equal({key: value[0] for key, value in metrics.items()}, reference_metrics(net_value, 252))
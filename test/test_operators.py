@@ -0,0 +1,92 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena.lib import (cs_demean, cs_rank, cs_zscore, delay, factor_frame, panel_field, ts_mean, ts_rank,
+                        ts_return, ts_std, ts_zscore, winsorize)
+
+
+def random_panel(n_dates=300, n_symbols=25, seed=0):
+    '''日期 x 标的 的整数值矩阵, 有大量相同值和10%的缺失值, 其中一天全部缺失'''
+    rng = np.random.default_rng(seed)
+    x = pd.DataFrame(rng.integers(0, 20, (n_dates, n_symbols)).astype(float),
+                     index=pd.date_range('2024-01-01', periods=n_dates),
+                     columns=[f'S{k}' for k in range(n_symbols)])
+    x[rng.random(x.shape) < 0.1] = np.nan
+    x.iloc[7] = np.nan
+    return x
+
+
+def per_symbol(x, func):
+    '''原来的写法: 逐个标的用 pandas Series 计算'''
+    return pd.DataFrame({symbol: func(x[symbol]) for symbol in x.columns}, index=x.index)
+
+
+def per_date(x, func):
+    '''逐个日期计算截面'''
+    return pd.DataFrame({date: func(x.loc[date]) for date in x.index}).T.reindex(index=x.index, columns=x.columns)
+
+
+def assert_same(result, expected):
+    pd.testing.assert_frame_equal(result, expected, check_freq=False, check_names=False, rtol=1e-9, atol=1e-12)
+
+
+@pytest.fixture(scope='module', params=['random', 'close'])
+def panel(request, prices):
+    if request.param == 'random':
+        return random_panel()
+    return panel_field(prices, 'Close')
+
+
+@pytest.mark.parametrize('n', [1, 5, -2])
+def test_delay_and_return(panel, n):
+    assert_same(delay(panel, n), per_symbol(panel, lambda s: s.shift(n)))
+    assert_same(ts_return(panel, abs(n)), per_symbol(panel, lambda s: s / s.shift(abs(n)) - 1))
+
+
+@pytest.mark.parametrize('window, min_periods', [(1, None), (10, None), (10, 3), (60, 20)])
+def test_rolling_operators_match_per_symbol_loop(panel, window, min_periods):
+    def rolling(s):
+        return s.rolling(window, min_periods=min_periods)
+
+    assert_same(ts_mean(panel, window, min_periods), per_symbol(panel, lambda s: rolling(s).mean()))
+    assert_same(ts_std(panel, window, min_periods), per_symbol(panel, lambda s: rolling(s).std()))
+    assert_same(ts_rank(panel, window, min_periods), per_symbol(panel, lambda s: rolling(s).rank(pct=True)))
+    assert_same(ts_zscore(panel, window, min_periods),
+                per_symbol(panel, lambda s: (s - rolling(s).mean()) / rolling(s).std()))
+
+
+def test_cross_sectional_operators_match_per_date_loop(panel):
+    assert_same(cs_rank(panel), per_date(panel, lambda row: row.rank(pct=True)))
+    assert_same(cs_demean(panel), per_date(panel, lambda row: row - row.mean()))
+    assert_same(cs_zscore(panel), per_date(panel, lambda row: (row - row.mean()) / row.std()))
+    assert_same(winsorize(panel, 0.1, 0.9),
+                per_date(panel, lambda row: row.clip(row.quantile(0.1), row.quantile(0.9))))
+
+
+def test_ts_std_stays_exact_on_large_levels():
+    # 价格水平远大于波动时, 滚动平方和容易丢失精度
+    rng = np.random.default_rng(3)
+    x = pd.DataFrame(50_000 + np.cumsum(rng.normal(0, 1, (5000, 3)), axis=0))
+    exact = per_symbol(x, lambda s: s.rolling(5).apply(lambda w: np.std(w, ddof=1), raw=True))
+    np.testing.assert_allclose(ts_std(x, 5).to_numpy(), exact.to_numpy(), rtol=1e-8, atol=1e-9)
+
+
+def test_momentum_factor_matches_notebook_loop(prices):
+    '''加密货币动量因子notebook中逐个标的构建因子表的写法'''
+    factors_df = pd.DataFrame(index=prices.index)
+    for symbol in prices.columns.levels[0]:
+        close = pd.to_numeric(prices[(symbol, 'Close')], errors='coerce').ffill().bfill()
+        factors_df[symbol] = close / close.shift(10) - 1
+    factors_df.columns = pd.MultiIndex.from_product([factors_df.columns, ['momentum']])
+
+    close = panel_field(prices, 'Close').ffill().bfill()
+    result = factor_frame(momentum=ts_return(close, 10))
+    assert_same(result[factors_df.columns], factors_df)
+
+
+def test_factor_frame_layout():
+    x = random_panel(20, 4)
+    frame = factor_frame(momentum=ts_return(x, 3), vol=ts_std(x, 5))
+    assert list(frame.columns) == [(symbol, name) for symbol in x.columns for name in ('momentum', 'vol')]
+    assert_same(frame.xs('vol', axis=1, level=1), ts_std(x, 5))
@@ -0,0 +1,82 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import FactorPanel
+
+from conftest import DATA
+
+
+@pytest.fixture(scope='module')
+def factors_df():
+    '''两个因子(total_mv, pe_ttm)的因子表'''
+    return pd.read_hdf(os.path.join(DATA, 'factors_data_multi_sort.h5')).iloc[:40, :60]
+
+
+def reordered_axes(factors_df):
+    '''倒序的日期加上一个不存在的日期, 打乱顺序的标的加上一个不存在的标的'''
+    symbols = list(factors_df.columns.get_level_values(0).unique())
+    dates = list(factors_df.index[::-3]) + [pd.Timestamp('1999-01-01')]
+    return dates, symbols[5:0:-1] + ['MISSING'] + symbols[10:15]
+
+
+def expected_frame(factors_df, dates, symbols, factors=None):
+    factors = factors or list(factors_df.columns.get_level_values(1).unique())
+    return factors_df.reindex(index=pd.Index(dates), columns=pd.MultiIndex.from_product([symbols, factors]))
+
+
+def test_round_trip(factors_df):
+    panel = FactorPanel.from_frame(factors_df)
+    assert panel.values.shape == (40, 2, 30)
+    pd.testing.assert_frame_equal(panel.to_frame(), factors_df, check_names=False, check_column_type=False)
+
+
+def test_from_frame_with_reordered_and_missing_axes(factors_df):
+    dates, symbols = reordered_axes(factors_df)
+    panel = FactorPanel.from_frame(factors_df, index=dates, symbols=symbols, factors=['pe_ttm'])
+    assert panel.symbols == symbols and panel.factors == ['pe_ttm']
+    pd.testing.assert_frame_equal(panel.to_frame(), expected_frame(factors_df, dates, symbols, ['pe_ttm']))
+    assert np.isnan(panel.values[-1]).all()
+    assert np.isnan(panel.values[:, :, symbols.index('MISSING')]).all()
+
+
+def test_align_matches_reindex(factors_df):
+    dates, symbols = reordered_axes(factors_df)
+    aligned = FactorPanel.from_frame(factors_df).align(dates, symbols)
+    pd.testing.assert_frame_equal(aligned.to_frame(), expected_frame(factors_df, dates, symbols))
+    pd.testing.assert_frame_equal(
+        aligned.to_frame(), FactorPanel.from_frame(factors_df, index=dates, symbols=symbols).to_frame()
+    )
+
+
+def test_cross_section_is_a_view(factors_df):
+    dates, symbols = reordered_axes(factors_df)
+    panel = FactorPanel.from_frame(factors_df, index=dates, symbols=symbols)
+    expected = expected_frame(factors_df, dates, symbols)
+    for i, date in enumerate(dates):
+        for factor in panel.factors:
+            section = panel.cross_section(i, factor)
+            assert np.shares_memory(section, panel.values)
+            np.testing.assert_array_equal(section, expected.loc[date].xs(factor, level=1)[symbols].to_numpy())
+    assert panel.get_loc(dates[3]) == 3
+
+    # 修改视图会反映到面板中
+    panel.cross_section(0, 'total_mv')[0] = -1.0
+    assert panel.values[0, panel.factor_index['total_mv'], 0] == -1.0
+    assert panel.factor('total_mv').iloc[0, 0] == -1.0
+
+
+def test_factor_table(factors_df):
+    panel = FactorPanel.from_frame(factors_df)
+    pd.testing.assert_frame_equal(panel.factor('pe_ttm'), factors_df.xs('pe_ttm', axis=1, level=1),
+                                  check_names=False)
+    assert np.shares_memory(panel.factor('pe_ttm').to_numpy(), panel.values)
+
+
+def test_shape_and_columns_validated(factors_df):
+    with pytest.raises(ValueError):
+        FactorPanel(np.zeros((2, 1, 3)), range(2), ['f'], ['A', 'B'])
+    with pytest.raises(ValueError):
+        FactorPanel.from_frame(factors_df.xs('pe_ttm', axis=1, level=1))
@@ -0,0 +1,63 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import MULTIPLE_ASSETS_TEST_DATA
+from athena.records import BarRecords
+
+
+def same(a, b):
+    return (isinstance(a, float) and math.isnan(a) and math.isnan(b)) or a == b
+
+
+@pytest.fixture(scope='module', params=['prices', 'nan_bars', 'test_data'])
+def frame(request, prices):
+    if request.param == 'prices':
+        return prices.iloc[:40]
+    if request.param == 'nan_bars':
+        # 停牌的bar和整行缺失的bar
+        df = prices.iloc[:50, :20].copy()
+        df.iloc[3:6, :5] = np.nan
+        df.iloc[10] = np.nan
+        return df
+    return MULTIPLE_ASSETS_TEST_DATA
+
+
+def test_records_match_loc_lookups(frame):
+    records = BarRecords(frame)
+    assert len(records) == len(frame)
+    for i, record in enumerate(records):
+        date = frame.index[i]
+        for key in frame.columns:
+            assert same(record[key], frame.loc[date, key])
+            assert same(record.get(key), frame.loc[date, key])
+
+
+def test_records_match_to_dict(frame):
+    expected = frame.to_dict('records')
+    records = BarRecords(frame)
+    for record, row in zip(records, expected):
+        assert list(record) == list(row)
+        assert len(record) == len(row)
+        assert all(same(record[key], row[key]) for key in row)
+    assert [list(r.keys()) for r in records[2:5]] == [list(row) for row in expected[2:5]]
+
+
+def test_missing_symbol_behaves_like_dict(frame):
+    record, row = BarRecords(frame)[0], frame.to_dict('records')[0]
+    for key in [('MISSING', 'Close'), 'Close']:
+        assert key not in record and key not in row
+        assert record.get(key) is None and record.get(key, 0) == 0
+        with pytest.raises(KeyError):
+            record[key]
+    with pytest.raises(KeyError):
+        frame.loc[frame.index[0], ('MISSING', 'Close')]
+
+
+def test_single_asset_records():
+    df = pd.DataFrame({'Open': [1.0, np.nan], 'Close': [2.0, 3.0]}, index=pd.date_range('2024-01-01', periods=2))
+    records = BarRecords(df)
+    assert records[-1]['Close'] == 3.0 and math.isnan(records[1]['Open'])
+    assert records[0].get(('A', 'Close'), 0) == 0
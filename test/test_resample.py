@@ -0,0 +1,126 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena.resample import (DEFAULT_AGG_FUNCS, append_resampled, resample_frame, resample_multi_index_dataframe,
+                             resample_to_higher_freq)
+
+FREQS = ['1h', '4h', '1D', 'W', 'ME']
+FIELDS = list(DEFAULT_AGG_FUNCS)
+
+
+def kline_panel(n_symbols=6, days=40, seed=0):
+    '''
+    15分钟K线大表: 标的顺序打乱, 随机缺失值, 一个标的有整天缺失, 中间有两天没有任何数据(空箱)
+    Number of trades 为整数列
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-29 00:00', periods=days * 96, freq='15min')
+    index = index[(index < '2024-02-10') | (index >= '2024-02-12')]
+    symbols = [f'S{k}USDT' for k in rng.permutation(n_symbols)]
+    frames = {}
+    for symbol in symbols:
+        close = 100 + np.cumsum(rng.normal(0, 1, len(index)))
+        frame = pd.DataFrame({
+            'Open': close + rng.normal(0, 0.1, len(index)),
+            'High': close + 1,
+            'Low': close - 1,
+            'Close': close,
+            'Volume': rng.random(len(index)) * 10,
+            'Quote asset volume': rng.random(len(index)) * 1000,
+            'Number of trades': rng.integers(0, 50, len(index)),
+            'Taker buy base asset volume': rng.random(len(index)),
+            'Taker buy quote asset volume': rng.random(len(index)) * 100,
+        }, index=index)
+        floats = [field for field in FIELDS if field != 'Number of trades']
+        frame[floats] = frame[floats].mask(rng.random((len(index), len(floats))) < 0.05)
+        frames[symbol] = frame
+    frames[symbols[1]].loc['2024-02-05'] = np.nan
+    frames[symbols[1]]['Number of trades'] = frames[symbols[1]]['Number of trades'].fillna(0).astype(np.int64)
+    # 最后一个标的只有部分字段
+    frames[symbols[-1]] = frames[symbols[-1]][['Open', 'Close', 'Number of trades']]
+    return pd.concat(frames, axis=1)
+
+
+def legacy_resample(prices_df, target_freq):
+    '''原来逐个标的调用 resample().agg 的实现'''
+    resampled_data = []
+    for symbol in prices_df.columns.levels[0]:
+        symbol_data = prices_df[symbol]
+        available_fields = [field for field in DEFAULT_AGG_FUNCS if field in symbol_data.columns]
+        if not available_fields:
+            continue
+        resampled = symbol_data.resample(target_freq).agg({field: DEFAULT_AGG_FUNCS[field] for field in available_fields})
+        resampled.columns = pd.MultiIndex.from_product([[symbol], resampled.columns])
+        resampled_data.append(resampled)
+    return pd.concat(resampled_data, axis=1).sort_index()
+
+
+@pytest.fixture(scope='module')
+def panel():
+    return kline_panel()
+
+
+@pytest.mark.parametrize('freq', FREQS)
+def test_matches_per_symbol_resample(panel, freq):
+    result = resample_multi_index_dataframe(panel, freq)
+    expected = legacy_resample(panel, freq)
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-12)
+    assert (result.dtypes[result.columns.get_level_values(1) == 'Number of trades'] == np.int64).all()
+
+
+def test_symbol_without_fields_is_skipped(panel):
+    extra = panel.copy()
+    extra[('ZZZUSDT', 'Funding')] = 1.0
+    with contextlib.redirect_stdout(io.StringIO()) as out:
+        result = resample_multi_index_dataframe(extra, '1D')
+    assert 'ZZZUSDT' in out.getvalue()
+    pd.testing.assert_frame_equal(result, legacy_resample(panel, '1D'), rtol=1e-12)
+
+
+def test_resample_frame_matches_pandas(panel):
+    frame = panel[panel.columns[0][0]]
+    aggs = {'Close': 'last', 'Volume': 'sum', 'Open': 'first', 'Number of trades': 'sum', 'High': 'max'}
+    for freq in FREQS:
+        pd.testing.assert_frame_equal(resample_frame(frame, freq, aggs), frame.resample(freq).agg(aggs), rtol=1e-12)
+    shuffled = frame.sample(frac=1, random_state=0)
+    pd.testing.assert_frame_equal(resample_frame(shuffled, '4h', aggs), frame.resample('4h').agg(aggs), rtol=1e-12)
+
+
+def test_resample_to_higher_freq(panel):
+    frame = panel[panel.columns[0][0]].rename_axis('Open time').reset_index()
+    frame['Close time'] = frame['Open time'] + pd.Timedelta(minutes=15) - pd.Timedelta(milliseconds=1)
+    result = resample_to_higher_freq(frame.copy(), '4h')
+
+    expected = frame.set_index('Open time').resample('4h').agg(DEFAULT_AGG_FUNCS)
+    expected['Close time'] = expected.index + pd.Timedelta(hours=4) - pd.Timedelta(milliseconds=1)
+    expected = expected.reset_index()[['Open time', 'Close time'] + FIELDS]
+    pd.testing.assert_frame_equal(result, expected, rtol=1e-12, check_freq=False)
+
+
+# 拆分的位置: 落在1h/4h/日/周/月的中间, 正好在空缺的两天之前和之后
+SPLITS = [0, 37, 38, 500, 1019, 1020, 1050, 2400, None]
+
+
+@pytest.mark.parametrize('freq', FREQS)
+def test_append_in_pieces_matches_full_resample(panel, freq):
+    cuts = [len(panel) if split is None else split for split in SPLITS]
+    combined = None
+    for start, stop in zip(cuts[:-1], cuts[1:]):
+        combined = append_resampled(combined, panel.iloc[start:stop], freq)
+    expected = resample_multi_index_dataframe(panel, freq)
+    pd.testing.assert_frame_equal(combined, expected, rtol=1e-12, check_freq=False)
+
+
+def test_append_splits_a_period(panel):
+    # 日线: 前一段停在当天中午, 后一段从当天中午继续
+    day = panel.loc[:'2024-02-01 11:45']
+    rest = panel.loc['2024-02-01 12:00':'2024-02-03']
+    first = resample_multi_index_dataframe(day, '1D')
+    assert first.index[-1] == pd.Timestamp('2024-02-01')
+    combined = append_resampled(first, rest, '1D')
+    expected = resample_multi_index_dataframe(panel.loc[:'2024-02-03'], '1D')
+    pd.testing.assert_frame_equal(combined, expected, rtol=1e-12, check_freq=False)
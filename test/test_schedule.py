@@ -0,0 +1,120 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import (Backtest, Strategy, day_end, day_start, every_n_bars, frame_chunks, month_end, month_start,
+                    on_dates, week_end, week_start)
+from athena.schedule import Schedule
+
+
+def intraday_index():
+    '''工作日 09:30-15:00 每半小时一根bar, 跨过1月/2月/3月的月末(含闰年2月29日)'''
+    days = pd.bdate_range('2024-01-25', '2024-03-06')
+    times = pd.timedelta_range('09:30:00', '15:00:00', freq='30min')
+    return pd.DatetimeIndex([day + time for day in days for time in times])
+
+
+INDEX = intraday_index()
+# 拆分的位置落在日内、周内和月内
+SPLITS = [0, 5, 12, 13, 40, 97, 250, 251, len(INDEX)]
+
+
+def by_period(index, freq, edge):
+    '''用 pandas groupby 找出每个周期第一根/最后一根bar'''
+    positions = pd.Series(np.arange(len(index)), index=index).groupby(index.to_period(freq))
+    return (positions.first() if edge == 'start' else positions.last()).to_numpy()
+
+
+def resolve_in_chunks(schedule, index, splits=SPLITS):
+    '''像分段回测一样逐段解析, 返回全局的bar序号'''
+    bars = []
+    for start, stop in zip(splits[:-1], splits[1:]):
+        previous = index[start - 1] if start > 0 else None
+        following = index[stop] if stop < len(index) else None
+        bars.extend(start + schedule.resolve(index[start:stop], start=start, previous=previous,
+                                             following=following))
+    return np.array(bars, dtype=int)
+
+
+@pytest.mark.parametrize('schedule, freq, edge', [
+    (month_end(), 'M', 'end'), (month_start(), 'M', 'start'),
+    (week_end(), 'W', 'end'), (week_start(), 'W', 'start'),
+    (day_end(), 'D', 'end'), (day_start(), 'D', 'start'),
+])
+def test_calendar_rules(schedule, freq, edge):
+    expected = by_period(INDEX, freq, edge)
+    np.testing.assert_array_equal(schedule.resolve(INDEX), expected)
+    np.testing.assert_array_equal(resolve_in_chunks(schedule, INDEX), expected)
+
+
+def test_calendar_rules_examples():
+    month_ends = INDEX[month_end().resolve(INDEX)]
+    assert list(month_ends) == [pd.Timestamp('2024-01-31 15:00'), pd.Timestamp('2024-02-29 15:00'),
+                                pd.Timestamp('2024-03-06 15:00')]
+    week_starts = INDEX[week_start().resolve(INDEX)]
+    # 索引从周四开始, 第一根bar算作一周的开始, 之后都是周一的第一根bar
+    assert week_starts[0] == INDEX[0]
+    assert all(date.dayofweek == 0 and date.strftime('%H:%M') == '09:30' for date in week_starts[1:])
+
+
+@pytest.mark.parametrize('n, offset', [(1, 0), (7, 0), (7, 3), (10, 25), (300, 260)])
+def test_every_n_bars_across_chunks(n, offset):
+    expected = np.arange(offset, len(INDEX), n)
+    schedule = every_n_bars(n, offset)
+    np.testing.assert_array_equal(schedule.resolve(INDEX), expected)
+    np.testing.assert_array_equal(resolve_in_chunks(schedule, INDEX), expected)
+
+
+def test_on_dates_rolls_forward():
+    dates = [
+        '2024-01-20',           # 早于数据开始 -> 第一根bar
+        '2024-01-27',           # 周六 -> 周一第一根bar
+        '2024-01-29',           # 周一, 与上一个日期落在同一根bar
+        '2024-02-05 12:10',     # 日内, 顺延到 12:30
+        '2024-02-09 15:30',     # 收盘之后 -> 下一个交易日
+        '2024-02-29 15:00',     # 正好是一根bar
+        '2024-04-01',           # 晚于数据结束, 忽略
+    ]
+    expected = pd.DatetimeIndex(['2024-01-25 09:30', '2024-01-29 09:30', '2024-02-05 12:30',
+                                 '2024-02-12 09:30', '2024-02-29 15:00'])
+    schedule = on_dates(reversed(dates))
+    assert INDEX[schedule.resolve(INDEX)].equals(expected)
+    assert INDEX[resolve_in_chunks(schedule, INDEX)].equals(expected)
+
+
+def test_invalid_rules():
+    for rule, kwargs in [('quarter_end', {}), ('month_middle', {}), ('every_n_bars', {'n': 0}),
+                         ('every_n_bars', {}), ('dates', {})]:
+        with pytest.raises(ValueError):
+            Schedule(rule, **kwargs)
+    assert len(month_end().resolve(INDEX[:0])) == 0
+
+
+class RecordBars(Strategy):
+    '''记录调用next的bar序号'''
+    calls = []
+
+    def init(self):
+        pass
+
+    def next(self, i, record):
+        RecordBars.calls.append(i)
+
+
+def run_bars(data, schedule):
+    RecordBars.calls = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        Backtest(RecordBars, data, cash=100_000, verbosity='off', schedule=schedule).run()
+    return RecordBars.calls
+
+
+@pytest.mark.parametrize('schedule', [month_end(), week_start(), day_end(), every_n_bars(9, 4),
+                                      on_dates(['2024-02-03', '2024-02-29 13:00'])])
+def test_backtest_calls_next_on_scheduled_bars(schedule):
+    data = pd.DataFrame({('A', 'Open'): 10.0, ('A', 'Close'): 10.0}, index=INDEX)
+    expected = schedule.resolve(INDEX).tolist()
+    assert run_bars(data, schedule) == expected
+    assert run_bars(frame_chunks(data, 37), schedule) == expected
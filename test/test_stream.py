@@ -0,0 +1,84 @@
+import contextlib
+import io
+
+import pandas as pd
+import pytest
+
+from athena import Backtest, Strategy
+from athena.stream import file_chunks, frame_chunks
+
+
+class Rotate(Strategy):
+    def init(self):
+        pass
+
+    def next(self, i, record):
+        symbol = self.symbols[(i // 10) % 3]
+        longs, _ = self.broker.current_position_status()
+        for held in longs:
+            if held != symbol:
+                self.close(record[(held, 'Close')], symbol=held)
+        self.order_target_percent(symbol, 0.5, record[(symbol, 'Close')])
+
+
+def run(data, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        return Backtest(Rotate, data, cash=100_000, commission=0.001, verbosity='off', **kwargs).run()
+
+
+@pytest.fixture(scope='module')
+def small_prices(prices):
+    return prices.iloc[:60, :30]
+
+
+def write_chunks(directory, prices):
+    for k, chunk in enumerate(frame_chunks(prices, 25)):
+        chunk.to_pickle(directory / f'{k:02d}.pkl')
+
+
+def test_directory_skips_unsupported_files(tmp_path, small_prices):
+    write_chunks(tmp_path, small_prices)
+    (tmp_path / 'README.txt').write_text('行情数据说明')
+    (tmp_path / '.DS_Store').write_bytes(b'\0')
+    (tmp_path / 'archive.pkl').mkdir()
+
+    chunks = list(file_chunks(str(tmp_path)))
+    assert [len(chunk) for chunk in chunks] == [25, 25, 10]
+    pd.testing.assert_frame_equal(pd.concat(chunks), small_prices)
+
+
+def test_unsupported_single_file_raises(tmp_path):
+    path = tmp_path / 'prices.txt'
+    path.write_text('')
+    with pytest.raises(ValueError, match='不支持的文件格式'):
+        list(file_chunks(str(path)))
+    with pytest.raises(ValueError, match='不支持的文件格式'):
+        list(file_chunks([str(path)]))
+
+
+def test_streamed_backtest_matches_in_memory(tmp_path, small_prices):
+    write_chunks(tmp_path, small_prices)
+    expected = run(small_prices)
+    result = run(file_chunks(str(tmp_path)))
+    pd.testing.assert_series_equal(result.returns, expected.returns)
+    assert [vars(t) for t in result.trades] == [vars(t) for t in expected.trades]
+
+
+def test_generator_source_cannot_run_twice(small_prices):
+    backtest = Backtest(Rotate, frame_chunks(small_prices, 25), cash=100_000, verbosity='off')
+    with contextlib.redirect_stdout(io.StringIO()):
+        backtest.run()
+        with pytest.raises(ValueError, match='只能读取一次'):
+            backtest.run()
+
+
+def test_list_source_runs_repeatedly(small_prices):
+    chunks = list(frame_chunks(small_prices, 25))
+    start, end = small_prices.index[5], small_prices.index[50]
+    backtest = Backtest(Rotate, chunks, cash=100_000, commission=0.001, verbosity='off',
+                        start_date=start, end_date=end)
+    with contextlib.redirect_stdout(io.StringIO()):
+        first, second = backtest.run(), backtest.run()
+    expected = run(small_prices, start_date=start, end_date=end)
+    pd.testing.assert_series_equal(first.returns, expected.returns)
+    pd.testing.assert_series_equal(second.returns, expected.returns)
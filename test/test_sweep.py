@@ -0,0 +1,125 @@
+import contextlib
+import io
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import athena.sweep as sweep
+from athena import Backtest, Strategy, run_parameter_sweep, save_memmap_panel, summarize
+
+GRID = {'window': [3, 8], 'weight': [0.2, 0.5], 'commission': [0.0, 0.001]}
+
+
+class Momentum(Strategy):
+    '''持有过去window根bar涨幅最大的标的'''
+    def init(self, window=5, weight=0.5, fail=False):
+        if fail:
+            raise RuntimeError('策略初始化失败')
+        self.window = window
+        self.weight = weight
+
+    def next(self, i, record):
+        if i < self.window:
+            return
+        close = self.data.xs('Close', axis=1, level=1)
+        best = (close.iloc[i] / close.iloc[i - self.window]).idxmax()
+        longs, _ = self.broker.current_position_status()
+        for held in longs:
+            if held != best:
+                self.close(record[(held, 'Close')], symbol=held)
+        self.order_target_percent(best, self.weight, record[(best, 'Close')])
+
+
+def synthetic_prices(n_bars=80, n_symbols=5, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_bars, n_symbols)), axis=0))
+    frames = {}
+    for k in range(n_symbols):
+        frames[(f'S{k}', 'Open')] = close[:, k] * (1 + rng.normal(0, 0.002, n_bars))
+        frames[(f'S{k}', 'Close')] = close[:, k]
+    return pd.DataFrame(frames, index=pd.date_range('2024-01-01', periods=n_bars, freq='h'))
+
+
+@pytest.fixture(scope='module')
+def data():
+    return synthetic_prices()
+
+
+@pytest.fixture(scope='module')
+def sequential(data):
+    '''逐组参数直接调用 Backtest.run 的结果'''
+    results = []
+    for params in sweep.parameter_grid(GRID):
+        strategy_params = {key: value for key, value in params.items() if key != 'commission'}
+        with contextlib.redirect_stdout(io.StringIO()):
+            results.append(Backtest(Momentum, data, cash=100_000, commission=params['commission'],
+                                    verbosity='off').run(**strategy_params))
+    return results
+
+
+def check_sweep(summaries, sequential):
+    summaries = sorted(summaries, key=lambda summary: summary['run'])
+    assert [summary['run'] for summary in summaries] == list(range(len(sequential)))
+    for summary, params, expected in zip(summaries, sweep.parameter_grid(GRID), sequential):
+        assert {key: summary[key] for key in params} == params
+        assert {key: summary[key] for key in ('final_value', 'sharpe', 'max_drawdown')} == summarize(expected)
+        pd.testing.assert_series_equal(summary['result'].returns, expected.returns)
+        assert [vars(t) for t in summary['result'].trades] == [vars(t) for t in expected.trades]
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_shared_memory_sweep_matches_sequential(data, sequential, processes):
+    summaries = list(run_parameter_sweep(Momentum, GRID, data, processes=processes, keep=True, cash=100_000))
+    check_sweep(summaries, sequential)
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_memmap_sweep_matches_sequential(tmp_path, data, sequential, processes):
+    save_memmap_panel(data, str(tmp_path / 'panel'))
+    summaries = list(run_parameter_sweep(Momentum, GRID, str(tmp_path / 'panel'), processes=processes,
+                                         keep=True, cash=100_000))
+    check_sweep(summaries, sequential)
+
+
+def test_keep_selects_results(data):
+    summaries = run_parameter_sweep(Momentum, GRID, data, processes=2, cash=100_000,
+                                    keep=lambda params: params['window'] == 3)
+    for summary in summaries:
+        assert ('result' in summary) == (summary['window'] == 3)
+
+
+@pytest.fixture
+def segments(monkeypatch):
+    '''记录扫描创建的共享内存名称'''
+    names = []
+
+    class RecordingSharedMemory(shared_memory.SharedMemory):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            if kwargs.get('create'):
+                names.append(self.name)
+
+    monkeypatch.setattr(sweep.shared_memory, 'SharedMemory', RecordingSharedMemory)
+    return names
+
+
+def assert_unlinked(names):
+    assert len(names) == 1
+    with pytest.raises(FileNotFoundError):
+        shared_memory.SharedMemory(name=names[0])
+
+
+def test_shared_memory_unlinked_on_error(data, segments):
+    grid = [{'window': 3}, {'window': 3, 'fail': True}]
+    with pytest.raises(RuntimeError, match='策略初始化失败'):
+        list(run_parameter_sweep(Momentum, grid, data, processes=2, cash=100_000))
+    assert_unlinked(segments)
+
+
+def test_shared_memory_unlinked_when_stopped_early(data, segments):
+    summaries = run_parameter_sweep(Momentum, GRID, data, processes=2, cash=100_000)
+    next(summaries)
+    summaries.close()
+    assert_unlinked(segments)
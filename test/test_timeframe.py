@@ -0,0 +1,161 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import Backtest, Strategy, day_end, every_n_bars, frame_chunks, week_end
+from athena.resample import DEFAULT_AGG_FUNCS, resample_frame
+from athena.timeframe import TimeframeBars
+
+FREQS = ['1h', '4h', '1D', 'W']
+
+
+def intraday_data(seed=0):
+    '''
+    15分钟K线, 两个标的: 中间有一个周末没有数据, 随机缺失值, 一个标的有整小时缺失
+    数据在最后一天 10:30 结束, 最后的1小时/4小时/日/周周期都没有走完
+    '''
+    rng = np.random.default_rng(seed)
+    index = pd.date_range('2024-01-29 00:00', '2024-02-13 10:30', freq='15min')
+    index = index[(index < '2024-02-03') | (index >= '2024-02-05')]
+    frames = {}
+    for symbol in ['A', 'B']:
+        close = 100 + np.cumsum(rng.normal(0, 1, len(index)))
+        frame = pd.DataFrame({
+            'Open': close + rng.normal(0, 0.1, len(index)),
+            'High': close + 1,
+            'Low': close - 1,
+            'Close': close,
+            'Volume': rng.random(len(index)) * 10,
+            'Signal': rng.random(len(index)),  # 没有聚合规则, 取最后一个值
+        }, index=index)
+        frames[symbol] = frame.mask(rng.random(frame.shape) < 0.05)
+    frames['B'].loc['2024-02-07 13:00':'2024-02-07 13:45'] = np.nan
+    return pd.concat(frames, axis=1)
+
+
+DATA = intraday_data()
+AGGS = {column: DEFAULT_AGG_FUNCS.get(column[1], 'last') for column in DATA.columns}
+
+
+def expected_bars(data, freq, bars):
+    '''
+    每根bar上应该读到的高级别bar: 最后一根bar不晚于当前bar的周期, 没有则为None
+    值取自 resample_frame, 跳过没有数据的空周期
+    '''
+    positions = pd.Series(np.arange(len(data)), index=data.index).resample(freq).max().dropna()
+    resampled = resample_frame(data, freq, AGGS)
+    expected = []
+    for i in bars:
+        k = np.searchsorted(positions.to_numpy(), i, side='right') - 1
+        if k < 0:
+            expected.append((None, None, 0))
+        else:
+            label = positions.index[k]
+            expected.append((label, resampled.loc[label].to_numpy(), k + 1))
+    return expected
+
+
+class RecordTimeframes(Strategy):
+    '''记录每次调用next时各周期最近一根走完的bar'''
+    seen = []
+
+    def init(self):
+        for freq in FREQS:
+            self.add_timeframe(freq)
+
+    def next(self, i, record):
+        bars = {}
+        for freq in FREQS:
+            bar = self.timeframe_bar(freq)
+            timeframe = self.timeframes[freq]
+            bars[freq] = (timeframe.date, None if bar is None else np.array(list(bar.values())), timeframe.count)
+        RecordTimeframes.seen.append((i, self.date, bars))
+
+
+def run_timeframes(data, schedule=None):
+    RecordTimeframes.seen = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        Backtest(RecordTimeframes, data, cash=100_000, verbosity='off', schedule=schedule).run()
+    return RecordTimeframes.seen
+
+
+def assert_matches_resample(seen, bars):
+    assert [i for i, _, _ in seen] == list(bars)
+    for freq in FREQS:
+        for (i, date, recorded), (label, values, count) in zip(seen, expected_bars(DATA, freq, bars)):
+            seen_label, seen_values, seen_count = recorded[freq]
+            assert seen_label == label, (freq, date)
+            assert seen_count == count, (freq, date)
+            if values is None:
+                assert seen_values is None
+            else:
+                np.testing.assert_allclose(seen_values, values, rtol=1e-12, err_msg=f"{freq} {date}")
+
+
+def test_bar_visible_only_after_its_period_closes():
+    seen = run_timeframes(DATA)
+    for freq in FREQS:
+        # 每根bar所在周期的标签('W' 的标签是周期右端)
+        counts = pd.Series(1, index=DATA.index).resample(freq).count()
+        bin_of_bar = np.repeat(counts.index, counts.to_numpy())
+        for i, date, recorded in seen:
+            label = recorded[freq][0]
+            if label is None:
+                # 第一个周期还没有走完
+                assert bin_of_bar[i] == bin_of_bar[0] and i < len(DATA) - 1
+                continue
+            # 读到的周期中不能有当前bar之后的bar
+            assert not (bin_of_bar[i + 1:] == label).any(), (freq, date)
+            # 当前bar所在的周期只有在这根bar是周期最后一根bar时才可读到
+            assert label == bin_of_bar[i] or label < bin_of_bar[i]
+            if label == bin_of_bar[i]:
+                assert i == len(DATA) - 1 or bin_of_bar[i + 1] != label
+
+    # 1小时周期: 10:30 的bar读到的还是9点的bar, 10点的最后一根bar(10:45)才读到10点的bar
+    by_date = {date: recorded['1h'][0] for _, date, recorded in seen}
+    assert by_date[pd.Timestamp('2024-01-29 10:45')] == pd.Timestamp('2024-01-29 10:00')
+    assert by_date[pd.Timestamp('2024-01-29 10:30')] == pd.Timestamp('2024-01-29 09:00')
+    assert by_date[pd.Timestamp('2024-01-29 00:30')] is None
+
+
+def test_matches_resample_frame():
+    assert_matches_resample(run_timeframes(DATA), range(len(DATA)))
+
+
+@pytest.mark.parametrize('chunksize', [1, 37, 96 * 3 + 5])
+def test_matches_resample_frame_across_chunks(chunksize):
+    assert_matches_resample(run_timeframes(frame_chunks(DATA, chunksize)), range(len(DATA)))
+
+
+@pytest.mark.parametrize('schedule', [every_n_bars(7, 3), day_end(), week_end()])
+@pytest.mark.parametrize('chunksize', [None, 37])
+def test_matches_resample_frame_under_schedule(schedule, chunksize):
+    # 两次next之间的bar在读取时一次性并入
+    bars = schedule.resolve(DATA.index).tolist()
+    data = DATA if chunksize is None else frame_chunks(DATA, chunksize)
+    assert_matches_resample(run_timeframes(data, schedule), bars)
+
+
+def test_partial_final_period_closes_at_last_bar():
+    seen = run_timeframes(DATA)
+    _, last_date, recorded = seen[-1]
+    assert last_date == pd.Timestamp('2024-02-13 10:30')
+    # 数据结束时最后一个周期视为走完, 读到的是已有bar聚合出的不完整bar
+    for freq, label in [('1h', '2024-02-13 10:00'), ('4h', '2024-02-13 08:00'), ('1D', '2024-02-13'),
+                        ('W', '2024-02-18')]:
+        assert recorded[freq][0] == pd.Timestamp(label)
+        np.testing.assert_allclose(recorded[freq][1], resample_frame(DATA, freq, AGGS).iloc[-1].to_numpy(),
+                                   rtol=1e-12)
+    # 倒数第二根bar还读不到这些周期
+    assert seen[-2][2]['1D'][0] == pd.Timestamp('2024-02-12')
+
+
+def test_chunks_must_have_same_columns():
+    columns = {key: j for j, key in enumerate(DATA.columns)}
+    timeframe = TimeframeBars('1h')
+    timeframe.start_chunk(DATA.index[:4], DATA.to_numpy()[:4], columns, following=DATA.index[4])
+    with pytest.raises(ValueError):
+        timeframe.start_chunk(DATA.index[4:8], DATA.to_numpy()[4:8, :3], dict(list(columns.items())[:3]))
@@ -0,0 +1,89 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from athena import Backtest, Strategy, WeightBacktest
+from athena.vectorized import _equity_after_commission
+
+CASH = 1_000_000
+BUFFER = 0.99  # order_target_percent 按总资产的99%计算目标价值
+
+
+def monthly_weights(prices, factors, short=True):
+    '''每21根bar调仓: 市值最大的10只做多, 最小的10只做空'''
+    mv = factors.xs('total_mv', axis=1, level=1)
+    weights = pd.DataFrame(np.nan, index=prices.index, columns=mv.columns)
+    for date in prices.index[::21]:
+        ranked = mv.loc[date].dropna()
+        ranked = ranked[ranked != 0].sort_values()
+        weights.loc[date] = 0.0
+        weights.loc[date, ranked.index[-10:]] = 0.04 * BUFFER
+        if short:
+            weights.loc[date, ranked.index[:10]] = -0.04 * BUFFER
+    return weights
+
+
+def weight_strategy(weights):
+    dates = set(weights.dropna(how='all').index)
+
+    class FollowWeights(Strategy):
+        '''按同一份目标权重逐笔调仓'''
+        def init(self):
+            pass
+
+        def next(self, i, record):
+            if self.date not in dates:
+                return
+            target = weights.loc[self.date]
+            longs, shorts = self.broker.current_position_status()
+            # Broker按仓位价值(以开仓价计)调整空头, 与按股数计算的权重回测不同, 空头每次调仓时重新开仓
+            for symbol in longs + shorts:
+                if target[symbol] == 0 or (target[symbol] > 0) == (symbol in shorts) or symbol in shorts:
+                    self.close(symbol=symbol, price=record[(symbol, 'Close')])
+            # 先减仓再加仓, 避免资金不足
+            held = {p.symbol: float(p.current_value) for p in self.broker.open_positions}
+            total = float(self.broker.cash + self.broker.assets_value)
+            orders = sorted(target[target != 0].items(), key=lambda kv: abs(kv[1]) * total - held.get(kv[0], 0))
+            for symbol, weight in orders:
+                self.order_target_percent(symbol, abs(weight) / BUFFER, record[(symbol, 'Close')], short=weight < 0)
+    return FollowWeights
+
+
+@pytest.mark.parametrize('short, commission', [(False, 0.0), (False, 0.001), (True, 0.0)])
+def test_weight_backtest_matches_event_backtest(prices, factors, short, commission):
+    weights = monthly_weights(prices, factors, short)
+    with contextlib.redirect_stdout(io.StringIO()):
+        event = Backtest(weight_strategy(weights), prices, cash=CASH, commission=commission, verbosity='off').run()
+    vector = WeightBacktest(prices, weights, cash=CASH, commission=commission).run()
+
+    assert vector.returns.index.equals(event.returns.index)
+    # Broker按精度截断数量并逐笔成交, 两者只有很小的差异
+    assert (vector.returns / event.returns - 1).abs().max() < 1.5e-3
+    # Broker的多/空头收益不扣除开仓手续费
+    assert (vector.long_returns - event.long_returns).abs().max() < 2e-3 * CASH
+    assert (vector.short_returns - event.short_returns).abs().max() < 2e-3 * CASH
+
+    # 第一根bar全部按收盘价开仓, 资产的减少就是开仓手续费
+    assert vector.commission.iloc[0] == pytest.approx(CASH - event.returns.iloc[0], rel=1e-3, abs=1e-9)
+
+
+def test_equity_after_commission_solves_the_equation():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        n = rng.integers(1, 50)
+        weights = rng.normal(size=n) * rng.integers(0, 2, size=n)
+        weights /= max(np.abs(weights).sum(), 1.0)
+        current = rng.normal(size=n) * 1e4 * rng.integers(0, 2, size=n)
+        equity = 1e5 + rng.random() * 1e5
+        commission = rng.choice([1e-4, 1e-3, 3e-2])
+
+        x = _equity_after_commission(equity, weights, current, commission)
+        assert x == pytest.approx(equity - commission * np.abs(weights * x - current).sum(), rel=1e-12, abs=1e-6)
+
+
+def test_equity_after_commission_without_weights():
+    current = np.array([100.0, -50.0])
+    assert _equity_after_commission(1000.0, np.zeros(2), current, 0.01) == pytest.approx(998.5)